@@ -0,0 +1,40 @@
+"""Shared fixtures for the benchmark suite"""
+
+from __future__ import unicode_literals
+
+import io
+import os
+
+import pytest
+
+from mediafire.api import MediaFireApi
+from mediafire.client import MediaFireClient
+from mediafire.standin import StandInServer
+
+
+def _random_file(size):
+    """Return BytesIO with size random bytes"""
+    return io.BytesIO(os.urandom(size))
+
+
+@pytest.fixture
+def random_file():
+    """Factory of in-memory files with random content"""
+    return _random_file
+
+
+@pytest.fixture(scope='module')
+def standin():
+    """Running StandInServer without latency or bandwidth limits"""
+    server = StandInServer(seed=1).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope='module')
+def client(standin):  # pylint: disable=redefined-outer-name
+    """MediaFireClient logged in to the stand-in"""
+    result = MediaFireClient(api=MediaFireApi(api_base=standin.url))
+    result.login(email=standin.email, password=standin.password,
+                 app_id=standin.app_id)
+    return result
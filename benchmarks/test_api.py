@@ -0,0 +1,95 @@
+"""MediaFireApi request preparation and response parsing benchmarks"""
+# pylint: disable=protected-access
+
+from __future__ import unicode_literals
+
+import json
+
+import requests
+
+from mediafire.api import MediaFireApi, QueryParams
+
+URI = '/api/1.3/folder/get_content.php'
+
+
+def _session_api():
+    """Return MediaFireApi with a fake session, so queries are signed"""
+    api = MediaFireApi()
+    api.session = {
+        'session_token': 'a' * 144,
+        'secret_key': '1234567890',
+        'time': '1234567890.1234'
+    }
+    return api
+
+
+def _response(payload, content_type='application/json'):
+    """Build requests.Response with the JSON payload"""
+    response = requests.Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = content_type
+    response._content = json.dumps(payload).encode('utf-8')
+    return response
+
+
+def test_build_query_unsigned(benchmark):
+    """_build_query without a session"""
+    api = MediaFireApi()
+
+    def build():
+        """Build query for a typical listing call"""
+        return api._build_query(URI, QueryParams({
+            'folder_key': 'abcdefghijklm',
+            'content_type': 'files',
+            'chunk': 1
+        }))
+
+    assert 'signature' not in benchmark(build)
+
+
+def test_build_query_signed(benchmark):
+    """_build_query with signature and secret key regeneration state"""
+    api = _session_api()
+
+    def build():
+        """Build query for a typical listing call"""
+        return api._build_query(URI, QueryParams({
+            'folder_key': 'abcdefghijklm',
+            'content_type': 'files',
+            'chunk': 1
+        }))
+
+    assert 'signature=' in benchmark(build)
+
+
+def test_process_response_small(benchmark):
+    """_process_response of a short reply"""
+    api = MediaFireApi()
+    response = _response({'response': {
+        'action': 'user/get_info', 'result': 'Success',
+        'user_info': {'email': 'user@example.com'}
+    }})
+
+    assert benchmark(api._process_response, response)['result'] == 'Success'
+
+
+def test_process_response_listing(benchmark):
+    """_process_response of a full folder/get_content chunk"""
+    api = MediaFireApi()
+    files = [{
+        'quickkey': 'q{:014d}'.format(i),
+        'filename': 'file-{}.bin'.format(i),
+        'hash': '0' * 64,
+        'size': str(i),
+        'created': '2015-01-01 00:00:00',
+        'revision': '1'
+    } for i in range(100)]
+    response = _response({'response': {
+        'action': 'folder/get_content', 'result': 'Success',
+        'folder_content': {'chunk_number': '1', 'more_chunks': 'no',
+                           'content_type': 'files', 'files': files}
+    }})
+
+    result = benchmark(api._process_response, response)
+
+    assert len(result['folder_content']['files']) == 100
@@ -0,0 +1,83 @@
+"""Client benchmarks against a local StandInServer"""
+
+from __future__ import unicode_literals
+
+import io
+import itertools
+
+import pytest
+
+from mediafire.uploader import MEBIBYTE
+
+
+@pytest.fixture(scope='module')
+def deep_tree(client):
+    """Create /deep/1/2/.../9 with 50 files in the leaf"""
+    path = 'mf:///deep/' + '/'.join(str(i) for i in range(1, 10))
+    client.create_folder(path, recursive=True)
+    for i in range(50):
+        client.upload_file(io.BytesIO(b'x' * (i + 1)),
+                           path + '/file-{}.txt'.format(i))
+    return path
+
+
+def _count_calls(standin, func, *args):
+    """Return number of API calls made by func(*args)"""
+    before = sum(standin.calls.values())
+    func(*args)
+    return sum(standin.calls.values()) - before
+
+
+@pytest.mark.parametrize('depth', [1, 5, 10])
+def test_resolve_path(benchmark, standin, client, deep_tree, depth):
+    """get_resource_by_uri by depth, API calls per lookup in extra_info"""
+    components = deep_tree.split('/')[3:]
+    if depth == 10:
+        uri = deep_tree + '/file-49.txt'
+    else:
+        uri = 'mf:///' + '/'.join(components[:depth])
+
+    benchmark.extra_info['api_calls'] = _count_calls(
+        standin, client.get_resource_by_uri, uri)
+
+    benchmark(client.get_resource_by_uri, uri)
+
+
+@pytest.mark.parametrize('size', [MEBIBYTE, 16 * MEBIBYTE])
+# pylint: disable=too-many-arguments
+def test_upload(benchmark, standin, client, random_file, size):
+    """upload_file of new content, simple or resumable by size"""
+    client.create_folder('mf:///upload', recursive=True)
+    benchmark.extra_info['bytes'] = size
+    counter = itertools.count()
+
+    def setup():
+        """Fresh content, so instant upload never kicks in"""
+        uri = 'mf:///upload/{}-{}.bin'.format(size, next(counter))
+        return (random_file(size), uri), {}
+
+    calls = dict(standin.calls)
+    benchmark.pedantic(client.upload_file, setup=setup, rounds=5)
+
+    benchmark.extra_info['api_calls'] = dict(
+        (action, count - calls.get(action, 0))
+        for action, count in standin.calls.items()
+        if count != calls.get(action, 0))
+# pylint: enable=too-many-arguments
+
+
+@pytest.mark.parametrize('size', [MEBIBYTE, 16 * MEBIBYTE])
+def test_download(benchmark, client, random_file, size):
+    """download_file into memory"""
+    uri = 'mf:///download/{}.bin'.format(size)
+    client.create_folder('mf:///download', recursive=True)
+    client.upload_file(random_file(size), uri)
+    benchmark.extra_info['bytes'] = size
+
+    def download():
+        """Download the whole file"""
+        target = io.BytesIO()
+        client.download_file(uri, target)
+        return target.tell()
+
+    assert benchmark.pedantic(download, rounds=5) == size
@@ -0,0 +1,65 @@
+"""Upload benchmarks under injected latency and faults"""
+
+from __future__ import unicode_literals
+
+import itertools
+
+import pytest
+
+from mediafire import api, client as mf_client, faults
+from mediafire.uploader import (MEBIBYTE, UploadError)
+
+# FaultInjector options per condition, seeded for repeatable runs
+CONDITIONS = {
+    'clean': {},
+    'latency': {'latency': 0.01, 'jitter': 0.02},
+    'drops': {'drop_rate': 0.05},
+    'errors': {'error_rate': 0.02},
+    'new_key': {'new_key_rate': 0.05}
+}
+
+# Files uploaded per round: one resumable, several simple
+WORKLOAD = [6 * MEBIBYTE] + [64 * 1024] * 5
+
+UPLOAD_ERRORS = (UploadError, api.MediaFireError, mf_client.MediaFireError)
+
+
+@pytest.fixture
+def fresh_client(standin):
+    """MediaFireClient with a session of its own, faults may break it"""
+    result = mf_client.MediaFireClient(
+        api=api.MediaFireApi(api_base=standin.url))
+    result.login(email=standin.email, password=standin.password,
+                 app_id=standin.app_id)
+    result.create_folder('mf:///faults', recursive=True)
+    return result
+
+
+@pytest.mark.parametrize('condition', sorted(CONDITIONS))
+def test_upload(benchmark, fresh_client, random_file, condition):
+    """Time to upload WORKLOAD, failures and wasted bytes in extra_info"""
+    counter = itertools.count()
+    failures = []
+
+    def setup():
+        """Fresh content, so instant upload never kicks in"""
+        files = [(random_file(size),
+                  'mf:///faults/{}-{}.bin'.format(condition, next(counter)))
+                 for size in WORKLOAD]
+        return (files,), {}
+
+    def upload(files):
+        """Upload files, count failures"""
+        for fd, uri in files:
+            try:
+                fresh_client.upload_file(fd, uri)
+            except UPLOAD_ERRORS:
+                failures.append(uri)
+
+    with faults.inject(fresh_client.api, seed=1,
+                       **CONDITIONS[condition]) as injector:
+        benchmark.pedantic(upload, setup=setup, rounds=3)
+
+    benchmark.extra_info.update(injector.summary())
+    benchmark.extra_info['bytes'] = sum(WORKLOAD)
+    benchmark.extra_info['failures'] = len(failures)
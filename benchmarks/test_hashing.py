@@ -0,0 +1,50 @@
+"""Hashing and unit I/O benchmarks"""
+
+from __future__ import unicode_literals
+
+import pytest
+
+from mediafire.subsetio import SubsetIO
+from mediafire.uploader import (compute_hash_info,
+                                decode_resumable_upload_bitmap, MEBIBYTE)
+from mediafire.standin import encode_bitmap
+
+
+@pytest.mark.parametrize('unit_size', [None, MEBIBYTE, 4 * MEBIBYTE])
+@pytest.mark.parametrize('file_size', [MEBIBYTE, 16 * MEBIBYTE])
+def test_compute_hash_info(benchmark, random_file, file_size, unit_size):
+    """compute_hash_info over in-memory files"""
+    fd = random_file(file_size)
+    benchmark.extra_info['bytes'] = file_size
+
+    result = benchmark(compute_hash_info, fd, unit_size=unit_size)
+
+    assert result.size == file_size
+
+
+@pytest.mark.parametrize('chunk_size', [8192, 65536, MEBIBYTE])
+def test_subsetio_read(benchmark, random_file, chunk_size):
+    """SubsetIO read throughput of one 4MiB unit"""
+    fd = random_file(8 * MEBIBYTE)
+    benchmark.extra_info['bytes'] = 4 * MEBIBYTE
+
+    def read_unit():
+        """Read the second unit to the end"""
+        unit = SubsetIO(fd, 4 * MEBIBYTE, 4 * MEBIBYTE)
+        total = 0
+        for chunk in iter(lambda: unit.read(chunk_size), b''):
+            total += len(chunk)
+        return total
+
+    assert benchmark(read_unit) == 4 * MEBIBYTE
+
+
+@pytest.mark.parametrize('number_of_units', [100, 1000, 10000])
+def test_decode_bitmap(benchmark, number_of_units):
+    """decode_resumable_upload_bitmap with every other unit present"""
+    bitmap = encode_bitmap(range(0, number_of_units, 2))
+
+    result = benchmark(decode_resumable_upload_bitmap, bitmap,
+                       number_of_units)
+
+    assert len(result) == number_of_units
@@ -5,6 +5,10 @@ from __future__ import unicode_literals
 import hashlib
 import requests
 import logging
+import threading
+import time
+
+from contextlib import contextmanager
 
 import six
 
@@ -12,8 +16,20 @@ from six.moves.urllib.parse import urlencode
 
 from requests_toolbelt import MultipartEncoder
 
-from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
+from requests.utils import super_len
+
+from mediafire import (deadline, tracing)
+from mediafire.bandwidth import ThrottledReader
+from mediafire.instrumentation import (RequestStats, TimingAdapter,
+                                       collecting, notify)
+from mediafire.retry import (RetryPolicy, was_request_sent)
+# Moved to mediafire.retry, re-exported for existing imports
+# pylint: disable=unused-import
+from mediafire.retry import (RetryBudget, API_ERROR_MAX_RETRIES,
+                             DEFAULT_RETRY_BUDGET, IDEMPOTENT_ACTIONS,
+                             RETRIABLE_ERROR_CODES)
+# pylint: enable=unused-import
 
 API_BASE = 'https://www.mediafire.com'
 API_VER = '1.3'
@@ -21,8 +37,8 @@ API_VER = '1.3'
 UPLOAD_MIMETYPE = 'application/octet-stream'
 FORM_MIMETYPE = 'application/x-www-form-urlencoded'
 
-# Retries on connection errors/timeouts
-API_ERROR_MAX_RETRIES = 5
+# Default (connect, read) timeouts of API requests, in seconds
+API_TIMEOUT = (10, 60)
 
 logger = logging.getLogger(__name__)
 
@@ -73,35 +89,89 @@ class MediaFireApiError(MediaFireError):
 
 class MediaFireConnectionError(MediaFireError):
     """Low level connection errors"""
-    pass
+    def __init__(self, message, request_sent=True):
+        """Initialize exception
+
+        message -- error message
+        request_sent -- False if the request never reached the server,
+                        e.g. the connection was refused
+        """
+        self.request_sent = request_sent
+        super(MediaFireConnectionError, self).__init__(message)
 
 
 class MediaFireApi(object):  # pylint: disable=too-many-public-methods
     """Low-level HTTP API Client"""
 
-    def __init__(self):
-        """Initialize MediaFire Client"""
+    def __init__(self, upload_limiter=None, download_limiter=None,
+                 api_base=API_BASE, observers=None, timeout=API_TIMEOUT,
+                 retry_policy=None):
+        """Initialize MediaFire Client
+
+        upload_limiter -- BandwidthLimiter for upload request bodies
+        download_limiter -- BandwidthLimiter for file downloads
+        api_base -- scheme and host of the API, e.g. a local stand-in
+        observers -- list of RequestObserver, see mediafire.instrumentation
+        timeout -- requests timeout, seconds or (connect, read) tuple,
+                   None to wait forever, see also mediafire.deadline
+        retry_policy -- RetryPolicy for failed calls and downloads,
+                        RetryPolicy() if None
+        """
+        self.api_base = api_base
+        self.timeout = timeout
+        self.retry_policy = retry_policy if retry_policy is not None \
+            else RetryPolicy()
 
         self.http = requests.Session()
-        self.http.mount('https://',
-                        HTTPAdapter(max_retries=API_ERROR_MAX_RETRIES))
+        # TimingAdapter reports connection timings to RequestStats,
+        # retries are up to retry_policy, not to urllib3
+        for prefix in ('https://', 'http://'):
+            self.http.mount(prefix, TimingAdapter(max_retries=0))
+
+        self.observers = list(observers or [])
 
         self._session = None
         self._action_tokens = {}
 
+        # Action tokens shared by action_token() users, by type
+        self._token_leases = {}
+        self._token_lock = threading.Lock()
+
+        # Signature state is shared when the client is used from threads,
+        # held by signed calls until their response is processed
+        self._session_lock = threading.RLock()
+
+        # May be shared by several clients, see mediafire.bandwidth
+        self.upload_limiter = upload_limiter
+        self.download_limiter = download_limiter
+
     @staticmethod
     def _build_uri(action):
         """Build endpoint URI from action"""
         return '/api/' + API_VER + '/' + action + '.php'
 
-    def _build_query(self, uri, params=None, action_token_type=None):
-        """Prepare query string"""
+    def _build_query(self, uri, params=None, action_token_type=None,
+                     stats=None):
+        """Prepare query string, add queue and sign timings to stats"""
 
         if params is None:
             params = QueryParams()
 
         params['response_format'] = 'json'
 
+        started = time.time()
+        with self._session_lock:
+            signing = time.time()
+            try:
+                return self._sign_query(uri, params, action_token_type)
+            finally:
+                if stats is not None:
+                    stats.timings['queue'] += signing - started
+                    stats.timings['sign'] += time.time() - signing
+
+    def _sign_query(self, uri, params, action_token_type):
+        """Add session_token and signature to params, return query string"""
+
         session_token = None
 
         if action_token_type in self._action_tokens:
@@ -143,15 +213,74 @@ class MediaFireApi(object):  # pylint: disable=too-many-public-methods
         upload_info -- in case of upload, dict of "fd" and "filename"
         headers -- additional headers to send (used for upload)
 
-        session_token and signature generation/update is handled automatically
-        """
+        session_token and signature generation/update is handled automatically,
+        calls signed with the session secret key are sent one at a time
+        since any response may rotate the key
+
+        Observers are notified before and after the call with RequestStats,
+        the call is traced as a span named after the action.
+
+        The current mediafire.deadline.Deadline limits the timeout, calls
+        made after it has passed raise DeadlineExceeded.
+        """
+
+        stats = RequestStats(action)
+        notify(self.observers, 'request_started', stats)
+
+        with tracing.span(action) as span:
+            try:
+                if upload_info is not None:
+                    # file bodies are retried by the uploader
+                    return self._request(action, params, action_token_type,
+                                         upload_info, headers, stats)
+                return self.retry_policy.call(
+                    lambda: self._request(action, params, action_token_type,
+                                          upload_info, headers, stats),
+                    action)
+            except (MediaFireError, deadline.DeadlineExceeded) as ex:
+                stats.error = ex
+                stats.error_code = getattr(ex, 'code', None)
+                raise
+            finally:
+                stats.finish()
+                notify(self.observers, 'request_finished', stats)
+
+                if span.is_recording():
+                    span.set_attributes(stats.attributes())
+
+    def _is_signed(self, action_token_type):
+        """Check whether a call is signed with the session secret key"""
+        return bool(self._session) and \
+            action_token_type not in self._action_tokens
+
+    def _request(self, action, params, action_token_type, upload_info,
+                 headers, stats):
+        """Build, send and process the request, see request()"""
+
+        if isinstance(params, six.text_type) or \
+                not self._is_signed(action_token_type):
+            return self._exchange(action, params, action_token_type,
+                                  upload_info, headers, stats)
+
+        # Any response may rotate the secret key (new_key), so signed calls
+        # run one at a time from signing until the key is updated
+        started = time.time()
+        with self._session_lock:
+            stats.timings['queue'] += time.time() - started
+            return self._exchange(action, params, action_token_type,
+                                  upload_info, headers, stats)
+
+    def _exchange(self, action, params, action_token_type, upload_info,
+                  headers, stats):
+        """Sign, send and process the request, see request()"""
 
         uri = self._build_uri(action)
 
         if isinstance(params, six.text_type):
             query = params
         else:
-            query = self._build_query(uri, params, action_token_type)
+            query = self._build_query(uri, params, action_token_type,
+                                      stats=stats)
 
         if headers is None:
             headers = {}
@@ -177,24 +306,50 @@ class MediaFireApi(object):  # pylint: disable=too-many-public-methods
                 data = upload_info["fd"]
                 headers["Content-Type"] = UPLOAD_MIMETYPE
 
+            if self.upload_limiter is not None:
+                data = ThrottledReader(data, self.upload_limiter)
+
         logger.debug("uri=%s query=%s",
                      uri, query if not upload_info else None)
 
+        deadline.check()
+        timeout = deadline.request_timeout(self.timeout)
+
         try:
             # bytes from now on
-            url = (API_BASE + uri).encode('utf-8')
+            url = (self.api_base + uri).encode('utf-8')
             if isinstance(data, six.text_type):
                 # request's data is bytes, dict, or filehandle
                 data = data.encode('utf-8')
 
-            response = self.http.post(url, data=data,
-                                      headers=headers, stream=True)
+            stats.bytes_out = super_len(data)
+
+            with collecting(stats):
+                response = self.http.post(url, data=data, headers=headers,
+                                          stream=True, timeout=timeout)
         except RequestException as ex:
+            if deadline.expired():
+                raise deadline.DeadlineExceeded(
+                    "Deadline exceeded during {}".format(action))
             logger.exception("HTTP request failed")
             raise MediaFireConnectionError(
-                "RequestException: {}".format(ex))
+                "RequestException: {}".format(ex),
+                request_sent=was_request_sent(ex))
+
+        stats.status_code = response.status_code
 
-        return self._process_response(response)
+        started = time.time()
+        try:
+            return self._process_response(response)
+        finally:
+            stats.timings['decode'] += time.time() - started
+
+            if response._content_consumed:  # pylint: disable=protected-access
+                stats.bytes_in = len(response.content)
+            else:
+                # forwarded unread, body size is only known from headers
+                stats.bytes_in = int(
+                    response.headers.get('Content-Length', 0))
 
     def _process_response(self, response):
         """Parse response"""
@@ -242,10 +397,11 @@ class MediaFireApi(object):  # pylint: disable=too-many-public-methods
 
         http://www.mediafire.com/developers/core_api/1.3/getting_started/#call_signature
         """
-        # Don't regenerate the key if we have none
-        if self._session and 'secret_key' in self._session:
-            self._session['secret_key'] = (
-                int(self._session['secret_key']) * 16807) % 2147483647
+        with self._session_lock:
+            # Don't regenerate the key if we have none
+            if self._session and 'secret_key' in self._session:
+                self._session['secret_key'] = (
+                    int(self._session['secret_key']) * 16807) % 2147483647
 
     @property
     def session(self):
@@ -297,6 +453,43 @@ class MediaFireApi(object):  # pylint: disable=too-many-public-methods
         else:
             self._action_tokens[type_] = action_token
 
+    @contextmanager
+    def action_token(self, type_, lifespan=None):
+        """Use an action token for calls of type_ while active, yield it
+
+        Calls made with an action token are not signed, so they are not
+        sent one at a time, see request(). Concurrent users share the
+        token, the last one destroys it and restores the previous token.
+        Yields None without a session, when nothing is signed anyway.
+        """
+        with self._token_lock:
+            lease = self._token_leases.get(type_)
+            if lease is None and self._session:
+                lease = self._token_leases[type_] = {
+                    'token': self.user_get_action_token(
+                        type_=type_, lifespan=lifespan)['action_token'],
+                    'previous': self._action_tokens.get(type_), 'users': 0}
+                self._action_tokens[type_] = lease['token']
+            if lease is not None:
+                lease['users'] += 1
+
+        if lease is None:
+            yield
+            return
+        try:
+            yield lease['token']
+        finally:
+            with self._token_lock:
+                lease['users'] -= 1
+                if not lease['users']:
+                    del self._token_leases[type_]
+                    self._action_tokens.pop(type_, None)
+                    if lease['previous'] is not None:
+                        self._action_tokens[type_] = lease['previous']
+
+            if not lease['users']:
+                self.user_destroy_action_token(action_token=lease['token'])
+
     def user_fetch_tos(self):
         """user/fetch_tos
 
@@ -479,7 +672,7 @@ class MediaFireApi(object):  # pylint: disable=too-many-public-methods
     def folder_get_content(self, folder_key=None, content_type=None,
                            filter_=None, device_id=None, order_by=None,
                            order_direction=None, chunk=None, details=None,
-                           chunk_size=None):
+                           chunk_size=None, action_token_type=None):
         """folder/get_content
 
         http://www.mediafire.com/developers/core_api/1.3/folder/#get_content
@@ -494,7 +687,23 @@ class MediaFireApi(object):  # pylint: disable=too-many-public-methods
             'chunk': chunk,
             'details': details,
             'chunk_size': chunk_size
-        }))
+        }), action_token_type=action_token_type)
+
+    def folder_search(self, search_text, folder_key=None, filter_=None,
+                      device_id=None, search_all=None, details=None,
+                      action_token_type=None):
+        """folder/search
+
+        http://www.mediafire.com/developers/core_api/1.3/folder/#search
+        """
+        return self.request('folder/search', QueryParams({
+            'search_text': search_text,
+            'folder_key': folder_key,
+            'filter': filter_,
+            'device_id': device_id,
+            'search_all': search_all,
+            'details': details
+        }), action_token_type=action_token_type)
 
     def folder_update(self, folder_key, foldername=None, description=None,
                       privacy=None, privacy_recursive=None, mtime=None):
@@ -566,7 +775,7 @@ class MediaFireApi(object):  # pylint: disable=too-many-public-methods
             'hash': hash_,
             'path': path,
             'resumable': resumable
-        }))
+        }), action_token_type="upload")
 
     def upload_simple(self, fd, filename, folder_key=None, path=None,
                       filedrop_key=None, action_on_duplicate=None,
@@ -658,7 +867,7 @@ class MediaFireApi(object):  # pylint: disable=too-many-public-methods
             'mtime': mtime,
             'version_control': version_control,
             'previous_hash': previous_hash
-        }))
+        }), action_token_type="upload")
 
     def upload_poll(self, key):
         """upload/poll
@@ -667,7 +876,7 @@ class MediaFireApi(object):  # pylint: disable=too-many-public-methods
         """
         return self.request('upload/poll_upload', QueryParams({
             'key': key
-        }))
+        }), action_token_type="upload")
 
     def file_get_info(self, quick_key=None):
         """file/get_info
@@ -758,6 +967,23 @@ class MediaFireApi(object):  # pylint: disable=too-many-public-methods
             'meta_only': meta_only
         }))
 
+    def device_get_status(self):
+        """device/get_status
+
+        http://www.mediafire.com/developers/core_api/1.3/device/#get_status
+        """
+        return self.request('device/get_status')
+
+    def device_get_changes(self, revision=None, device_id=None):
+        """device/get_changes
+
+        http://www.mediafire.com/developers/core_api/1.3/device/#get_changes
+        """
+        return self.request('device/get_changes', QueryParams({
+            'revision': revision,
+            'device_id': device_id
+        }))
+
     def system_get_info(self):
         """system/get_info
 
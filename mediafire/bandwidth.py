@@ -0,0 +1,114 @@
+"""Token bucket bandwidth limiting for uploads and downloads"""
+
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from requests.utils import super_len
+
+# Smallest bucket, so that a single read never exceeds the capacity
+BURST_MIN_BYTES = 64 * 1024
+
+
+class BandwidthLimiter(object):
+    """Token bucket shared by any number of streams and threads
+
+    Tokens (bytes) are added at rate bytes per second up to burst bytes.
+    consume() blocks until enough tokens are available, so the combined
+    throughput of all streams using the limiter stays at rate on average.
+    The rate can be changed at any time, waiting streams pick up the new
+    rate immediately.
+
+    Example:
+
+        uplink = BandwidthLimiter(rate=2 * 1024 * 1024)
+        api = MediaFireApi(upload_limiter=uplink)
+        ...
+        uplink.set_rate(None)  # off-peak, no limit
+    """
+
+    def __init__(self, rate=None, burst=None):
+        """Initialize BandwidthLimiter
+
+        rate -- bytes per second, None for no limit
+        burst -- bucket capacity in bytes, defaults to one second of rate
+        """
+        self._cond = threading.Condition()
+        self._tokens = 0
+        self._updated = time.time()
+        self.rate = None
+        self.burst = None
+
+        self.set_rate(rate, burst)
+
+    def _refill(self):
+        """Add tokens accumulated since the last update"""
+        now = time.time()
+        if self.rate:
+            self._tokens = min(self._tokens + (now - self._updated) * self.rate,
+                               self.burst)
+        self._updated = now
+
+    def set_rate(self, rate, burst=None):
+        """Change the rate
+
+        rate -- bytes per second, None for no limit
+        burst -- bucket capacity in bytes, defaults to one second of rate
+        """
+        with self._cond:
+            self._refill()
+            self.rate = rate
+            self.burst = max(burst or rate or 0, BURST_MIN_BYTES)
+            self._tokens = min(self._tokens, self.burst)
+            self._cond.notify_all()
+
+    def consume(self, amount):
+        """Wait until amount bytes may be transferred"""
+        while amount > 0:
+            with self._cond:
+                if not self.rate:
+                    return
+
+                self._refill()
+
+                # amounts over the capacity are paid in parts
+                part = min(amount, self.burst)
+                if self._tokens >= part:
+                    self._tokens -= part
+                    amount -= part
+                else:
+                    self._cond.wait((part - self._tokens) / self.rate)
+
+
+class ThrottledReader(object):  # pylint: disable=too-few-public-methods
+    """File-like request body reading from fd at the limiter rate"""
+
+    def __init__(self, fd, limiter):
+        """Initialize ThrottledReader
+
+        fd -- file-like object, e.g. SubsetIO or MultipartEncoder
+        limiter -- BandwidthLimiter instance
+        """
+        self._fd = fd
+        self._limiter = limiter
+        # bytes left to read, makes requests.utils.super_len() work
+        self.len = super_len(fd)
+
+    def read(self, size=-1):
+        """Read up to size bytes, see file.read"""
+        data = self._fd.read(size)
+        self._limiter.consume(len(data))
+        return data
+
+
+def throttle_iter(chunks, limiter):
+    """Yield chunks of a download at the limiter rate
+
+    chunks -- iterable of bytes, e.g. response.iter_content()
+    limiter -- BandwidthLimiter instance or None for no limit
+    """
+    for chunk in chunks:
+        if limiter is not None:
+            limiter.consume(len(chunk))
+        yield chunk
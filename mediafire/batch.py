@@ -0,0 +1,420 @@
+"""Concurrent batch uploads on top of MediaFireUploader"""
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import posixpath
+import time
+
+from collections import namedtuple
+from threading import (Lock, Semaphore)
+
+from concurrent.futures import (Future, ThreadPoolExecutor)
+
+from six.moves import queue
+
+from mediafire.poller import UploadPoller
+from mediafire.uploader import (MediaFireUploader, UploadSession,
+                                RetriableUploadError, UploadStats,
+                                compute_hash_info, UPLOAD_RETRY_COUNT)
+
+# Files hashed concurrently (disk and CPU bound)
+HASH_WORKERS = 2
+
+# Files transferred concurrently (network bound)
+UPLOAD_WORKERS = 4
+
+logger = logging.getLogger(__name__)
+
+BatchUploadResult = namedtuple('BatchUploadResult', [
+    'source',
+    'dest_uri',
+    # UploadResult on success, None otherwise
+    'result',
+    # exception on failure, None otherwise
+    'error'
+])
+
+
+# pylint: disable=too-few-public-methods
+class _BatchItem(object):
+    """Batch upload item being processed"""
+
+    def __init__(self, source, dest_uri):
+        self.source = source
+        self.dest_uri = dest_uri
+        self.fd = None
+        # destination and hash, set once prepared
+        self.name = None
+        self.folder_key = None
+        self.hash_info = None
+        self.stats = None
+        # hash-ahead slot, held from hashing until the transfer starts
+        self.slot = None
+        self.retries = UPLOAD_RETRY_COUNT
+
+    def open(self):
+        """Open the source unless it is a file-like object already"""
+        if hasattr(self.source, 'read'):
+            self.fd = self.source
+        else:
+            self.fd = open(self.source, 'rb')
+        return self.fd
+
+    def release_slot(self):
+        """Let the next file be hashed"""
+        if self.slot is not None:
+            self.slot.release()
+            self.slot = None
+
+    def close(self):
+        """Close file we have opened"""
+        self.release_slot()
+        if self.fd is not None and not hasattr(self.source, 'read'):
+            self.fd.close()
+        self.fd = None
+
+
+class _BatchRun(object):
+    """State of one BatchUploader.upload() call"""
+
+    def __init__(self, hash_ahead, poller=None):
+        # hash-ahead slots, see _BatchItem.slot
+        self.hash_slots = Semaphore(hash_ahead)
+        # UploadPoller to hand upload keys over to, None to poll inline
+        self.poller = poller
+# pylint: enable=too-few-public-methods
+
+
+class BatchUploader(object):
+    """Upload many files concurrently
+
+    Hashing and transfers run on separate bounded thread pools, so the
+    next files are hashed while earlier ones are being transferred and
+    polled, up to hash_ahead files ahead. One upload
+    action token is shared by all transfers and every destination folder
+    is resolved only once per batch. Sources with the same content are
+    sent once, the copies are created with upload/instant.
+
+    Example:
+
+        batch = BatchUploader(client)
+        for item in batch.upload([('/tmp/a.txt', 'mf:///Inbox/'),
+                                  ('/tmp/b.txt', 'mf:///Inbox/c.txt')]):
+            if item.error:
+                print(item.source, item.error)
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, client, hash_workers=HASH_WORKERS,
+                 upload_workers=UPLOAD_WORKERS, action_on_duplicate='replace',
+                 create_folders=False, coalesce_duplicates=True,
+                 hash_ahead=None, multiplex_polling=True, fast_path=False,
+                 collect_stats=False):
+        """Initialize BatchUploader
+
+        client -- MediaFireClient instance
+        hash_workers -- number of files hashed concurrently
+        upload_workers -- number of files transferred concurrently
+        hash_ahead -- number of files hashed ahead of the transfers,
+                      defaults to upload_workers
+        multiplex_polling -- poll all uploads from one UploadPoller
+                             thread, freeing transfer workers as soon
+                             as the data is sent
+        action_on_duplicate -- skip, keep, replace
+        create_folders -- create missing destination folders
+        coalesce_duplicates -- upload identical content once and place
+                               the other copies with upload/instant
+        fast_path -- skip upload/check for small files, see
+                     MediaFireUploader
+        collect_stats -- attach UploadStats to every UploadResult
+        """
+        self._client = client
+        self._uploader = MediaFireUploader(client.api, fast_path=fast_path,
+                                           collect_stats=collect_stats)
+
+        self.hash_workers = hash_workers
+        self.hash_ahead = hash_ahead or upload_workers
+        self.upload_workers = upload_workers
+        self.action_on_duplicate = action_on_duplicate
+        self.create_folders = create_folders
+        self.coalesce_duplicates = coalesce_duplicates
+        self.multiplex_polling = multiplex_polling
+
+        # folder URI -> folderkey, and URIs known not to exist
+        self._folder_keys = {}
+        self._missing_folders = set()
+        # guards the caches and _folder_uri_locks, lookups of one URI
+        # are serialized by its own lock
+        self._folder_lock = Lock()
+        self._folder_uri_locks = {}
+    # pylint: enable=too-many-arguments
+
+    @staticmethod
+    def _split_dest_uri(source, dest_uri):
+        """Split dest_uri into folder URI and file name
+
+        dest_uri ending with '/' refers to a folder, the name is taken
+        from the source path.
+        """
+        if dest_uri.endswith('/'):
+            if hasattr(source, 'read'):
+                raise ValueError("Cannot determine target file name")
+            folder_uri, name = dest_uri, os.path.basename(source)
+        else:
+            folder_uri, name = posixpath.split(dest_uri)
+
+        folder_uri = folder_uri.rstrip('/')
+        if folder_uri in ('', 'mf:'):
+            folder_uri = 'mf:///'
+
+        return folder_uri, name
+
+    def _resolve_folder(self, folder_uri):
+        """Return folder_key for folder_uri, resolving it once per batch"""
+        # Avoid circular import
+        from mediafire.client import (Folder, NotAFolderError,
+                                      ResourceNotFoundError)
+
+        with self._folder_lock:
+            uri_lock = self._folder_uri_locks.setdefault(folder_uri, Lock())
+
+        # other folders are resolved meanwhile
+        with uri_lock:
+            with self._folder_lock:
+                folder_key = self._folder_keys.get(folder_uri)
+                missing = folder_uri in self._missing_folders
+            if folder_key is not None:
+                return folder_key
+
+            folder = None
+            if not missing:
+                try:
+                    folder = self._client.get_resource_by_uri(folder_uri)
+                except ResourceNotFoundError:
+                    with self._folder_lock:
+                        self._missing_folders.add(folder_uri)
+
+            if folder is None:
+                if not self.create_folders:
+                    raise ResourceNotFoundError(folder_uri)
+                folder = self._client.create_folder(folder_uri,
+                                                    recursive=True)
+
+            if not isinstance(folder, Folder):
+                raise NotAFolderError(folder_uri)
+
+            with self._folder_lock:
+                self._folder_keys[folder_uri] = folder['folderkey']
+                self._missing_folders.discard(folder_uri)
+
+            return folder['folderkey']
+
+    def forget_missing_folders(self):
+        """Look folders up again that did not exist, they may exist now"""
+        with self._folder_lock:
+            self._missing_folders.clear()
+
+    def resolve_destination(self, source, dest_uri):
+        """Return (folder_key, name) of the file dest_uri refers to
+
+        source -- path or file-like object, names files uploaded to
+                  folder URIs ending with '/'
+        dest_uri -- target file URI, or folder URI ending with '/'
+
+        Folders are looked up once, missing ones are created if
+        create_folders is set.
+        """
+        folder_uri, name = self._split_dest_uri(source, dest_uri)
+        return self._resolve_folder(folder_uri), name
+
+    def _prepare(self, run, item):
+        """Resolve destination and hash the source"""
+        item.folder_key, item.name = self.resolve_destination(
+            item.source, item.dest_uri)
+
+        # don't run too far ahead of the transfers
+        item.slot = run.hash_slots
+        item.slot.acquire()
+
+        stats = UploadStats() if self._uploader.collect_stats else None
+
+        item.hash_info = compute_hash_info(item.open())
+
+        if stats is not None:
+            stats.hash_time = time.time() - stats.started
+        item.stats = stats
+
+        return item
+
+    def _transfer(self, run, item):
+        """Upload prepared item"""
+        item.release_slot()
+        if item.fd is None:
+            # retrying after the previous attempt has closed the file
+            item.open()
+        try:
+            return self._uploader.upload(
+                item.fd, name=item.name, folder_key=item.folder_key,
+                action_on_duplicate=self.action_on_duplicate,
+                hash_info=item.hash_info, poller=run.poller,
+                stats=item.stats)
+        finally:
+            item.close()
+
+    def _transfer_instant(self, run, item):  # pylint: disable=unused-argument
+        """Place a copy of already uploaded content"""
+        item.release_slot()
+        try:
+            return self._uploader.upload_instant(
+                name=item.name, hash_info=item.hash_info,
+                folder_key=item.folder_key,
+                action_on_duplicate=self.action_on_duplicate,
+                stats=item.stats)
+        finally:
+            item.close()
+
+    def _run(self, run, items, hash_pool, upload_pool):
+        """Feed items through the pools, yield BatchUploadResult"""
+        done = queue.Queue()
+
+        # digest -> list of items waiting for the first copy to upload
+        waiting = {}
+        # digests whose content is known to be stored in MediaFire
+        uploaded = set()
+        digest_lock = Lock()
+
+        def report(item, future):
+            """Queue item outcome"""
+            item.close()
+            error = future.exception()
+            result = None if error is not None else future.result()
+            done.put(BatchUploadResult(source=item.source,
+                                       dest_uri=item.dest_uri,
+                                       result=result, error=error))
+
+        def submit(func, item):
+            """Run func(item) on the transfer pool and report it"""
+            upload_pool.submit(func, run, item).add_done_callback(
+                lambda future: on_transferred(item, future))
+
+        def on_transferred(item, future):
+            """Report item, release copies waiting for its content"""
+            if future.exception() is None and \
+                    isinstance(future.result(), Future):
+                # data is sent, wait for the poller
+                future.result().add_done_callback(
+                    lambda poll_future: on_transferred(item, poll_future))
+                return
+
+            if isinstance(future.exception(), RetriableUploadError) and \
+                    item.retries > 0:
+                item.retries -= 1
+                logger.warning("%s failed to process, retrying (%d left)",
+                               item.source, item.retries)
+                submit(self._transfer, item)
+                return
+
+            if self.coalesce_duplicates:
+                digest = item.hash_info.file
+                leader = None
+                with digest_lock:
+                    followers = waiting.pop(digest, [])
+                    if future.exception() is None:
+                        uploaded.add(digest)
+                    elif followers:
+                        # next copy takes over as the one to upload
+                        leader = followers.pop(0)
+                        waiting[digest] = followers
+                        followers = []
+
+                if leader is not None:
+                    submit(self._transfer, leader)
+
+                for follower in followers:
+                    submit(self._transfer_instant, follower)
+
+            report(item, future)
+
+        def on_prepared(item, future):
+            """Hand hashed item over to the transfer pool"""
+            if future.exception() is not None:
+                report(item, future)
+                return
+
+            if not self.coalesce_duplicates:
+                submit(self._transfer, item)
+                return
+
+            digest = item.hash_info.file
+            with digest_lock:
+                if digest in uploaded:
+                    func = self._transfer_instant
+                elif digest in waiting:
+                    logger.debug("%s waits for identical content upload",
+                                 item.source)
+                    waiting[digest].append(item)
+                    return
+                else:
+                    waiting[digest] = []
+                    func = self._transfer
+
+            submit(func, item)
+
+        # keep every worker busy without reading the whole batch at once
+        max_in_flight = 2 * (self.hash_workers + self.upload_workers)
+        in_flight = 0
+        items = iter(items)
+        exhausted = False
+
+        while not exhausted or in_flight > 0:
+            while not exhausted and in_flight < max_in_flight:
+                try:
+                    source, dest_uri = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                item = _BatchItem(source, dest_uri)
+                hash_pool.submit(self._prepare, run,
+                                 item).add_done_callback(
+                    lambda future, item=item: on_prepared(item, future))
+                in_flight += 1
+
+            if in_flight > 0:
+                result = done.get()
+                in_flight -= 1
+
+                if result.error is not None:
+                    logger.error("Upload of %s to %s failed: %s",
+                                 result.source, result.dest_uri,
+                                 result.error)
+
+                yield result
+
+    def upload(self, items):
+        """Upload files, yield BatchUploadResult as they complete
+
+        items -- iterable of (source, dest_uri) where source is a path
+                 or a file-like object and dest_uri is the target file
+                 URI, or folder URI ending with '/'
+        """
+        # folders may have been created since the last batch
+        self.forget_missing_folders()
+
+        run = _BatchRun(self.hash_ahead, poller=UploadPoller(
+            self._client.api) if self.multiplex_polling else None)
+
+        hash_pool = ThreadPoolExecutor(max_workers=self.hash_workers)
+        upload_pool = ThreadPoolExecutor(max_workers=self.upload_workers)
+
+        try:
+            with UploadSession(self._client.api):
+                for result in self._run(run, items, hash_pool, upload_pool):
+                    yield result
+        finally:
+            hash_pool.shutdown(wait=True)
+            upload_pool.shutdown(wait=True)
+            if run.poller is not None:
+                run.poller.close()
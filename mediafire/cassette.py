@@ -0,0 +1,336 @@
+"""Record and replay MediaFireApi HTTP exchanges
+
+record() captures every request sent through MediaFireApi.http, API calls
+and direct downloads alike, into a cassette file. replay() serves the
+recorded responses back without network access, so a recorded crawl or
+batch upload can be re-run as a benchmark:
+
+    with cassette.record(api, 'crawl.cassette.gz'):
+        list(client.walk('mf:///'))
+
+    with cassette.replay(api, 'crawl.cassette.gz', time_scale=1.0):
+        list(client.walk('mf:///'))
+
+Cassettes are gzip compressed when the path ends with .gz. Credentials,
+session and action tokens, secret keys and call signatures are scrubbed
+before anything is written, so replay does not depend on them. Upload
+bodies are not stored; uploads are matched by their hash headers.
+"""
+
+from __future__ import unicode_literals
+
+import base64
+import gzip
+import io
+import json
+import threading
+import time
+
+from collections import deque
+from contextlib import contextmanager
+
+import six
+
+from six.moves.urllib.parse import (parse_qsl, urlparse)
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Parameters and response fields replaced with SCRUBBED
+SECRET_FIELDS = frozenset(['email', 'password', 'session_token',
+                           'action_token', 'signature', 'secret_key',
+                           'pkey', 'ekey'])
+
+SCRUBBED = 'SCRUBBED'
+
+# secret_key must stay an integer, signatures are computed from it
+SCRUBBED_VALUES = {'secret_key': '0'}
+
+# Request headers identifying upload contents
+MATCH_HEADERS = ('x-filename', 'x-filehash', 'x-unit-id', 'x-unit-hash')
+
+# Response headers kept in the cassette
+RECORDED_HEADERS = ('Content-Type', 'Content-Range', 'Content-Disposition')
+
+FORM_MIMETYPE = 'application/x-www-form-urlencoded'
+
+
+class CassetteError(Exception):
+    """Request has no recorded response"""
+    pass
+
+
+def _text(value):
+    """Return value as text"""
+    if isinstance(value, six.binary_type):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+def _scrub(value):
+    """Return JSON value with SECRET_FIELDS replaced"""
+    if isinstance(value, dict):
+        return dict((key, SCRUBBED_VALUES.get(key, SCRUBBED)
+                     if key in SECRET_FIELDS else _scrub(item))
+                    for key, item in value.items())
+    if isinstance(value, list):
+        return [_scrub(item) for item in value]
+    return value
+
+
+def _request_record(request):
+    """Return scrubbed dict describing a PreparedRequest"""
+    parsed = urlparse(_text(request.url))
+
+    params = parse_qsl(parsed.query, keep_blank_values=True)
+
+    content_type = _text(request.headers.get('Content-Type', ''))
+    if content_type.startswith(FORM_MIMETYPE) and request.body:
+        params += parse_qsl(_text(request.body), keep_blank_values=True)
+
+    params = sorted([key, SCRUBBED_VALUES.get(key, SCRUBBED)
+                     if key in SECRET_FIELDS else value]
+                    for key, value in params)
+
+    headers = {}
+    for name in MATCH_HEADERS:
+        if name in request.headers:
+            headers[name] = _text(request.headers[name])
+
+    return {
+        'method': request.method,
+        'path': parsed.path,
+        'params': params,
+        'headers': headers
+    }
+
+
+def _request_key(record):
+    """Return hashable matching key of a request record"""
+    return json.dumps(record, sort_keys=True)
+
+
+def _response_record(response, elapsed):
+    """Return scrubbed dict describing a Response"""
+    headers = dict((name, response.headers[name])
+                   for name in RECORDED_HEADERS if name in response.headers)
+
+    body = response.content
+    try:
+        data = json.loads(body.decode('utf-8'))
+    except ValueError:
+        data = None
+
+    if isinstance(data, dict):
+        body = json.dumps(_scrub(data), separators=(',', ':'),
+                          sort_keys=True)
+        encoding = 'utf-8'
+    else:
+        body = base64.b64encode(body).decode('ascii')
+        encoding = 'base64'
+
+    return {
+        'status': response.status_code,
+        'reason': _text(response.reason),
+        'headers': headers,
+        'body': body,
+        'encoding': encoding,
+        'elapsed': round(elapsed, 6)
+    }
+
+
+def build_response(request, status, body, headers=None, reason=None):
+    """Return Response to request with body served from memory"""
+    response = Response()
+    response.status_code = status
+    response.reason = reason
+    response.headers = CaseInsensitiveDict(headers or {})
+    response.headers['Content-Length'] = str(len(body))
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.raw = io.BytesIO(body)
+    response.url = request.url
+    response.request = request
+    return response
+
+
+class Cassette(object):
+    """Recorded request/response pairs in recording order"""
+
+    def __init__(self, interactions=None):
+        """Initialize Cassette
+
+        interactions -- list of {'request': ..., 'response': ...} dicts
+        """
+        self.interactions = list(interactions or [])
+        self._lock = threading.Lock()
+
+    def add(self, request, response):
+        """Append interaction"""
+        with self._lock:
+            self.interactions.append({'request': request,
+                                      'response': response})
+
+    @staticmethod
+    def _open(path, mode):
+        """Open path in binary mode, gzip compressed if it ends with .gz"""
+        if path.endswith('.gz'):
+            return gzip.open(path, mode)
+        return io.open(path, mode)
+
+    def save(self, path):
+        """Write interactions to path, one JSON object per line"""
+        with self._lock:
+            lines = [json.dumps(interaction, separators=(',', ':'),
+                                sort_keys=True)
+                     for interaction in self.interactions]
+
+        with self._open(path, 'wb') as fd:
+            for line in lines:
+                fd.write(line.encode('utf-8') + b'\n')
+
+    @classmethod
+    def load(cls, path):
+        """Return Cassette read from path"""
+        with cls._open(path, 'rb') as fd:
+            return cls([json.loads(line.decode('utf-8'))
+                        for line in fd if line.strip()])
+
+
+class RecordingAdapter(BaseAdapter):
+    """Transport adapter adding exchanges of another adapter to a Cassette
+
+    Response bodies are read completely before they are returned.
+    """
+
+    def __init__(self, cassette, adapter):
+        """Initialize RecordingAdapter
+
+        cassette -- Cassette to add interactions to
+        adapter -- transport adapter sending the requests
+        """
+        super(RecordingAdapter, self).__init__()
+        self.cassette = cassette
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        """Send request with the wrapped adapter and record the exchange"""
+        started = time.time()
+        response = self.adapter.send(request, **kwargs)
+        # read the body, the caller gets it from memory
+        response.content  # pylint: disable=pointless-statement
+        elapsed = time.time() - started
+
+        self.cassette.add(_request_record(request),
+                          _response_record(response, elapsed))
+        return response
+
+    def close(self):
+        """Close the wrapped adapter"""
+        self.adapter.close()
+
+
+class ReplayAdapter(BaseAdapter):
+    """Transport adapter answering requests from a Cassette
+
+    Requests are matched on method, path, parameters and upload hash
+    headers. Identical requests get their recorded responses in recording
+    order, e.g. successive upload/poll_upload results.
+    """
+
+    def __init__(self, cassette, time_scale=None):
+        """Initialize ReplayAdapter
+
+        cassette -- Cassette to replay
+        time_scale -- sleep this many times the recorded response time
+                      before responding, None to respond immediately
+        """
+        super(ReplayAdapter, self).__init__()
+        self.cassette = cassette
+        self.time_scale = time_scale
+
+        self._lock = threading.Lock()
+        self._queues = {}
+        for interaction in cassette.interactions:
+            key = _request_key(interaction['request'])
+            self._queues.setdefault(key, deque()).append(
+                interaction['response'])
+
+    def unplayed(self):
+        """Return number of recorded responses not replayed yet"""
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        """Return the next recorded response to request"""
+        record = _request_record(request)
+
+        with self._lock:
+            queue = self._queues.get(_request_key(record))
+            if not queue:
+                raise CassetteError("No recorded response for {} {}".format(
+                    record['method'], record['path']))
+            recorded = queue.popleft()
+
+        if self.time_scale:
+            time.sleep(recorded['elapsed'] * self.time_scale)
+
+        if recorded['encoding'] == 'base64':
+            body = base64.b64decode(recorded['body'])
+        else:
+            body = recorded['body'].encode('utf-8')
+
+        response = build_response(request, recorded['status'], body,
+                                  recorded['headers'], recorded['reason'])
+        response.connection = self
+        return response
+
+    def close(self):
+        """Nothing to close"""
+        pass
+
+
+@contextmanager
+def wrap_adapters(api, wrap):
+    """Mount wrap(adapter) in place of every adapter of api.http
+
+    The original adapters are restored on exit.
+    """
+    original = api.http.adapters.copy()
+    for prefix, adapter in original.items():
+        api.http.mount(prefix, wrap(adapter))
+    try:
+        yield
+    finally:
+        api.http.adapters = original
+
+
+@contextmanager
+def record(api, path):
+    """Record requests of api, write the cassette to path on exit
+
+    Yields the Cassette being recorded.
+    """
+    cassette = Cassette()
+    try:
+        with wrap_adapters(api, lambda adapter: RecordingAdapter(cassette,
+                                                            adapter)):
+            yield cassette
+    finally:
+        cassette.save(path)
+
+
+@contextmanager
+def replay(api, path, time_scale=None):
+    """Answer requests of api from the cassette at path
+
+    time_scale -- 1.0 replays recorded response times, None responds
+                  immediately
+
+    Yields the ReplayAdapter. Requests without a recorded response raise
+    CassetteError.
+    """
+    adapter = ReplayAdapter(Cassette.load(path), time_scale=time_scale)
+    with wrap_adapters(api, lambda _: adapter):
+        yield adapter
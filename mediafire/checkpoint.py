@@ -0,0 +1,152 @@
+"""Upload checkpoint journal for resuming interrupted uploads"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import io
+import json
+import logging
+import os
+
+import six
+
+from mediafire.uploader import MediaFireHashInfo
+
+logger = logging.getLogger(__name__)
+
+# os.replace is atomic on all platforms, but is python 3.3+
+_replace = getattr(os, 'replace', os.rename)
+
+
+class UploadCheckpoint(object):  # pylint: disable=too-few-public-methods
+    """State of a single upload
+
+    key -- journal entry name
+    stat -- dict of source file size, mtime, inode and device
+    hash_info -- MediaFireHashInfo with unit hashes, None if not known yet
+    unit_size -- unit size hash_info.units were computed for
+
+    Units already uploaded are not recorded, upload/check reports them.
+    """
+
+    def __init__(self, key, stat, hash_info=None, unit_size=None):
+        self.key = key
+        self.stat = stat
+        self.hash_info = hash_info
+        self.unit_size = unit_size
+
+    def to_dict(self):
+        """Serialize checkpoint"""
+        return {
+            'stat': self.stat,
+            'hash_info': dict(self.hash_info._asdict())
+                         if self.hash_info is not None else None,
+            'unit_size': self.unit_size
+        }
+
+    @classmethod
+    def from_dict(cls, key, value):
+        """Deserialize checkpoint"""
+        hash_info = value.get('hash_info')
+        if hash_info is not None:
+            hash_info = MediaFireHashInfo(**hash_info)
+
+        return cls(key, value['stat'], hash_info=hash_info,
+                   unit_size=value.get('unit_size'))
+
+
+class UploadCheckpointJournal(object):
+    """Directory of upload checkpoints
+
+    Pass it to MediaFireUploader to persist file and unit hashes of
+    resumable uploads. After a restart the source is validated with a
+    cheap stat() and, if unchanged, the stored hashes are used instead of
+    reading the whole file again. upload/check then reports which units
+    the server already has, and only the missing units are sent.
+
+    Example:
+
+        journal = UploadCheckpointJournal('/var/lib/app/uploads')
+        uploader = MediaFireUploader(api, checkpoint_journal=journal)
+    """
+
+    def __init__(self, path):
+        """Initialize UploadCheckpointJournal
+
+        path -- directory to keep checkpoints in, created if missing
+        """
+        self.path = path
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    @staticmethod
+    def _stat(fd):
+        """Return stat dict for fd or None for non-file objects"""
+        try:
+            stat = os.fstat(fd.fileno())
+        except (AttributeError, io.UnsupportedOperation, OSError):
+            return None
+
+        return {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'ino': stat.st_ino,
+            'dev': stat.st_dev
+        }
+
+    def _entry_path(self, key):
+        """Return path of journal entry"""
+        return os.path.join(self.path, key + '.json')
+
+    # pylint: disable=too-many-arguments
+    def lookup(self, fd, name=None, folder_key=None, path=None,
+               filedrop_key=None):
+        """Return UploadCheckpoint for fd and destination
+
+        A stored checkpoint is returned if the source has not changed
+        since it was written, otherwise a new empty one. Returns None if
+        fd is not a regular file.
+        """
+        stat = self._stat(fd)
+        if stat is None:
+            return None
+
+        identity = json.dumps([stat['dev'], stat['ino'], name, folder_key,
+                               path, filedrop_key])
+        key = hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+        try:
+            with io.open(self._entry_path(key), 'r',
+                         encoding='utf-8') as entry:
+                checkpoint = UploadCheckpoint.from_dict(key,
+                                                        json.load(entry))
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return UploadCheckpoint(key, stat)
+
+        if checkpoint.stat != stat:
+            logger.debug("Source changed since checkpoint %s", key)
+            self.discard(checkpoint)
+            return UploadCheckpoint(key, stat)
+
+        return checkpoint
+    # pylint: enable=too-many-arguments
+
+    def save(self, checkpoint):
+        """Write checkpoint atomically"""
+        entry_path = self._entry_path(checkpoint.key)
+        tmp_path = entry_path + '.tmp'
+
+        with io.open(tmp_path, 'w', encoding='utf-8') as entry:
+            entry.write(six.text_type(json.dumps(checkpoint.to_dict())))
+            entry.flush()
+            os.fsync(entry.fileno())
+
+        _replace(tmp_path, entry_path)
+
+    def discard(self, checkpoint):
+        """Remove checkpoint, e.g. after successful upload"""
+        try:
+            os.unlink(self._entry_path(checkpoint.key))
+        except OSError:
+            pass
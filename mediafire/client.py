@@ -4,13 +4,25 @@ from __future__ import unicode_literals
 
 import os
 import hashlib
+import itertools
 import logging
-import requests
 import posixpath
 
+from collections import namedtuple
+from concurrent.futures import (ThreadPoolExecutor, wait, FIRST_COMPLETED)
+
 from six.moves.urllib.parse import urlparse
 
+from requests.exceptions import RequestException
+
+from mediafire import (deadline, tracing)
 from mediafire.api import (MediaFireApi, MediaFireApiError)
+from mediafire.bandwidth import throttle_iter
+from mediafire.concurrency import AIMDController
+# pylint: disable=unused-import
+from mediafire.crawl import (CrawlerMixin, FolderStats, ListingCache,
+                             CRAWL_MAX_WORKERS)
+# pylint: enable=unused-import
 from mediafire.uploader import (MediaFireUploader, UploadSession)
 
 # These are educated guesses
@@ -20,6 +32,10 @@ FOLDER_KEY_LENGTH = 13
 # All URIs must use this scheme
 URI_SCHEME = 'mf'
 
+# folder/get_content chunk_size bounds
+CHUNK_SIZE_MIN = 100
+CHUNK_SIZE_MAX = 1000
+
 logger = logging.getLogger(__name__)
 
 
@@ -57,18 +73,34 @@ class Folder(Resource):
     pass
 
 
-class MediaFireClient(object):
+DownloadResult = namedtuple('DownloadResult', [
+    'src_uri',
+    'target',
+    # downloaded File on success, None otherwise
+    'resource',
+    # exception on failure, None otherwise
+    'error'
+])
+
+
+class MediaFireClient(CrawlerMixin):
     """A simple MediaFire Client."""
 
-    def __init__(self, session_token=None, _api=None):
+    def __init__(self, session_token=None, _api=None, mirror=None, api=None):
         """Initialize MediaFireClient.
 
         Keyword arguments:
         session_token -- previously acquired session_token dict
+        mirror -- MetadataMirror to serve lookups and listings from
+        api -- MediaFireApi instance to use, e.g. with a custom api_base
         """
 
+        self.mirror = mirror
+
+        if api is not None:
+            self.api = api
         # support testing
-        if _api is None:
+        elif _api is None:
             # pass-through to HTTP client
             self.api = MediaFireApi()
         else:
@@ -77,6 +109,7 @@ class MediaFireClient(object):
         if session_token:
             self.api.session = session_token
 
+    @tracing.traced('client.login')
     def login(self, email=None, password=None, app_id=None, api_key=None):
         """Login to MediaFire account.
 
@@ -92,6 +125,7 @@ class MediaFireClient(object):
         # install session token back into api client
         self.api.session = session_token
 
+    @tracing.traced('client.get_resource_by_uri')
     def get_resource_by_uri(self, uri):
         """Return resource described by MediaFire URI.
 
@@ -111,6 +145,16 @@ class MediaFireClient(object):
 
         location = self._parse_uri(uri)
 
+        if self.mirror is not None:
+            result = None
+            if location.startswith("/"):
+                result = self.mirror.get_by_path(location)
+            elif "/" not in location:
+                result = self.mirror.get_by_key(location)
+
+            if result is not None:
+                return result
+
         if location.startswith("/"):
             # Use path lookup only, root=myfiles
             result = self.get_resource_by_path(location)
@@ -129,6 +173,7 @@ class MediaFireClient(object):
 
         return result
 
+    @tracing.traced('client.get_resource_by_key')
     def get_resource_by_key(self, resource_key):
         """Return resource by quick_key/folder_key.
 
@@ -163,6 +208,7 @@ class MediaFireClient(object):
 
         return resource
 
+    @tracing.traced('client.get_resource_by_path')
     def get_resource_by_path(self, path, folder_key=None):
         """Return resource by remote path.
 
@@ -224,34 +270,114 @@ class MediaFireClient(object):
 
         return result
 
-    def _folder_get_content_iter(self, folder_key=None):
-        """Iterator for api.folder_get_content"""
+    def _folder_get_content_iter(self, folder_key=None,
+                                 content_types=('folders', 'files'),
+                                 **kwargs):
+        """Iterator for api.folder_get_content
+
+        content_types -- content types to list, in order
+        kwargs -- filter_, order_by, order_direction, details, chunk_size
+                  passed to folder_get_content when not None
+
+        Pages are requested lazily, so stopping the iteration early
+        saves the remaining folder/get_content calls.
+        """
 
-        lookup_params = [
-            {'content_type': 'folders', 'node': 'folders'},
-            {'content_type': 'files', 'node': 'files'}
-        ]
+        extra_params = dict((key, value) for key, value in kwargs.items()
+                            if value is not None)
 
-        for param in lookup_params:
+        for content_type in content_types:
             more_chunks = True
             chunk = 0
             while more_chunks:
                 chunk += 1
                 content = self.api.folder_get_content(
-                    content_type=param['content_type'], chunk=chunk,
-                    folder_key=folder_key)['folder_content']
+                    content_type=content_type, chunk=chunk,
+                    folder_key=folder_key, **extra_params)['folder_content']
 
                 # empty folder/file list
-                if not content[param['node']]:
+                if not content[content_type]:
                     break
 
                 # no next page
                 if content['more_chunks'] == 'no':
                     more_chunks = False
 
-                for resource_info in content[param['node']]:
+                for resource_info in content[content_type]:
                     yield resource_info
 
+    def _folder_resources_iter(self, folder_key=None, **kwargs):
+        """Iterator of File and Folder resources in folder
+
+        kwargs -- passed to _folder_get_content_iter
+        """
+        for item in self._folder_get_content_iter(folder_key, **kwargs):
+            if 'filename' in item:
+                # Work around https://mediafire.mantishub.com/view.php?id=5
+                # TODO: remove in 1.0
+                if ".patch." in item['filename']:
+                    continue
+                yield File(item)
+            elif 'name' in item:
+                yield Folder(item)
+
+    # pylint: disable=too-many-arguments
+    def list_folder(self, uri, content_type='files', filter_=None,
+                    order_by=None, order_direction=None, details=None,
+                    limit=None, predicate=None):
+        """List folder with server-side filtering and ordering.
+
+        uri -- MediaFire folder URI
+
+        Keyword arguments:
+        content_type -- 'files' or 'folders'
+        filter_ -- folder/get_content filter, e.g. 'video' or 'public'
+        order_by -- 'name', 'created', 'size' or 'downloads'
+        order_direction -- 'asc' or 'desc'
+        details -- folder/get_content details flag
+        limit -- stop after this many resources
+        predicate -- callable for filtering that the server cannot do
+
+        Filtering and ordering are done by the server and paging stops
+        as soon as limit resources have been yielded.
+
+        Example (20 biggest videos):
+
+            client.list_folder('mf:///Videos', filter_='video',
+                               order_by='size', order_direction='desc',
+                               limit=20)
+        """
+
+        if content_type not in ('files', 'folders'):
+            raise ValueError("content_type must be 'files' or 'folders'")
+
+        resource = self.get_resource_by_uri(uri)
+
+        if not isinstance(resource, Folder):
+            raise NotAFolderError(uri)
+
+        chunk_size = None
+        if limit is not None:
+            if limit <= 0:
+                return
+            chunk_size = max(CHUNK_SIZE_MIN, min(limit, CHUNK_SIZE_MAX))
+
+        count = 0
+        for item in self._folder_resources_iter(
+                resource['folderkey'], content_types=(content_type,),
+                filter_=filter_, order_by=order_by,
+                order_direction=order_direction, details=details,
+                chunk_size=chunk_size):
+            if predicate is not None and not predicate(item):
+                continue
+
+            yield item
+
+            count += 1
+            if limit is not None and count >= limit:
+                break
+    # pylint: enable=too-many-arguments
+
     def get_folder_contents_iter(self, uri):
         """Return iterator for directory contents.
 
@@ -269,16 +395,18 @@ class MediaFireClient(object):
 
         folder_key = resource['folderkey']
 
-        for item in self._folder_get_content_iter(folder_key):
-            if 'filename' in item:
-                # Work around https://mediafire.mantishub.com/view.php?id=5
-                # TODO: remove in 1.0
-                if ".patch." in item['filename']:
-                    continue
-                yield File(item)
-            elif 'name' in item:
-                yield Folder(item)
+        if self.mirror is not None:
+            listing = self.mirror.get(folder_key)
+            if listing is not None:
+                files, folders = listing
+                for item in folders + files:
+                    yield item
+                return
+
+        for item in self._folder_resources_iter(folder_key):
+            yield item
 
+    @tracing.traced('client.create_folder')
     def create_folder(self, uri, recursive=False):
         """Create folder.
 
@@ -324,8 +452,14 @@ class MediaFireClient(object):
         logger.info("Created folder '%s' [mf:%s]",
                     result['name'], result['folder_key'])
 
-        return self.get_resource_by_key(result['folder_key'])
+        resource = self.get_resource_by_key(result['folder_key'])
 
+        if self.mirror is not None:
+            self.mirror.add(resource)
+
+        return resource
+
+    @tracing.traced('client.delete_folder')
     def delete_folder(self, uri, purge=False):
         """Delete folder.
 
@@ -361,8 +495,12 @@ class MediaFireClient(object):
             else:
                 raise
 
+        if self.mirror is not None:
+            self.mirror.remove(resource['folderkey'])
+
         return result
 
+    @tracing.traced('client.delete_file')
     def delete_file(self, uri, purge=False):
         """Delete file.
 
@@ -385,8 +523,14 @@ class MediaFireClient(object):
         else:
             func = self.api.file_delete
 
-        return func(resource['quickkey'])
+        result = func(resource['quickkey'])
+
+        if self.mirror is not None:
+            self.mirror.remove(resource['quickkey'])
 
+        return result
+
+    @tracing.traced('client.delete_resource')
     def delete_resource(self, uri, purge=False):
         """Delete file or folder
 
@@ -471,6 +615,7 @@ class MediaFireClient(object):
 
         return folder_key, name
 
+    @tracing.traced('client.upload_file')
     def upload_file(self, source, dest_uri):
         """Upload file to MediaFire.
 
@@ -491,7 +636,7 @@ class MediaFireClient(object):
                 # Handling fs open/close
                 fd = open(source, 'rb')
 
-            return MediaFireUploader(self.api).upload(
+            result = MediaFireUploader(self.api).upload(
                 fd, name, folder_key=folder_key,
                 action_on_duplicate='replace')
         finally:
@@ -499,11 +644,37 @@ class MediaFireClient(object):
             if fd and not is_fh:
                 fd.close()
 
+        if self.mirror is not None:
+            self._mirror_upload_result(result, folder_key)
+
+        return result
+
+    def _mirror_upload_result(self, result, folder_key):
+        """Reflect UploadResult in the mirror"""
+        if result.quickkey is None:
+            # nothing to record, let the next listing pick it up
+            self.mirror.invalidate(folder_key)
+            return
+
+        self.mirror.add(File({
+            'quickkey': result.quickkey,
+            'filename': result.filename,
+            'hash': result.hash_,
+            'size': result.size,
+            'created': result.created,
+            'revision': result.revision,
+            'parent_folderkey': folder_key
+        }))
+
+    @tracing.traced('client.download_file')
     def download_file(self, src_uri, target):
         """Download file from MediaFire.
 
         src_uri -- MediaFire file URI to download
         target -- download path or file-like object in write mode
+
+        Returns the downloaded File. The download stops with
+        DeadlineExceeded once the current mediafire.deadline has passed.
         """
         resource = self.get_resource_by_uri(src_uri)
         if not isinstance(resource, File):
@@ -514,8 +685,9 @@ class MediaFireClient(object):
                                          link_type='direct_download')
         direct_download = result['links'][0]['direct_download']
 
-        # Force download over HTTPS
-        direct_download = direct_download.replace('http:', 'https:')
+        # Force download over HTTPS, unless the API is plain HTTP too
+        if urlparse(self.api.api_base).scheme == 'https':
+            direct_download = direct_download.replace('http:', 'https:')
 
         name = resource['filename']
 
@@ -531,30 +703,109 @@ class MediaFireClient(object):
 
             logger.info("Downloading %s to %s", src_uri, target)
 
-        response = requests.get(direct_download, stream=True)
-        try:
-            if target_is_filehandle:
-                out_fd = target
-            else:
-                out_fd = open(target, 'wb')
+        with tracing.span('client.download',
+                          {'mediafire.quickkey': quick_key}):
+            def get():
+                """Request the file, timeout limited by the deadline"""
+                return self.api.http.get(
+                    direct_download, stream=True,
+                    timeout=deadline.request_timeout(self.api.timeout))
 
-            checksum = hashlib.sha256()
-            for chunk in response.iter_content(chunk_size=4096):
-                if chunk:
-                    out_fd.write(chunk)
-                    checksum.update(chunk)
+            try:
+                response = self.api.retry_policy.call(get, 'download',
+                                                      idempotent=True)
+            except RequestException:
+                deadline.check()
+                raise
 
-            checksum_hex = checksum.hexdigest().lower()
-            if checksum_hex != resource['hash']:
-                raise DownloadError("Hash mismatch ({} != {})".format(
-                    resource['hash'], checksum_hex))
+            try:
+                if target_is_filehandle:
+                    out_fd = target
+                else:
+                    out_fd = open(target, 'wb')
+
+                chunks = throttle_iter(response.iter_content(chunk_size=4096),
+                                       self.api.download_limiter)
+
+                checksum = hashlib.sha256()
+                for chunk in chunks:
+                    deadline.check()
+                    if chunk:
+                        out_fd.write(chunk)
+                        checksum.update(chunk)
+
+                checksum_hex = checksum.hexdigest().lower()
+                if checksum_hex != resource['hash']:
+                    raise DownloadError("Hash mismatch ({} != {})".format(
+                        resource['hash'], checksum_hex))
+
+                logger.info("Download completed successfully")
+            except RequestException:
+                deadline.check()
+                raise
+            finally:
+                if not target_is_filehandle:
+                    out_fd.close()
+
+        return resource
+
+    def download_files(self, items, concurrency=None):
+        """Download many files concurrently, yield DownloadResult as they
+        complete
+
+        items -- iterable of (src_uri, target) as in download_file()
+        concurrency -- AIMDController adjusting the number of parallel
+                       downloads to the observed throughput
+
+        Items are read as downloads complete, at most max_limit of the
+        controller ahead. Closing the generator cancels the downloads not
+        started yet and waits for the running ones.
+        """
+        if concurrency is None:
+            concurrency = AIMDController()
+
+        def download(src_uri, target):
+            """Download single file holding a concurrency slot"""
+            with concurrency.slot() as slot:
+                resource = self.download_file(src_uri, target)
+                slot.bytes = int(resource.get('size', 0))
+            return resource
+
+        items = iter(items)
+        pending = {}
 
-            logger.info("Download completed successfully")
+        executor = ThreadPoolExecutor(max_workers=concurrency.max_limit)
+        try:
+            while True:
+                for src_uri, target in itertools.islice(
+                        items, concurrency.max_limit - len(pending)):
+                    future = executor.submit(
+                        deadline.bind(tracing.bind(download)),
+                        src_uri, target)
+                    pending[future] = (src_uri, target)
+
+                if not pending:
+                    break
+
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    src_uri, target = pending.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        logger.error("Download of %s failed: %s",
+                                     src_uri, error)
+                    yield DownloadResult(
+                        src_uri=src_uri, target=target, error=error,
+                        resource=future.result() if error is None else None)
         finally:
-            if not target_is_filehandle:
-                out_fd.close()
+            for future in pending:
+                future.cancel()
+            # no target is written to once the generator is closed
+            executor.shutdown(wait=True)
 
     # pylint: disable=too-many-arguments
+    @tracing.traced('client.update_file_metadata')
     def update_file_metadata(self, uri, filename=None, description=None,
                              mtime=None, privacy=None):
         """Update file metadata.
@@ -579,10 +830,16 @@ class MediaFireClient(object):
                                       description=description,
                                       mtime=mtime, privacy=privacy)
 
+        if self.mirror is not None:
+            self._mirror_update(resource, {'filename': filename,
+                                           'description': description,
+                                           'privacy': privacy})
+
         return result
     # pylint: enable=too-many-arguments
 
     # pylint: disable=too-many-arguments
+    @tracing.traced('client.update_folder_metadata')
     def update_folder_metadata(self, uri, foldername=None, description=None,
                                mtime=None, privacy=None,
                                privacy_recursive=None):
@@ -612,9 +869,32 @@ class MediaFireClient(object):
                                         privacy=privacy,
                                         privacy_recursive=privacy_recursive)
 
+        if self.mirror is not None:
+            self._mirror_update(resource, {'name': foldername,
+                                           'description': description,
+                                           'privacy': privacy})
+            if privacy_recursive:
+                # privacy of the contents changed as well
+                self.mirror.invalidate(resource['folderkey'])
+
         return result
     # pylint: enable=too-many-arguments
 
+    def _mirror_update(self, resource, changes):
+        """Merge metadata changed on the server into the mirrored resource
+
+        changes -- dict of info fields, None values were not changed
+
+        A renamed folder keeps its mirrored subtree, paths below it are
+        recomputed.
+        """
+        info = dict(resource)
+        info.update((key, value) for key, value in changes.items()
+                    if value is not None)
+
+        kind = 'files' if isinstance(resource, File) else 'folders'
+        self.mirror.apply_changes({'updated': {kind: [info]}})
+
     @staticmethod
     def _parse_uri(uri):
         """Parse and validate MediaFire URI."""
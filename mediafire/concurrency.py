@@ -0,0 +1,170 @@
+"""Adaptive concurrency limit for transfers"""
+
+from __future__ import unicode_literals
+
+import logging
+import threading
+import time
+
+# Default bounds of the number of concurrent transfers
+CONCURRENCY_MIN = 1
+CONCURRENCY_MAX = 8
+
+# Limit is multiplied by this on errors and overload
+DECREASE_FACTOR = 0.5
+
+# Round throughput must grow by this fraction to allow one more transfer
+THROUGHPUT_GAIN = 0.05
+
+# Round latency over this multiple of the best latency means overload
+LATENCY_TOLERANCE = 3.0
+
+logger = logging.getLogger(__name__)
+
+
+class _Slot(object):  # pylint: disable=too-few-public-methods
+    """Context manager holding one AIMDController slot"""
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._started = None
+        # bytes transferred while holding the slot, set by the caller
+        self.bytes = 0
+
+    def __enter__(self):
+        self._started = self._controller.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._controller.release(self._started, self.bytes,
+                                 error=exc_value if exc_type else None)
+
+
+class AIMDController(object):
+    """Additive increase, multiplicative decrease concurrency limit
+
+    Transfers run while holding a slot. Completions are grouped in rounds
+    of `limit` transfers; if a round moved more bytes per second than the
+    previous one, the limit grows by one. A failed transfer or a round
+    with latency far above the best seen so far halves the limit. The
+    limit always stays within min_limit and max_limit.
+
+    Example:
+
+        controller = AIMDController(max_limit=16)
+        with controller.slot() as slot:
+            send_unit()
+            slot.bytes = unit_size
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, min_limit=CONCURRENCY_MIN, max_limit=CONCURRENCY_MAX,
+                 initial=None, decrease_factor=DECREASE_FACTOR,
+                 latency_tolerance=LATENCY_TOLERANCE):
+        """Initialize AIMDController
+
+        min_limit -- lowest number of concurrent transfers
+        max_limit -- highest number of concurrent transfers
+        initial -- starting limit, defaults to min_limit
+        decrease_factor -- limit multiplier on errors and overload
+        latency_tolerance -- round latency over this multiple of the
+                             best round latency is treated as overload
+        """
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError("Invalid concurrency bounds")
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+
+        self._cond = threading.Condition()
+        self._limit = float(initial or min_limit)
+        self._active = 0
+
+        self._best_latency = None
+        self._last_throughput = None
+        self._reset_round()
+    # pylint: enable=too-many-arguments
+
+    @property
+    def limit(self):
+        """Current number of concurrent transfers allowed"""
+        return int(self._limit)
+
+    def slot(self):
+        """Return context manager holding a transfer slot"""
+        return _Slot(self)
+
+    def acquire(self):
+        """Wait for a free slot, return start time for release()"""
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+        return time.time()
+
+    def release(self, started, nbytes=0, error=None):
+        """Free a slot and adjust the limit
+
+        started -- value returned by acquire()
+        nbytes -- bytes transferred
+        error -- exception if the transfer failed
+        """
+        now = time.time()
+        with self._cond:
+            self._active -= 1
+
+            if error is not None:
+                logger.debug("Transfer failed (%s), backing off", error)
+                self._decrease()
+            else:
+                self._round_count += 1
+                self._round_bytes += nbytes or 1
+                self._round_latency += now - started
+                if self._round_count >= self.limit:
+                    self._end_round(now)
+
+            self._cond.notify_all()
+
+    def _reset_round(self):
+        """Start collecting a new round"""
+        self._round_start = time.time()
+        self._round_count = 0
+        self._round_bytes = 0
+        self._round_latency = 0.0
+
+    def _set_limit(self, limit):
+        """Clamp and set the limit"""
+        limit = min(max(limit, self.min_limit), self.max_limit)
+        if int(limit) != self.limit:
+            logger.debug("Concurrency limit %d -> %d", self.limit, limit)
+        self._limit = limit
+
+    def _decrease(self):
+        """Multiplicative decrease"""
+        self._set_limit(self._limit * self.decrease_factor)
+        # throughput at the old limit is no reference any more
+        self._last_throughput = None
+        self._reset_round()
+
+    def _end_round(self, now):
+        """Compare round with the previous one and adjust the limit"""
+        throughput = self._round_bytes / max(now - self._round_start, 1e-9)
+        latency = self._round_latency / self._round_count
+
+        if self._best_latency is None or latency < self._best_latency:
+            self._best_latency = latency
+
+        if latency > self._best_latency * self.latency_tolerance:
+            logger.debug("Latency %.3fs over tolerance, backing off",
+                         latency)
+            self._decrease()
+            return
+
+        if self._last_throughput is None or \
+                throughput > self._last_throughput * (1 + THROUGHPUT_GAIN):
+            self._set_limit(self._limit + 1)
+
+        self._last_throughput = throughput
+        self._reset_round()
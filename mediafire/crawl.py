@@ -0,0 +1,351 @@
+"""Folder tree crawling for MediaFireClient"""
+
+from __future__ import unicode_literals
+
+import functools
+import posixpath
+import time
+
+from collections import (deque, namedtuple)
+from contextlib import contextmanager
+from threading import Lock
+from concurrent.futures import (ThreadPoolExecutor, wait, as_completed,
+                                FIRST_COMPLETED)
+
+import six
+
+from mediafire import (deadline, tracing)
+
+# Number of folders listed concurrently by tree crawlers
+CRAWL_MAX_WORKERS = 4
+
+# Crawlers list with an action token: signed calls are sent one at a time
+CRAWL_ACTION_TOKEN_TYPE = 'upload'
+
+FolderStats = namedtuple('FolderStats', [
+    # path of the folder as yielded by walk(): absolute for mf:///path
+    # URIs, starting with the folder key for mf:folderkey URIs
+    'path',
+    'folderkey',
+    # number and total size of the files directly in the folder
+    'files',
+    'size',
+    # the same, including all subfolders
+    'total_files',
+    'total_size',
+    # number of all subfolders
+    'total_folders'
+])
+
+
+class ListingCache(object):
+    """In-memory cache of folder listings keyed by folderkey"""
+
+    def __init__(self, max_age=None):
+        """Initialize ListingCache
+
+        max_age -- seconds a listing stays valid, None for no expiry
+        """
+        self.max_age = max_age
+        self._listings = {}
+        self._lock = Lock()
+
+    def get(self, folder_key):
+        """Return (files, folders) for folder_key or None if not cached"""
+        with self._lock:
+            entry = self._listings.get(folder_key)
+
+        if entry is None:
+            return None
+
+        timestamp, files, folders = entry
+        if self.max_age is not None and \
+                time.time() - timestamp > self.max_age:
+            return None
+
+        return list(files), list(folders)
+
+    def put(self, folder_key, files, folders):
+        """Store (files, folders) listing for folder_key"""
+        with self._lock:
+            self._listings[folder_key] = (
+                time.time(), list(files), list(folders))
+
+    def invalidate(self, folder_key=None):
+        """Drop listing for folder_key, or all listings if None"""
+        with self._lock:
+            if folder_key is None:
+                self._listings.clear()
+            else:
+                self._listings.pop(folder_key, None)
+
+
+class CrawlerMixin(object):
+    """Tree crawling methods of MediaFireClient
+
+    Relies on the client's api, mirror, get_resource_by_uri(),
+    _folder_resources_iter() and _parse_uri().
+    """
+
+    @contextmanager
+    def _crawl_token(self, max_workers):
+        """Yield action_token_type for concurrent crawl calls, None if
+        they are not concurrent or not signed anyway
+        """
+        if max_workers < 2:
+            yield None
+            return
+
+        with self.api.action_token(CRAWL_ACTION_TOKEN_TYPE) as token:
+            yield CRAWL_ACTION_TOKEN_TYPE if token is not None else None
+
+    def _folder_list(self, folder_key, action_token_type=None):
+        """Return (files, folders) lists of File and Folder resources"""
+
+        from mediafire.client import File
+
+        files = []
+        folders = []
+
+        for item in self._folder_resources_iter(
+                folder_key, action_token_type=action_token_type):
+            if isinstance(item, File):
+                files.append(item)
+            else:
+                folders.append(item)
+
+        return files, folders
+
+    def _folder_list_cached(self, folder_key, cache=None,
+                            action_token_type=None):
+        """Return (files, folders) from cache, fetching on cache miss"""
+
+        if cache is not None:
+            listing = cache.get(folder_key)
+            if listing is not None:
+                return listing
+
+        files, folders = self._folder_list(folder_key, action_token_type)
+
+        if cache is not None:
+            cache.put(folder_key, files, folders)
+
+        return files, folders
+
+    def walk(self, uri, max_workers=CRAWL_MAX_WORKERS, cache=None):
+        """Walk folder tree, yield (path, folder, files, folders) tuples.
+
+        uri -- MediaFire folder URI
+
+        Keyword arguments:
+        max_workers -- number of folders listed concurrently
+        cache -- ListingCache to read listings from and store them to,
+                 defaults to the client mirror
+
+        Folders are crawled breadth-first, up to max_workers listings
+        are in flight at any time and tuples are yielded in completion
+        order. Subfolders are taken from the parent listing, so no
+        additional path lookups are made. Like os.walk, removing items
+        from the yielded folders list prunes them from the crawl, and
+        closing the generator waits for the listings in flight.
+
+        Calls signed with the session secret key are sent one at a time,
+        see MediaFireApi.request, so concurrent listings are made with
+        an action token held for the duration of the walk.
+
+        Example:
+
+            for path, folder, files, folders in client.walk('mf:///Docs'):
+                print(path, len(files))
+        """
+        return self._walk(uri, max_workers=max_workers, cache=cache)
+
+    def _walk(self, uri, max_workers=CRAWL_MAX_WORKERS, cache=None,
+              span=None):
+        """Walk folder tree, see walk()
+
+        span -- span to trace the calls in, defaults to the span current
+                whenever the caller resumes the walk
+        """
+
+        from mediafire.client import (Folder, NotAFolderError)
+
+        resource = tracing.bind(self.get_resource_by_uri, parent=span)(uri)
+
+        if not isinstance(resource, Folder):
+            raise NotAFolderError(uri)
+
+        if cache is None:
+            cache = self.mirror
+
+        frontier = deque([(self._parse_uri(uri), resource)])
+        pending = {}
+
+        with self._crawl_token(max_workers) as token_type:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            try:
+                while frontier or pending:
+                    while frontier and len(pending) < max_workers:
+                        path, folder = frontier.popleft()
+                        list_folder = deadline.bind(tracing.bind(
+                            self._folder_list_cached, parent=span))
+                        future = executor.submit(
+                            list_folder, folder['folderkey'], cache,
+                            token_type)
+                        pending[future] = (path, folder)
+
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+
+                    for future in done:
+                        path, folder = pending.pop(future)
+                        files, folders = future.result()
+
+                        yield path, folder, files, folders
+
+                        for child in folders:
+                            frontier.append(
+                                (posixpath.join(path, child['name']), child))
+            finally:
+                for future in pending:
+                    future.cancel()
+                executor.shutdown(wait=True)
+
+    def tree_stats(self, uri, max_workers=CRAWL_MAX_WORKERS, cache=None):
+        """Compute folder sizes and file counts, yield FolderStats.
+
+        uri -- MediaFire folder URI
+
+        Keyword arguments:
+        max_workers -- number of folders listed concurrently
+        cache -- ListingCache to read listings from and store them to
+
+        Sizes are taken from folder/get_content listings. Totals are
+        aggregated bottom-up: FolderStats for a folder is yielded as soon
+        as all of its subfolders are done, so the last item yielded
+        describes the folder referenced by uri.
+
+        Example:
+
+            for stats in client.tree_stats('mf:///Backups'):
+                print(stats.path, stats.total_size)
+        """
+
+        # tracing.traced would end the span once the generator is
+        # created, before any folder is listed; the span is not made
+        # current, it would stay current in the caller between items
+        with tracing.detached_span('client.tree_stats') as span:
+            nodes = {}
+            parents = {}
+
+            for path, folder, files, folders in self._walk(
+                    uri, max_workers=max_workers, cache=cache, span=span):
+                folder_key = folder['folderkey']
+
+                size = sum(int(item.get('size', 0)) for item in files)
+
+                nodes[folder_key] = {
+                    'path': path,
+                    'files': len(files),
+                    'size': size,
+                    'total_files': len(files),
+                    'total_size': size,
+                    'total_folders': len(folders),
+                    'remaining': len(folders)
+                }
+
+                for child in folders:
+                    parents[child['folderkey']] = folder_key
+
+                # roll completed folders up towards the root
+                while folder_key is not None and \
+                        nodes[folder_key]['remaining'] == 0:
+                    node = nodes.pop(folder_key)
+
+                    yield FolderStats(
+                        path=node['path'],
+                        folderkey=folder_key,
+                        files=node['files'],
+                        size=node['size'],
+                        total_files=node['total_files'],
+                        total_size=node['total_size'],
+                        total_folders=node['total_folders']
+                    )
+
+                    folder_key = parents.pop(folder_key, None)
+                    if folder_key is not None:
+                        parent = nodes[folder_key]
+                        parent['total_files'] += node['total_files']
+                        parent['total_size'] += node['total_size']
+                        parent['total_folders'] += node['total_folders']
+                        parent['remaining'] -= 1
+
+    def search(self, search_text, uri='mf:///', filter_=None,
+               search_all=None, max_workers=CRAWL_MAX_WORKERS):
+        """Search for files and folders by name, yield File and Folder.
+
+        search_text -- text to look for in names
+
+        Keyword arguments:
+        uri -- folder URI or list of folder URIs to search in
+        filter_ -- folder/search filter, e.g. 'image' or 'document'
+        search_all -- search all folders instead of uri
+        max_workers -- number of folder/search requests in flight
+
+        The search is done by the server, so a lookup costs one request
+        per folder instead of a crawl. When several folders are given
+        they are searched concurrently and duplicates are dropped.
+
+        Example:
+
+            for item in client.search('report', uri='mf:///Documents'):
+                print(item['quickkey'])
+        """
+
+        from mediafire.client import (File, Folder, NotAFolderError)
+
+        if isinstance(uri, six.string_types):
+            uris = [uri]
+        else:
+            uris = list(uri)
+
+        folder_keys = []
+        for folder_uri in uris:
+            resource = self.get_resource_by_uri(folder_uri)
+            if not isinstance(resource, Folder):
+                raise NotAFolderError(folder_uri)
+            folder_keys.append(resource['folderkey'])
+
+        seen = set()
+        futures = []
+
+        with self._crawl_token(max_workers) as token_type:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            try:
+                search = deadline.bind(tracing.bind(self.api.folder_search))
+                if token_type is not None:
+                    search = functools.partial(search,
+                                               action_token_type=token_type)
+                futures = [executor.submit(search, search_text,
+                                           folder_key=folder_key,
+                                           filter_=filter_,
+                                           search_all=search_all)
+                           for folder_key in folder_keys]
+
+                for future in as_completed(futures):
+                    for item in future.result().get('results', []):
+                        if 'quickkey' in item:
+                            key, resource = item['quickkey'], File(item)
+                        elif 'folderkey' in item:
+                            key, resource = item['folderkey'], Folder(item)
+                        else:
+                            continue
+
+                        if key in seen:
+                            continue
+                        seen.add(key)
+
+                        yield resource
+            finally:
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=True)
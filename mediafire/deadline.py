@@ -0,0 +1,183 @@
+"""End-to-end deadlines and per-request timeouts
+
+A Deadline bounds everything run within it on the current thread: each
+MediaFireApi request, download and conversion server request gets at most
+the remaining time as its connect and read timeouts, and uploader retries
+and polls stop once it has passed. Work handed to other threads by the
+SDK (resumable units, concurrent downloads, UploadPoller) carries the
+deadline along.
+
+    from mediafire.deadline import Deadline
+
+    with Deadline(30):
+        client.upload_file('/tmp/a.bin', 'mf:///Inbox/')
+
+Deadline(timeout=...) overrides the connect/read timeouts of requests made
+within it without bounding the whole operation:
+
+    with Deadline(timeout=(3.05, 10)):
+        api.folder_get_content(folder_key=folder_key)
+
+Nested deadlines never extend the enclosing one.
+"""
+
+from __future__ import unicode_literals
+
+import functools
+import threading
+import time
+
+from contextlib import contextmanager
+
+# Deadline active in the current thread
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    """Deadline passed before the operation completed"""
+    pass
+
+
+def _clip(value, remaining):
+    """Return timeout value limited to remaining seconds"""
+    if remaining is None:
+        return value
+    if value is None:
+        return remaining
+    return min(value, remaining)
+
+
+class Deadline(object):
+    """Point in time by which the enclosed operation must complete"""
+
+    def __init__(self, seconds=None, timeout=None):
+        """Initialize Deadline
+
+        seconds -- time budget from now, None for no overall bound
+        timeout -- requests timeout, seconds or (connect, read) tuple,
+                   for requests made within the deadline, None to use
+                   the timeout of the client or the enclosing deadline
+        """
+        self.expires = time.time() + seconds if seconds is not None \
+            else None
+        self.timeout = timeout
+        self._parent = None
+
+    def __enter__(self):
+        self._parent = current()
+        _local.deadline = self
+        return self
+
+    def __exit__(self, *exc_details):
+        _local.deadline = self._parent
+        return False
+
+    def remaining(self):
+        """Return seconds left, None if unbounded"""
+        remaining = None
+        if self.expires is not None:
+            remaining = self.expires - time.time()
+
+        if self._parent is not None:
+            parent = self._parent.remaining()
+            if parent is not None:
+                remaining = parent if remaining is None \
+                    else min(remaining, parent)
+
+        return remaining
+
+    def expired(self):
+        """Check whether the deadline has passed"""
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def check(self):
+        """Raise DeadlineExceeded if the deadline has passed"""
+        if self.expired():
+            raise DeadlineExceeded("Deadline exceeded")
+
+    def request_timeout(self, default):
+        """Return requests timeout for a request made now
+
+        default -- timeout of the client, seconds or (connect, read)
+
+        Raises DeadlineExceeded if no time is left, requests rejects
+        a timeout of 0.
+        """
+        timeout = self._timeout(default)
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded("Deadline exceeded")
+
+        if isinstance(timeout, tuple):
+            return tuple(_clip(value, remaining) for value in timeout)
+        return _clip(timeout, remaining)
+
+    def _timeout(self, default):
+        """Return innermost timeout override or default"""
+        if self.timeout is not None:
+            return self.timeout
+        if self._parent is not None:
+            return self._parent._timeout(default)
+        return default
+
+
+def current():
+    """Return Deadline active in this thread or None"""
+    return getattr(_local, 'deadline', None)
+
+
+def check():
+    """Raise DeadlineExceeded if the current deadline has passed"""
+    deadline = current()
+    if deadline is not None:
+        deadline.check()
+
+
+def expired():
+    """Check whether the current deadline has passed"""
+    deadline = current()
+    return deadline is not None and deadline.expired()
+
+
+def request_timeout(default):
+    """Return requests timeout limited by the current deadline"""
+    deadline = current()
+    if deadline is None:
+        return default
+    return deadline.request_timeout(default)
+
+
+def sleep(seconds):
+    """Sleep, but not past the current deadline, then check it"""
+    deadline = current()
+    remaining = deadline.remaining() if deadline is not None else None
+    time.sleep(max(_clip(seconds, remaining), 0))
+    check()
+
+
+@contextmanager
+def use(deadline):
+    """Make deadline current in this thread without nesting it"""
+    previous = current()
+    _local.deadline = deadline
+    try:
+        yield deadline
+    finally:
+        _local.deadline = previous
+
+
+def bind(func):
+    """Return func running under the current deadline when called from
+    another thread, e.g. from a ThreadPoolExecutor
+    """
+    deadline = current()
+    if deadline is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        """Call func with the captured deadline as current"""
+        with use(deadline):
+            return func(*args, **kwargs)
+    return wrapper
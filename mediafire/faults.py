@@ -0,0 +1,269 @@
+"""Fault and latency injection for MediaFireApi.http
+
+FaultInjector wraps the transport adapters of a MediaFireApi to benchmark
+retry paths under degraded conditions:
+
+* latency -- fixed delay plus random jitter before every request
+* drops -- connection dropped part way through the upload body or, for
+  requests without a streamed body, part way through the response body
+  after the server has acted on the request
+* errors -- API calls answered with a MediaFire error code
+* new_key flips -- new_key of API responses toggled, so the secret key of
+  the client and the server go out of step
+
+    with faults.inject(api, latency=0.05, drop_rate=0.05,
+                       error_rate=0.01) as injector:
+        client.upload_file(...)
+    print(injector.summary())
+
+Faults are drawn from a seeded random generator, so runs are repeatable
+for the same sequence of requests.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import random
+import threading
+import time
+
+from contextlib import contextmanager
+
+from six.moves.urllib.parse import urlparse
+
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.utils import super_len
+
+from mediafire.api import API_VER
+from mediafire.cassette import (build_response, wrap_adapters)
+
+# Internal server error
+DEFAULT_ERROR_CODES = (100,)
+
+# HTTP status of injected API errors
+ERROR_STATUS = 500
+
+# Request body is read in chunks of this size before a drop
+DROP_CHUNK_SIZE = 64 * 1024
+
+FAULT_DROP = 'drop'
+FAULT_ERROR = 'error'
+FAULT_NEW_KEY = 'new_key'
+
+
+class FaultInjector(object):
+    """Fault configuration, random generator and counters
+
+    Counters are shared by all adapters of the injector:
+
+    requests -- requests seen
+    delay -- seconds of injected latency
+    drops, errors, new_key_flips -- injected faults
+    wasted_bytes -- request and response bytes sent or received in vain
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, latency=0.0, jitter=0.0, drop_rate=0.0,
+                 error_rate=0.0, error_codes=DEFAULT_ERROR_CODES,
+                 new_key_rate=0.0, seed=None):
+        """Initialize FaultInjector
+
+        latency -- seconds added to every request
+        jitter -- up to this many random seconds added on top of latency
+        drop_rate -- share of requests whose connection is dropped
+        error_rate -- share of API calls answered with an error
+        error_codes -- MediaFire error codes to choose from
+        new_key_rate -- share of API responses with new_key toggled
+        seed -- random seed, None for a different sequence every run
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.new_key_rate = new_key_rate
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.delay = 0.0
+        self.drops = 0
+        self.errors = 0
+        self.new_key_flips = 0
+        self.wasted_bytes = 0
+    # pylint: enable=too-many-arguments
+
+    def adapter(self, adapter):
+        """Return FaultInjectingAdapter wrapping adapter"""
+        return FaultInjectingAdapter(self, adapter)
+
+    def draw(self, request):
+        """Return (delay, fault, fraction, error_code) for request
+
+        fault is None or one of FAULT_*, fraction is the share of the
+        body transferred before a drop, error_code the code of an
+        injected error.
+        """
+        is_api = urlparse(request.url).path.startswith('/api/')
+
+        with self._lock:
+            self.requests += 1
+
+            delay = self.latency
+            if self.jitter:
+                delay += self._random.uniform(0, self.jitter)
+            self.delay += delay
+
+            rates = [(FAULT_DROP, self.drop_rate)]
+            if is_api:
+                rates += [(FAULT_ERROR, self.error_rate),
+                          (FAULT_NEW_KEY, self.new_key_rate)]
+
+            fault = None
+            value = self._random.random()
+            for name, rate in rates:
+                if value < rate:
+                    fault = name
+                    break
+                value -= rate
+
+            if fault == FAULT_DROP:
+                self.drops += 1
+            elif fault == FAULT_ERROR:
+                self.errors += 1
+            elif fault == FAULT_NEW_KEY:
+                self.new_key_flips += 1
+
+            return (delay, fault, self._random.random(),
+                    self._random.choice(self.error_codes))
+
+    def waste(self, size):
+        """Count size bytes as wasted"""
+        with self._lock:
+            self.wasted_bytes += size
+
+    def summary(self):
+        """Return dict of counters"""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'delay': self.delay,
+                'drops': self.drops,
+                'errors': self.errors,
+                'new_key_flips': self.new_key_flips,
+                'wasted_bytes': self.wasted_bytes
+            }
+
+
+class FaultInjectingAdapter(BaseAdapter):
+    """Transport adapter injecting faults into requests of another adapter
+    """
+
+    def __init__(self, injector, adapter):
+        """Initialize FaultInjectingAdapter
+
+        injector -- FaultInjector deciding what goes wrong
+        adapter -- transport adapter sending the requests
+        """
+        super(FaultInjectingAdapter, self).__init__()
+        self.injector = injector
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        """Send request through the wrapped adapter, unless it fails"""
+        delay, fault, fraction, error_code = self.injector.draw(request)
+
+        if delay:
+            time.sleep(delay)
+
+        body_size = super_len(request.body) if request.body else 0
+
+        if fault == FAULT_ERROR:
+            self.injector.waste(body_size)
+            return self._error_response(request, error_code)
+
+        if fault == FAULT_DROP and hasattr(request.body, 'read'):
+            self._drop_request(request, int(body_size * fraction))
+
+        response = self.adapter.send(request, **kwargs)
+
+        if fault == FAULT_DROP:
+            self.injector.waste(body_size)
+            self._drop_response(request, response, fraction)
+        elif fault == FAULT_NEW_KEY:
+            self._flip_new_key(response)
+
+        return response
+
+    def _drop_request(self, request, size):
+        """Consume size bytes of the request body and drop the connection"""
+        sent = 0
+        while sent < size:
+            chunk = request.body.read(min(DROP_CHUNK_SIZE, size - sent))
+            if not chunk:
+                break
+            sent += len(chunk)
+
+        self.injector.waste(sent)
+        raise RequestsConnectionError(
+            "Injected connection drop after {} request bytes".format(sent),
+            request=request)
+
+    def _drop_response(self, request, response, fraction):
+        """Read part of the response body and drop the connection"""
+        size = int(int(response.headers.get('Content-Length', 0)) * fraction)
+        received = len(response.raw.read(size)) if size else 0
+        response.close()
+
+        self.injector.waste(received)
+        raise RequestsConnectionError(
+            "Injected connection drop after {} response bytes".format(
+                received), request=request)
+
+    @staticmethod
+    def _error_response(request, error_code):
+        """Return MediaFire error response"""
+        body = json.dumps({'response': {
+            'result': 'Error',
+            'message': 'Injected fault',
+            'error': error_code,
+            'current_api_version': API_VER
+        }}).encode('utf-8')
+
+        return build_response(request, ERROR_STATUS, body,
+                              {'Content-Type': 'application/json'},
+                              'Internal Server Error')
+
+    @staticmethod
+    def _flip_new_key(response):
+        """Toggle new_key of a JSON API response"""
+        try:
+            data = json.loads(response.content.decode('utf-8'))
+            node = data['response']
+        except (ValueError, KeyError, TypeError):
+            return
+
+        node['new_key'] = 'no' if node.get('new_key') == 'yes' else 'yes'
+
+        body = json.dumps(data).encode('utf-8')
+        response._content = body  # pylint: disable=protected-access
+        response.headers['Content-Length'] = str(len(body))
+
+    def close(self):
+        """Close the wrapped adapter"""
+        self.adapter.close()
+
+
+@contextmanager
+def inject(api, **options):
+    """Inject faults into requests of api
+
+    options -- FaultInjector arguments
+
+    Yields the FaultInjector.
+    """
+    injector = FaultInjector(**options)
+    with wrap_adapters(api, injector.adapter):
+        yield injector
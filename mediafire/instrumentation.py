@@ -0,0 +1,370 @@
+"""Per-call instrumentation of MediaFireApi requests"""
+
+from __future__ import unicode_literals
+
+import logging
+import math
+import threading
+import time
+
+from contextlib import contextmanager
+
+from requests.adapters import HTTPAdapter
+# requests before 2.16 vendors urllib3, the adapter uses these classes
+# pylint: disable=import-error
+from requests.packages.urllib3.connection import (
+    HTTPConnection, HTTPSConnection)
+from requests.packages.urllib3.connectionpool import (
+    HTTPConnectionPool, HTTPSConnectionPool)
+# pylint: enable=import-error
+
+# Phases of a request, in order
+PHASES = ('queue', 'sign', 'connect', 'send', 'ttfb', 'decode')
+
+# Percentiles reported by Histogram.summary()
+PERCENTILES = (50, 90, 95, 99)
+
+# Relative error of histogram values
+HISTOGRAM_PRECISION = 0.01
+
+# Values below this (seconds) share the first histogram bucket
+HISTOGRAM_MIN_VALUE = 1e-6
+
+logger = logging.getLogger(__name__)
+
+# RequestStats of the request being sent by the current thread
+_current = threading.local()
+
+
+class RequestStats(object):  # pylint: disable=too-few-public-methods
+    """Measurements of a single MediaFireApi.request call
+
+    action -- "category/name" of the API method
+    started -- time.time() the call started
+    timings -- dict of seconds spent in each of PHASES:
+               queue -- waiting for the session lock
+               sign -- building and signing the query
+               connect -- establishing connections
+               send -- sending request headers and body
+               ttfb -- waiting for response headers
+               decode -- reading and parsing the response body
+    total -- seconds the whole call took, set when finished
+    bytes_out -- request body size
+    bytes_in -- response body size
+    retries -- connection attempts after the first one
+    status_code -- HTTP status, None if no response was received
+    error_code -- MediaFireApiError code, None on success
+    error -- exception raised by the call, None on success
+    """
+
+    def __init__(self, action):
+        self.action = action
+        self.started = time.time()
+        self.timings = dict((phase, 0.0) for phase in PHASES)
+        self.total = None
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.attempts = 0
+        self.status_code = None
+        self.error_code = None
+        self.error = None
+
+    @property
+    def retries(self):
+        """Connection attempts after the first one"""
+        return max(self.attempts - 1, 0)
+
+    def finish(self):
+        """Set total from the start time"""
+        self.total = time.time() - self.started
+
+    def attributes(self):
+        """Return dict of span attributes, see mediafire.tracing"""
+        result = {
+            'http.method': 'POST',
+            'http.status_code': self.status_code,
+            'mediafire.action': self.action,
+            'mediafire.error_code': self.error_code,
+            'mediafire.bytes_out': self.bytes_out,
+            'mediafire.bytes_in': self.bytes_in,
+            'mediafire.retries': self.retries
+        }
+
+        for phase in PHASES:
+            result['mediafire.time.' + phase] = self.timings[phase]
+
+        return dict((key, value) for key, value in result.items()
+                    if value is not None)
+
+
+class RequestObserver(object):
+    """Base class of MediaFireApi request observers
+
+    Both methods are called from the thread making the request. Exceptions
+    raised by observers are logged and otherwise ignored.
+
+    Example:
+
+        class SlowCallLogger(RequestObserver):
+            def request_finished(self, stats):
+                if stats.total > 1:
+                    logger.warning("%s took %.1fs", stats.action,
+                                   stats.total)
+
+        api = MediaFireApi(observers=[SlowCallLogger()])
+    """
+
+    def request_started(self, stats):
+        """Called before the request is built, stats is mostly empty"""
+        pass
+
+    def request_finished(self, stats):
+        """Called when the request completed or failed"""
+        pass
+
+
+def notify(observers, method, stats):
+    """Call method of every observer with stats, log observer errors"""
+    for observer in observers:
+        try:
+            getattr(observer, method)(stats)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Request observer %r failed", observer)
+
+
+@contextmanager
+def collecting(stats):
+    """Send connection timings of the current thread to stats"""
+    previous = getattr(_current, 'stats', None)
+    _current.stats = stats
+    try:
+        yield stats
+    finally:
+        _current.stats = previous
+
+
+def _record(phase, started):
+    """Add time since started to phase of the current RequestStats"""
+    stats = getattr(_current, 'stats', None)
+    if stats is not None:
+        stats.timings[phase] += time.time() - started
+
+
+class _TimedConnectionMixin(object):
+    """Time connect, send and response headers of a urllib3 connection"""
+
+    def connect(self):
+        """Connect, see HTTPConnection.connect"""
+        started = time.time()
+        try:
+            return super(_TimedConnectionMixin, self).connect()
+        finally:
+            _record('connect', started)
+
+    def request(self, *args, **kwargs):
+        """Send request, see HTTPConnection.request"""
+        stats = getattr(_current, 'stats', None)
+        if stats is None:
+            return super(_TimedConnectionMixin, self).request(*args, **kwargs)
+
+        stats.attempts += 1
+        started = time.time()
+        # connections are opened lazily while sending
+        connect_before = stats.timings['connect']
+        try:
+            return super(_TimedConnectionMixin, self).request(*args, **kwargs)
+        finally:
+            stats.timings['send'] += time.time() - started - (
+                stats.timings['connect'] - connect_before)
+
+    def getresponse(self, *args, **kwargs):
+        """Wait for response headers, see HTTPConnection.getresponse"""
+        started = time.time()
+        try:
+            return super(_TimedConnectionMixin, self).getresponse(*args,
+                                                                  **kwargs)
+        finally:
+            _record('ttfb', started)
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    """HTTPConnection with timings"""
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    """HTTPSConnection with timings"""
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    """HTTPConnectionPool of timed connections"""
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    """HTTPSConnectionPool of timed connections"""
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimingAdapter(HTTPAdapter):
+    """HTTPAdapter reporting connect, send and ttfb to RequestStats"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        """Create pool manager using timed connection pools"""
+        super(TimingAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool
+        }
+
+
+class Histogram(object):
+    """Histogram of non-negative values in logarithmic buckets
+
+    Memory does not grow with the number of values. Percentiles are
+    accurate to within precision of the true value.
+    """
+
+    def __init__(self, precision=HISTOGRAM_PRECISION,
+                 min_value=HISTOGRAM_MIN_VALUE):
+        """Initialize Histogram
+
+        precision -- relative error of reported values
+        min_value -- values up to this are counted in the first bucket
+        """
+        self.min_value = min_value
+        self._log_base = math.log(1 + precision)
+        self._buckets = {}
+
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        """Count value"""
+        if value <= self.min_value:
+            bucket = 0
+        else:
+            bucket = int(math.ceil(
+                math.log(value / self.min_value) / self._log_base))
+
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """Return value below which percent of values fall, None if empty"""
+        if not self.count:
+            return None
+
+        rank = max(int(math.ceil(percent / 100.0 * self.count)), 1)
+
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                break
+
+        # upper bound of the bucket, clamped by what was actually seen
+        value = self.min_value * math.exp(bucket * self._log_base)
+        return min(max(value, self.min), self.max)
+
+    def summary(self, percentiles=PERCENTILES):
+        """Return dict of count, mean, min, max and pNN values"""
+        result = {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max
+        }
+
+        for percent in percentiles:
+            result['p{}'.format(percent)] = self.percentile(percent)
+
+        return result
+
+
+class HistogramCollector(RequestObserver):
+    """Collect latency histograms per action and phase in memory
+
+    Example:
+
+        collector = HistogramCollector()
+        api = MediaFireApi(observers=[collector])
+        ...
+        print(collector.summary()['folder/get_content']['total']['p99'])
+    """
+
+    def __init__(self, precision=HISTOGRAM_PRECISION):
+        """Initialize HistogramCollector
+
+        precision -- relative error of reported values
+        """
+        self.precision = precision
+        self._lock = threading.Lock()
+        self._actions = {}
+
+    def _new_action(self):
+        """Return empty per-action record"""
+        histograms = dict((phase, Histogram(self.precision))
+                          for phase in PHASES + ('total',))
+        return {
+            'histograms': histograms,
+            'errors': 0,
+            'retries': 0,
+            'bytes_in': 0,
+            'bytes_out': 0
+        }
+
+    def request_finished(self, stats):
+        """Add stats to the histograms of stats.action"""
+        with self._lock:
+            record = self._actions.get(stats.action)
+            if record is None:
+                record = self._actions[stats.action] = self._new_action()
+
+            histograms = record['histograms']
+            histograms['total'].add(stats.total)
+            for phase in PHASES:
+                histograms[phase].add(stats.timings[phase])
+
+            if stats.error is not None:
+                record['errors'] += 1
+            record['retries'] += stats.retries
+            record['bytes_in'] += stats.bytes_in
+            record['bytes_out'] += stats.bytes_out
+
+    def histogram(self, action, phase='total'):
+        """Return Histogram of action and phase, None if not seen yet"""
+        with self._lock:
+            record = self._actions.get(action)
+            return record['histograms'][phase] if record else None
+
+    def summary(self, percentiles=PERCENTILES):
+        """Return dict of action to counters and histogram summaries
+
+        Each action maps to a dict with 'errors', 'retries', 'bytes_in',
+        'bytes_out' and a Histogram.summary() for 'total' and each phase.
+        """
+        result = {}
+        with self._lock:
+            for action, record in self._actions.items():
+                entry = dict((key, value) for key, value in record.items()
+                             if key != 'histograms')
+                for phase, histogram in record['histograms'].items():
+                    entry[phase] = histogram.summary(percentiles)
+                result[action] = entry
+
+        return result
+
+    def reset(self):
+        """Forget everything collected so far"""
+        with self._lock:
+            self._actions = {}
@@ -0,0 +1,336 @@
+"""Multi-client load generator for MediaFire API endpoints
+
+LoadGenerator runs N simulated clients, each with a session of its own,
+on a weighted mix of folder listings, path lookups, uploads and
+downloads, and reports throughput and latency percentiles per operation.
+It is meant for sizing worker pools against a stand-in or a staging
+endpoint:
+
+    generator = LoadGenerator(api_base=server.url, email=server.email,
+                              password=server.password,
+                              app_id=server.app_id, clients=8)
+    generator.setup()
+    report = generator.run(duration=30)
+    print(format_report(report))
+
+From the command line, against a local StandInServer:
+
+    python -m mediafire.loadgen --standin --latency 0.02 --clients 8 \\
+        --duration 30 --mix list=4,lookup=4,upload=1,download=1
+"""
+
+from __future__ import (print_function, unicode_literals)
+
+import argparse
+import bisect
+import io
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from mediafire.api import (MediaFireApi, API_BASE)
+from mediafire.client import MediaFireClient
+from mediafire.instrumentation import (Histogram, HistogramCollector)
+
+OPERATIONS = ('list', 'lookup', 'upload', 'download')
+
+# Relative weights of OPERATIONS
+DEFAULT_MIX = {'list': 4, 'lookup': 4, 'upload': 1, 'download': 1}
+
+# Size of uploaded and pre-seeded files
+DEFAULT_FILE_SIZE = 256 * 1024
+
+# Files created by setup() for lookups, listings and downloads
+SEED_FILES = 10
+
+REPORT_PERCENTILES = (50, 95, 99)
+
+WORKSPACE_URI = 'mf:///loadgen'
+
+logger = logging.getLogger(__name__)
+
+
+class _Operation(object):  # pylint: disable=too-few-public-methods
+    """Latency histogram and counters of one operation type"""
+
+    def __init__(self):
+        self.histogram = Histogram()
+        self.errors = 0
+        self.bytes = 0
+
+
+class LoadGenerator(object):
+    """Run concurrent clients against an API endpoint"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, api_base=API_BASE, email=None, password=None,
+                 app_id=None, clients=4, mix=None,
+                 file_size=DEFAULT_FILE_SIZE, seed=None):
+        """Initialize LoadGenerator
+
+        api_base -- scheme and host of the API
+        email, password, app_id -- credentials every client logs in with
+        clients -- number of concurrent clients
+        mix -- dict of operation name to relative weight, see DEFAULT_MIX
+        file_size -- bytes per uploaded file
+        seed -- random seed for the operation sequence of each client
+        """
+        self.api_base = api_base
+        self.credentials = {'email': email, 'password': password,
+                            'app_id': app_id}
+        self.clients = clients
+        self.file_size = file_size
+        self.seed = seed
+
+        mix = dict(mix or DEFAULT_MIX)
+        unknown = set(mix) - set(OPERATIONS)
+        if unknown:
+            raise ValueError("Unknown operations: {}".format(
+                ', '.join(sorted(unknown))))
+
+        self._operations = [name for name in OPERATIONS if mix.get(name)]
+        self._cumulative = []
+        total = 0
+        for name in self._operations:
+            total += mix[name]
+            self._cumulative.append(total)
+
+        self.collector = HistogramCollector()
+
+        self._lock = threading.Lock()
+        self._results = {}
+    # pylint: enable=too-many-arguments
+
+    def _client(self):
+        """Return logged in MediaFireClient with a session of its own"""
+        api = MediaFireApi(api_base=self.api_base,
+                           observers=[self.collector])
+        client = MediaFireClient(api=api)
+        client.login(**self.credentials)
+        return client
+
+    @staticmethod
+    def _seed_uri(index):
+        """Return URI of pre-seeded file index"""
+        return '{}/files/{}.bin'.format(WORKSPACE_URI, index)
+
+    def setup(self):
+        """Create the workspace folder and the files operations read"""
+        client = self._client()
+        client.create_folder(WORKSPACE_URI + '/files', recursive=True)
+        for index in range(self.clients):
+            client.create_folder('{}/client-{}'.format(WORKSPACE_URI, index),
+                                 recursive=True)
+
+        for index in range(SEED_FILES):
+            client.upload_file(io.BytesIO(os.urandom(self.file_size)),
+                               self._seed_uri(index))
+
+        self.collector.reset()
+
+    def _choose(self, rng):
+        """Return random operation name according to the mix"""
+        value = rng.random() * self._cumulative[-1]
+        return self._operations[bisect.bisect_right(self._cumulative, value)]
+
+    def _perform(self, client, name, rng, upload_uri):
+        """Run operation name once, return (bytes transferred, seconds)"""
+        seed_uri = self._seed_uri(rng.randrange(SEED_FILES))
+        # generated up front, so it is not part of the upload time
+        data = os.urandom(self.file_size) if name == 'upload' else None
+        target = io.BytesIO()
+
+        started = time.time()
+        if name == 'list':
+            list(client.get_folder_contents_iter(WORKSPACE_URI + '/files'))
+        elif name == 'lookup':
+            client.get_resource_by_uri(seed_uri)
+        elif name == 'upload':
+            client.upload_file(io.BytesIO(data), upload_uri)
+        else:
+            client.download_file(seed_uri, target)
+        seconds = time.time() - started
+
+        return (len(data) if data is not None else target.tell()), seconds
+
+    def _record(self, name, seconds, size=0, error=False):
+        """Add result of an operation"""
+        with self._lock:
+            operation = self._results.get(name)
+            if operation is None:
+                operation = self._results[name] = _Operation()
+
+            if error:
+                operation.errors += 1
+            else:
+                operation.histogram.add(seconds)
+                operation.bytes += size
+
+    def _run_client(self, index, deadline, operations):
+        """Run operations of client index until deadline or count"""
+        rng = random.Random(None if self.seed is None else self.seed + index)
+        client = self._client()
+
+        count = 0
+        while (deadline is None or time.time() < deadline) and \
+                (operations is None or count < operations):
+            name = self._choose(rng)
+            upload_uri = '{}/client-{}/{}.bin'.format(WORKSPACE_URI, index,
+                                                      count)
+            count += 1
+
+            try:
+                size, seconds = self._perform(client, name, rng, upload_uri)
+            except Exception:  # pylint: disable=broad-except
+                logger.debug("%s failed", name, exc_info=True)
+                self._record(name, None, error=True)
+            else:
+                self._record(name, seconds, size)
+
+    def run(self, duration=None, operations=None):
+        """Run all clients, return report, see format_report()
+
+        duration -- seconds to keep running
+        operations -- operations per client
+
+        At least one of duration and operations is required.
+        """
+        if duration is None and operations is None:
+            raise ValueError("duration or operations is required")
+
+        with self._lock:
+            self._results = {}
+        self.collector.reset()
+
+        started = time.time()
+        deadline = started + duration if duration is not None else None
+
+        with ThreadPoolExecutor(max_workers=self.clients) as executor:
+            futures = [executor.submit(self._run_client, index, deadline,
+                                       operations)
+                       for index in range(self.clients)]
+            for future in futures:
+                # raise login failures
+                future.result()
+
+        return self.report(time.time() - started)
+
+    def report(self, elapsed):
+        """Return dict with per-operation and per-API-call statistics
+
+        Each operation maps to count, errors, throughput (operations per
+        second), bytes, bandwidth (bytes per second) and latency summary
+        values in seconds: mean, min, max and p50, p95, p99.
+        """
+        operations = {}
+        with self._lock:
+            for name, operation in self._results.items():
+                entry = operation.histogram.summary(REPORT_PERCENTILES)
+                entry.update({
+                    'errors': operation.errors,
+                    'throughput': entry['count'] / elapsed,
+                    'bytes': operation.bytes,
+                    'bandwidth': operation.bytes / elapsed
+                })
+                operations[name] = entry
+
+        return {
+            'clients': self.clients,
+            'elapsed': elapsed,
+            'operations': operations,
+            'api': self.collector.summary(REPORT_PERCENTILES)
+        }
+
+
+def _milliseconds(value):
+    """Format seconds as milliseconds, '-' if unknown"""
+    return '-' if value is None else '{:.1f}'.format(value * 1000)
+
+
+def format_report(report):
+    """Return report of LoadGenerator.run() as a text table"""
+    lines = [
+        "{} clients, {:.1f}s".format(report['clients'], report['elapsed']),
+        "{:<10} {:>7} {:>7} {:>9} {:>9} {:>9} {:>9}".format(
+            'operation', 'count', 'errors', 'ops/s', 'p50 ms', 'p95 ms',
+            'p99 ms')
+    ]
+
+    for name in OPERATIONS:
+        entry = report['operations'].get(name)
+        if entry is None:
+            continue
+        lines.append(
+            "{:<10} {:>7} {:>7} {:>9.1f} {:>9} {:>9} {:>9}".format(
+                name, entry['count'], entry['errors'], entry['throughput'],
+                _milliseconds(entry['p50']), _milliseconds(entry['p95']),
+                _milliseconds(entry['p99'])))
+
+    return '\n'.join(lines)
+
+
+def _parse_mix(value):
+    """Parse "list=4,upload=1" into a dict"""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(prog='python -m mediafire.loadgen',
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument('--api-base', default=API_BASE)
+    parser.add_argument('--email')
+    parser.add_argument('--password')
+    parser.add_argument('--app-id')
+    parser.add_argument('--standin', action='store_true',
+                        help='Run against a local StandInServer')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='StandInServer latency in seconds')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--mix', type=_parse_mix, default=DEFAULT_MIX,
+                        help='Operation weights, e.g. list=4,upload=1')
+    parser.add_argument('--file-size', type=int, default=DEFAULT_FILE_SIZE)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', action='store_true',
+                        help='Print the full report as JSON')
+
+    args = parser.parse_args(argv)
+
+    options = {'api_base': args.api_base, 'email': args.email,
+               'password': args.password, 'app_id': args.app_id}
+
+    server = None
+    if args.standin:
+        from mediafire.standin import StandInServer
+        server = StandInServer(latency=args.latency).start()
+        options = {'api_base': server.url, 'email': server.email,
+                   'password': server.password, 'app_id': server.app_id}
+
+    try:
+        generator = LoadGenerator(clients=args.clients, mix=args.mix,
+                                  file_size=args.file_size, seed=args.seed,
+                                  **options)
+        generator.setup()
+        report = generator.run(duration=args.duration)
+    finally:
+        if server is not None:
+            server.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print(format_report(report))
+
+
+if __name__ == '__main__':
+    main()
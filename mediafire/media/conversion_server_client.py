@@ -9,7 +9,10 @@ import requests
 
 from six.moves.urllib.parse import urlencode
 
-from mediafire.api import QueryParams
+from requests.exceptions import RequestException
+
+from mediafire import deadline
+from mediafire.api import (QueryParams, API_TIMEOUT)
 
 logger = logging.getLogger(__name__)
 
@@ -30,8 +33,14 @@ class ConversionServerError(Exception):
 class ConversionServerClient(object):
     """Conversion Server client"""
 
-    def __init__(self):
+    def __init__(self, timeout=API_TIMEOUT):
+        """Initialize ConversionServerClient
+
+        timeout -- requests timeout, seconds or (connect, read) tuple,
+                   None to wait forever, see also mediafire.deadline
+        """
         self.http = requests.Session()
+        self.timeout = timeout
 
     def request(self, hash_, quickkey, doc_type, page=None,
                 output=None, size_id=None, metadata=None,
@@ -65,7 +74,14 @@ class ConversionServerClient(object):
 
         url = API_ENDPOINT + '?' + hash_ + '&' + urlencode(query)
 
-        response = self.http.get(url, stream=True)
+        deadline.check()
+        try:
+            response = self.http.get(
+                url, stream=True,
+                timeout=deadline.request_timeout(self.timeout))
+        except RequestException:
+            deadline.check()
+            raise
 
         if response.status_code == 204:
             raise ConversionServerError("Unable to fulfill request. "
@@ -0,0 +1,510 @@
+"""Local SQLite mirror of MediaFire folder tree metadata"""
+
+from __future__ import unicode_literals
+
+import json
+import logging
+import posixpath
+import sqlite3
+import time
+
+from threading import RLock
+
+logger = logging.getLogger(__name__)
+
+# state key holding the device revision the mirror is in sync with
+STATE_DEVICE_REVISION = 'device_revision'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    folderkey TEXT PRIMARY KEY,
+    parent_folderkey TEXT,
+    name TEXT,
+    path TEXT,
+    info TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    listed_at REAL
+);
+CREATE INDEX IF NOT EXISTS folders_parent ON folders (parent_folderkey);
+CREATE INDEX IF NOT EXISTS folders_path ON folders (path);
+
+CREATE TABLE IF NOT EXISTS files (
+    quickkey TEXT PRIMARY KEY,
+    parent_folderkey TEXT,
+    filename TEXT,
+    path TEXT,
+    hash TEXT,
+    size INTEGER,
+    info TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_parent ON files (parent_folderkey);
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+CREATE INDEX IF NOT EXISTS files_hash ON files (hash);
+
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Folder subtree, including the folder itself
+SUBTREE_QUERY = """
+WITH RECURSIVE subtree(folderkey) AS (
+    VALUES (?)
+    UNION
+    SELECT folders.folderkey FROM folders
+        JOIN subtree ON folders.parent_folderkey = subtree.folderkey
+)
+"""
+
+
+def device_changes_iter(api, revision):
+    """Yield (next_revision, changes) for device/get_changes blocks
+
+    api -- MediaFireApi instance
+    revision -- last device revision seen
+
+    Changes are requested block by block until the current device
+    revision reported by device/get_status is reached.
+    """
+    status = api.device_get_status()['device_status']
+    target = int(status['device_revision'])
+
+    while revision < target:
+        changes = api.device_get_changes(revision=revision)
+
+        target = max(target, int(changes.get('device_revision', target)))
+
+        block = int(changes.get('changes_list_block', 0))
+        if block > 0:
+            revision = min(revision + block, target)
+        else:
+            revision = target
+
+        yield revision, changes
+
+
+def _parents_first(folders):
+    """Return folder changes ordered so that each comes after the change
+    of its parent folder, if that is part of the same block
+    """
+    by_key = dict((change['folderkey'], change) for change in folders)
+
+    result = []
+    seen = set()
+    for change in folders:
+        ancestors = []
+        while change is not None and change['folderkey'] not in seen:
+            seen.add(change['folderkey'])
+            ancestors.append(change)
+            change = by_key.get(change.get('parent_folderkey'))
+        result.extend(reversed(ancestors))
+
+    return result
+
+
+class MetadataMirror(object):
+    """Local mirror of folder and file metadata.
+
+    Implements the ListingCache interface (get, put, invalidate), so it
+    can be passed to MediaFireClient.walk or set as MediaFireClient.mirror
+    to serve lookups and listings locally.
+    """
+
+    def __init__(self, path=':memory:', max_age=None):
+        """Initialize MetadataMirror
+
+        path -- SQLite database path
+        max_age -- seconds an entry may be served, None for no expiry
+        """
+        self.max_age = max_age
+
+        self._lock = RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        """Close database connection"""
+        with self._lock:
+            self._db.close()
+
+    def _is_fresh(self, timestamp):
+        """Check that timestamp is within max_age"""
+        if timestamp is None:
+            return False
+        if self.max_age is None:
+            return True
+        return time.time() - timestamp <= self.max_age
+
+    @staticmethod
+    def _to_resource(table, row):
+        """Convert database row to File or Folder"""
+        # Avoid circular import, client imports us for type checks
+        from mediafire.client import (File, Folder)
+
+        info = json.loads(row['info'])
+        if table == 'files':
+            return File(info)
+        return Folder(info)
+
+    def _store_folder(self, info, path, timestamp):
+        """Insert or replace folder row"""
+        self._db.execute(
+            'INSERT OR REPLACE INTO folders (folderkey, parent_folderkey,'
+            ' name, path, info, updated_at, listed_at) VALUES'
+            ' (?, ?, ?, ?, ?, ?, (SELECT listed_at FROM folders'
+            '  WHERE folderkey = ?))',
+            (info['folderkey'], info.get('parent_folderkey'),
+             info.get('name'), path, json.dumps(info), timestamp,
+             info['folderkey']))
+
+    def _store_file(self, info, path, timestamp):
+        """Insert or replace file row"""
+        size = info.get('size')
+        self._db.execute(
+            'INSERT OR REPLACE INTO files (quickkey, parent_folderkey,'
+            ' filename, path, hash, size, info, updated_at) VALUES'
+            ' (?, ?, ?, ?, ?, ?, ?, ?)',
+            (info['quickkey'], info.get('parent_folderkey'),
+             info.get('filename'), path, info.get('hash'),
+             int(size) if size is not None else None,
+             json.dumps(info), timestamp))
+
+    def _folder_path(self, folder_key):
+        """Return mirrored path of folder_key or None"""
+        row = self._db.execute(
+            'SELECT path FROM folders WHERE folderkey = ?',
+            (folder_key,)).fetchone()
+        return row['path'] if row is not None else None
+
+    def _delete_folder(self, folder_key):
+        """Delete folder with all mirrored descendants"""
+        self._db.execute(
+            SUBTREE_QUERY + 'DELETE FROM files WHERE parent_folderkey IN'
+            ' (SELECT folderkey FROM subtree)', (folder_key,))
+        self._db.execute(
+            SUBTREE_QUERY + 'DELETE FROM folders WHERE folderkey IN'
+            ' (SELECT folderkey FROM subtree)', (folder_key,))
+
+    def set_root(self, folder):
+        """Register root folder of the account under path '/'
+
+        folder -- Folder returned by folder/get_info for the root
+        """
+        with self._lock, self._db:
+            self._store_folder(dict(folder), '/', time.time())
+
+    def get(self, folder_key):
+        """Return (files, folders) listing or None if missing or stale"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT listed_at FROM folders WHERE folderkey = ?',
+                (folder_key,)).fetchone()
+
+            if row is None or not self._is_fresh(row['listed_at']):
+                return None
+
+            files = [self._to_resource('files', item) for item in
+                     self._db.execute(
+                         'SELECT info FROM files WHERE parent_folderkey = ?'
+                         ' ORDER BY rowid', (folder_key,))]
+            folders = [self._to_resource('folders', item) for item in
+                       self._db.execute(
+                           'SELECT info FROM folders'
+                           ' WHERE parent_folderkey = ? ORDER BY rowid',
+                           (folder_key,))]
+
+        return files, folders
+
+    def put(self, folder_key, files, folders):
+        """Replace mirrored listing of folder_key
+
+        files -- list of File resources from folder/get_content
+        folders -- list of Folder resources from folder/get_content
+        """
+        timestamp = time.time()
+
+        with self._lock, self._db:
+            parent_path = self._folder_path(folder_key)
+
+            def child_path(name):
+                """Path of a child or None if parent path is unknown"""
+                if parent_path is None:
+                    return None
+                return posixpath.join(parent_path, name)
+
+            folder_keys = set(item['folderkey'] for item in folders)
+            for row in self._db.execute(
+                    'SELECT folderkey FROM folders'
+                    ' WHERE parent_folderkey = ?', (folder_key,)).fetchall():
+                if row['folderkey'] not in folder_keys:
+                    self._delete_folder(row['folderkey'])
+
+            self._db.execute(
+                'DELETE FROM files WHERE parent_folderkey = ?', (folder_key,))
+
+            for item in folders:
+                info = dict(item)
+                info.setdefault('parent_folderkey', folder_key)
+                self._store_folder(info, child_path(info['name']), timestamp)
+
+            for item in files:
+                info = dict(item)
+                info.setdefault('parent_folderkey', folder_key)
+                self._store_file(info, child_path(info['filename']),
+                                 timestamp)
+
+            # folder row may be missing if we were not crawling from root
+            self._db.execute(
+                'INSERT OR IGNORE INTO folders (folderkey, info, updated_at)'
+                ' VALUES (?, ?, ?)',
+                (folder_key, json.dumps({'folderkey': folder_key}),
+                 timestamp))
+            self._db.execute(
+                'UPDATE folders SET listed_at = ? WHERE folderkey = ?',
+                (timestamp, folder_key))
+
+    def invalidate(self, folder_key=None):
+        """Mark listing of folder_key, or all listings, as stale"""
+        with self._lock, self._db:
+            if folder_key is None:
+                self._db.execute('UPDATE folders SET listed_at = NULL')
+            else:
+                self._db.execute(
+                    'UPDATE folders SET listed_at = NULL'
+                    ' WHERE folderkey = ?', (folder_key,))
+
+    def add(self, resource):
+        """Add or update a single File or Folder
+
+        resource must have parent_folderkey set to be found by path.
+        """
+        timestamp = time.time()
+
+        with self._lock, self._db:
+            parent_path = self._folder_path(resource.get('parent_folderkey'))
+
+            if 'quickkey' in resource:
+                name = resource.get('filename')
+                store = self._store_file
+            else:
+                name = resource.get('name')
+                store = self._store_folder
+
+            path = None
+            if parent_path is not None and name is not None:
+                path = posixpath.join(parent_path, name)
+
+            store(dict(resource), path, timestamp)
+
+    def remove(self, key):
+        """Remove File by quickkey or Folder (with subtree) by folderkey"""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM files WHERE quickkey = ?', (key,))
+            self._delete_folder(key)
+
+    def get_by_key(self, key):
+        """Return File or Folder by quickkey/folderkey or None"""
+        with self._lock:
+            for table, column in [('files', 'quickkey'),
+                                  ('folders', 'folderkey')]:
+                row = self._db.execute(
+                    'SELECT info, updated_at FROM {} WHERE {} = ?'.format(
+                        table, column), (key,)).fetchone()
+                if row is not None and self._is_fresh(row['updated_at']):
+                    return self._to_resource(table, row)
+
+        return None
+
+    def get_by_path(self, path):
+        """Return File or Folder by absolute path or None"""
+        path = posixpath.normpath(path)
+        if path.startswith('//'):
+            # normpath keeps the leading double slash
+            path = path[1:]
+
+        with self._lock:
+            for table in ['folders', 'files']:
+                row = self._db.execute(
+                    'SELECT info, updated_at FROM {} WHERE path = ?'.format(
+                        table), (path,)).fetchone()
+                if row is not None and self._is_fresh(row['updated_at']):
+                    return self._to_resource(table, row)
+
+        return None
+
+    def find_by_hash(self, hash_):
+        """Return list of Files with the given sha256 hash"""
+        with self._lock:
+            return [self._to_resource('files', row) for row in
+                    self._db.execute('SELECT info FROM files WHERE hash = ?',
+                                     (hash_,))]
+
+    def _update_paths(self, folder_key, path):
+        """Set folder path and recompute paths of its subtree"""
+        self._db.execute('UPDATE folders SET path = ? WHERE folderkey = ?',
+                         (path, folder_key))
+
+        for row in self._db.execute(
+                'SELECT quickkey, filename FROM files'
+                ' WHERE parent_folderkey = ?', (folder_key,)).fetchall():
+            self._db.execute(
+                'UPDATE files SET path = ? WHERE quickkey = ?',
+                (posixpath.join(path, row['filename'])
+                 if path is not None else None, row['quickkey']))
+
+        for row in self._db.execute(
+                'SELECT folderkey, name FROM folders'
+                ' WHERE parent_folderkey = ?', (folder_key,)).fetchall():
+            self._update_paths(row['folderkey'],
+                               posixpath.join(path, row['name'])
+                               if path is not None else None)
+
+    def _apply_updated_folder(self, change, timestamp):
+        """Merge device/get_changes folder entry into the mirror"""
+        folder_key = change['folderkey']
+
+        row = self._db.execute(
+            'SELECT info, path FROM folders WHERE folderkey = ?',
+            (folder_key,)).fetchone()
+
+        info = json.loads(row['info']) if row is not None else {}
+        info.update(change)
+
+        parent_path = self._folder_path(info.get('parent_folderkey'))
+        path = None
+        if parent_path is not None and info.get('name') is not None:
+            path = posixpath.join(parent_path, info['name'])
+
+        self._store_folder(info, path, timestamp)
+
+        if row is not None and row['path'] != path:
+            # renamed or moved
+            self._update_paths(folder_key, path)
+
+    def _apply_updated_file(self, change, timestamp, api=None):
+        """Merge device/get_changes file entry into the mirror"""
+        quick_key = change['quickkey']
+
+        row = self._db.execute(
+            'SELECT info FROM files WHERE quickkey = ?',
+            (quick_key,)).fetchone()
+
+        info = json.loads(row['info']) if row is not None else {}
+
+        if api is not None and (
+                row is None or info.get('revision') != change.get('revision')):
+            # content may have changed, changes do not carry hash and size
+            info = api.file_get_info(quick_key=quick_key)['file_info']
+
+        info.update(change)
+
+        parent_path = self._folder_path(info.get('parent_folderkey'))
+        path = None
+        if parent_path is not None and info.get('filename') is not None:
+            path = posixpath.join(parent_path, info['filename'])
+
+        self._store_file(info, path, timestamp)
+
+    def apply_changes(self, changes, api=None):
+        """Apply a device/get_changes response to the mirror
+
+        changes -- device/get_changes response
+        api -- MediaFireApi to fetch full info of changed files
+        """
+        timestamp = time.time()
+
+        updated = changes.get('updated', {})
+        deleted = changes.get('deleted', {})
+
+        with self._lock, self._db:
+            # parents first, so that children paths can be computed
+            for change in _parents_first(updated.get('folders', [])):
+                self._apply_updated_folder(change, timestamp)
+
+            for change in updated.get('files', []):
+                self._apply_updated_file(change, timestamp, api=api)
+
+            for change in deleted.get('files', []):
+                self._db.execute('DELETE FROM files WHERE quickkey = ?',
+                                 (change['quickkey'],))
+
+            for change in deleted.get('folders', []):
+                self._delete_folder(change['folderkey'])
+
+    def sync(self, client):
+        """Bring the mirror up to date using device revision changes
+
+        client -- MediaFireClient instance
+
+        Only changes since the last synchronized device revision are
+        fetched. Falls back to a full build if the mirror has never been
+        built.
+        """
+        revision = self.get_state(STATE_DEVICE_REVISION)
+
+        if revision is None:
+            self.build(client)
+            return
+
+        revision = int(revision)
+        for revision, changes in device_changes_iter(client.api, revision):
+            self.apply_changes(changes, api=client.api)
+            self.set_state(STATE_DEVICE_REVISION, str(revision))
+
+        # everything mirrored is now current as of this revision
+        timestamp = time.time()
+        with self._lock, self._db:
+            self._db.execute('UPDATE folders SET updated_at = ?', (timestamp,))
+            self._db.execute(
+                'UPDATE folders SET listed_at = ?'
+                ' WHERE listed_at IS NOT NULL', (timestamp,))
+            self._db.execute('UPDATE files SET updated_at = ?', (timestamp,))
+
+        logger.info("Mirror synchronized to revision %d", revision)
+
+    def get_state(self, key, default=None):
+        """Return stored mirror state value"""
+        with self._lock:
+            row = self._db.execute('SELECT value FROM state WHERE key = ?',
+                                   (key,)).fetchone()
+        return row['value'] if row is not None else default
+
+    def set_state(self, key, value):
+        """Store mirror state value"""
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)',
+                (key, value))
+
+    def build(self, client, max_workers=None):
+        """Populate the mirror by crawling the whole account
+
+        client -- MediaFireClient instance
+        max_workers -- number of folders listed concurrently
+        """
+        # Avoid circular import
+        from mediafire.client import CRAWL_MAX_WORKERS
+
+        if max_workers is None:
+            max_workers = CRAWL_MAX_WORKERS
+
+        # changes made during the crawl will be replayed by sync()
+        status = client.api.device_get_status()['device_status']
+
+        root = client.get_resource_by_uri('mf:///')
+        self.set_root(root)
+        self.invalidate()
+
+        count = 0
+        for _ in client.walk('mf:///', max_workers=max_workers, cache=self):
+            count += 1
+
+        self.set_state(STATE_DEVICE_REVISION, status['device_revision'])
+
+        logger.info("Mirrored %d folders", count)
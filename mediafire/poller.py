@@ -0,0 +1,153 @@
+"""UploadPoller - poll many upload keys from a single thread"""
+
+from __future__ import unicode_literals
+
+import heapq
+import itertools
+import threading
+import time
+
+from concurrent.futures import Future
+
+from mediafire import deadline
+from mediafire.uploader import (upload_poll_intervals, _check_poll_status,
+                                _poll_upload_result)
+
+
+class _PendingPoll(object):  # pylint: disable=too-few-public-methods
+    """Upload key waiting in UploadPoller"""
+
+    def __init__(self, upload_key, action, future, stats=None):
+        self.upload_key = upload_key
+        self.action = action
+        self.future = future
+        self.stats = stats
+        self.intervals = upload_poll_intervals()
+        self.submitted = time.time()
+        # deadline of the submitting thread applies to the polls
+        self.deadline = deadline.current()
+
+
+class UploadPoller(object):
+    """Poll many upload keys from a single thread
+
+    Uploader threads hand the upload key over with submit() and are free
+    to start the next transfer. Each key is polled on the
+    upload_poll_intervals() schedule and the returned Future resolves to
+    UploadResult.
+
+    Example:
+
+        with UploadPoller(api) as poller:
+            future = poller.submit(upload_key, 'upload/simple')
+            future.add_done_callback(callback)
+    """
+
+    def __init__(self, api):
+        """Initialize UploadPoller
+
+        api -- MediaFireApi instance
+        """
+        self._api = api
+        self._queue = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_details):
+        self.close()
+
+    def submit(self, upload_key, action, stats=None):
+        """Start polling upload_key, return Future of UploadResult
+
+        stats -- UploadStats to record polls in and attach to the result
+        """
+        future = Future()
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("UploadPoller is closed")
+
+            self._schedule(time.time(), _PendingPoll(upload_key, action,
+                                                     future, stats))
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='UploadPoller')
+                self._thread.daemon = True
+                self._thread.start()
+
+        return future
+
+    def close(self):
+        """Wait for outstanding polls and stop the polling thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+
+        if thread is not None:
+            thread.join()
+
+    def _schedule(self, due, pending):
+        """Queue next poll of _PendingPoll, caller holds the lock
+
+        Polls are not scheduled past the deadline of the upload, the poll
+        at the deadline fails it with DeadlineExceeded.
+        """
+        if pending.deadline is not None:
+            remaining = pending.deadline.remaining()
+            if remaining is not None:
+                due = min(due, time.time() + max(remaining, 0))
+
+        heapq.heappush(self._queue, (due, next(self._counter), pending))
+        self._cond.notify()
+
+    def _run(self):
+        """Polling loop"""
+        while True:
+            with self._cond:
+                while True:
+                    if not self._queue:
+                        if self._closed:
+                            return
+                        self._cond.wait()
+                        continue
+
+                    delay = self._queue[0][0] - time.time()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+
+                _, _, pending = heapq.heappop(self._queue)
+
+            if pending.future.cancelled():
+                continue
+
+            stats = pending.stats
+            if stats is not None:
+                stats.poll_count += 1
+
+            try:
+                with deadline.use(pending.deadline):
+                    doupload = self._api.upload_poll(
+                        pending.upload_key)['doupload']
+                finished = _check_poll_status(pending.upload_key, doupload)
+            except Exception as ex:  # pylint: disable=broad-except
+                pending.future.set_exception(ex)
+                continue
+
+            if finished:
+                if stats is not None:
+                    stats.poll_time = time.time() - pending.submitted
+                    stats.finish()
+                pending.future.set_result(
+                    _poll_upload_result(doupload, pending.action, stats))
+            else:
+                with self._cond:
+                    self._schedule(time.time() + next(pending.intervals),
+                                   pending)
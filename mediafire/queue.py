@@ -0,0 +1,505 @@
+"""Persistent upload queue backed by SQLite"""
+
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+
+from collections import namedtuple
+from threading import (Event, Lock, RLock, Thread)
+
+from mediafire.uploader import MediaFireUploader
+
+# Leased item is handed out again if not acknowledged within (seconds)
+LEASE_TIMEOUT = 3600
+
+# Attempts before an item is marked as failed
+MAX_ATTEMPTS = 5
+
+# First retry delay, doubled with each attempt up to RETRY_DELAY_MAX
+RETRY_DELAY = 5
+RETRY_DELAY_MAX = 600
+
+# Idle worker checks the queue this often (seconds)
+QUEUE_POLL_INTERVAL = 1
+
+# Lifespan of the upload action token shared by the workers (minutes)
+ACTION_TOKEN_LIFESPAN = 1440
+
+UPLOAD_WORKERS = 4
+
+STATE_PENDING = 'pending'
+STATE_LEASED = 'leased'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    dest_uri TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL,
+    lease_expires REAL,
+    lease_id TEXT,
+    last_error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_ready ON items (state, priority, not_before);
+"""
+
+# Columns added since the first release, for databases created before
+MIGRATIONS = {
+    'lease_id': 'ALTER TABLE items ADD COLUMN lease_id TEXT'
+}
+
+# Items that may be leased now: pending and due, or abandoned by a worker
+READY_CONDITION = """
+    (state = 'pending' AND not_before <= :now) OR
+    (state = 'leased' AND lease_expires <= :now)
+"""
+
+QueueItem = namedtuple('QueueItem', [
+    'id',
+    'source',
+    'dest_uri',
+    'priority',
+    # number of times the item has been leased, including this one
+    'attempts',
+    # identifies this lease, ack() and nack() of an expired lease that was
+    # handed out again are ignored
+    'lease_id'
+])
+
+
+class UploadQueue(object):
+    """Durable queue of (source, dest_uri) uploads
+
+    Items are leased to workers and removed from the backlog only when
+    acknowledged, so an item leased by a worker that died is handed out
+    again once the lease expires (at-least-once delivery). Items with
+    higher priority are leased first, failed items are retried with
+    exponential backoff up to max_attempts.
+
+    The database may be shared by several processes.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, path=':memory:', lease_timeout=LEASE_TIMEOUT,
+                 max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY,
+                 retry_delay_max=RETRY_DELAY_MAX):
+        """Initialize UploadQueue
+
+        path -- SQLite database path
+        lease_timeout -- seconds before an unacknowledged item is
+                         handed out again
+        max_attempts -- attempts before the item is marked as failed
+        retry_delay -- delay before the first retry, doubled with
+                       every subsequent attempt
+        retry_delay_max -- upper bound of the retry delay
+        """
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retry_delay_max = retry_delay_max
+
+        self._lock = RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+            columns = set(row['name'] for row in
+                          self._db.execute('PRAGMA table_info(items)'))
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    self._db.execute(statement)
+    # pylint: enable=too-many-arguments
+
+    def close(self):
+        """Close database connection"""
+        with self._lock:
+            self._db.close()
+
+    def put(self, source, dest_uri, priority=0):
+        """Add upload to the queue, return item id
+
+        source -- path to the file
+        dest_uri -- MediaFire file URI, or folder URI ending with '/'
+        priority -- items with higher priority are uploaded first
+        """
+        now = time.time()
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                'INSERT INTO items (source, dest_uri, priority, state,'
+                ' not_before, created_at, updated_at) VALUES'
+                ' (?, ?, ?, ?, ?, ?, ?)',
+                (source, dest_uri, priority, STATE_PENDING, now, now, now))
+            return cursor.lastrowid
+
+    def lease(self):
+        """Lease the next item, return QueueItem or None if none is due
+
+        An item whose lease expired on the last attempt, e.g. because
+        uploading it crashes the worker, is marked as failed instead.
+        """
+        with self._lock:
+            while True:
+                now = time.time()
+                row = self._db.execute(
+                    'SELECT id, source, dest_uri, priority, attempts, state'
+                    ' FROM items WHERE' + READY_CONDITION +
+                    ' ORDER BY priority DESC, id LIMIT 1',
+                    {'now': now}).fetchone()
+
+                if row is None:
+                    return None
+
+                expired = row['state'] == STATE_LEASED
+                if expired and row['attempts'] >= self.max_attempts:
+                    # another process may have failed it in the meantime
+                    with self._db:
+                        cursor = self._db.execute(
+                            'UPDATE items SET state = ?, lease_expires = NULL,'
+                            ' lease_id = NULL, last_error = ?, updated_at = ?'
+                            ' WHERE id = ? AND state = ? AND attempts = ?',
+                            (STATE_FAILED, "Lease expired", now, row['id'],
+                             row['state'], row['attempts']))
+                    if cursor.rowcount == 1:
+                        logger.error("Lease of item %d expired on the last"
+                                     " attempt, giving up", row['id'])
+                    continue
+
+                lease_id = uuid.uuid4().hex
+
+                # another process may have leased it in the meantime
+                with self._db:
+                    cursor = self._db.execute(
+                        'UPDATE items SET state = ?, attempts = attempts + 1,'
+                        ' lease_expires = ?, lease_id = ?, updated_at = ?'
+                        ' WHERE id = ? AND state = ? AND attempts = ?',
+                        (STATE_LEASED, now + self.lease_timeout, lease_id,
+                         now, row['id'], row['state'], row['attempts']))
+
+                if cursor.rowcount != 1:
+                    continue
+
+                if expired:
+                    logger.warning("Lease of item %d expired, retrying",
+                                   row['id'])
+                return QueueItem(id=row['id'], source=row['source'],
+                                 dest_uri=row['dest_uri'],
+                                 priority=row['priority'],
+                                 attempts=row['attempts'] + 1,
+                                 lease_id=lease_id)
+
+    def _release(self, item, assignments, params):
+        """Update item if it still holds its lease, return True if so"""
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                'UPDATE items SET lease_expires = NULL, lease_id = NULL, ' +
+                assignments + ' WHERE id = ? AND state = ? AND lease_id = ?',
+                params + (item.id, STATE_LEASED, item.lease_id))
+
+        if cursor.rowcount != 1:
+            logger.warning("Lease of item %d was lost, ignoring outcome",
+                           item.id)
+            return False
+        return True
+
+    def ack(self, item, result=None):
+        """Mark item as uploaded, return False if the lease was lost
+
+        item -- QueueItem
+        result -- dict to store with the item, e.g. UploadResult._asdict()
+        """
+        return self._release(
+            item, 'state = ?, last_error = NULL, result = ?, updated_at = ?',
+            (STATE_DONE, json.dumps(result), time.time()))
+
+    def retry_delay_for(self, attempts):
+        """Return delay before the next attempt after attempts failures"""
+        return min(self.retry_delay * 2 ** (attempts - 1),
+                   self.retry_delay_max)
+
+    def nack(self, item, error, retry=True):
+        """Record failed attempt, return True if the item will be retried
+
+        The item is retried by the worker holding it now if the lease
+        was lost.
+
+        item -- QueueItem
+        error -- exception or message describing the failure
+        retry -- False for errors that will not go away on retry
+        """
+        now = time.time()
+        retry = retry and item.attempts < self.max_attempts
+
+        if retry:
+            state = STATE_PENDING
+            not_before = now + self.retry_delay_for(item.attempts)
+        else:
+            state = STATE_FAILED
+            not_before = now
+
+        if not self._release(
+                item, 'state = ?, not_before = ?, last_error = ?,'
+                ' updated_at = ?',
+                (state, not_before, '{}'.format(error), now)):
+            return True
+
+        return retry
+
+    def requeue_failed(self):
+        """Reset failed items to pending, return number of items"""
+        now = time.time()
+        with self._lock, self._db:
+            return self._db.execute(
+                'UPDATE items SET state = ?, attempts = 0, not_before = ?,'
+                ' updated_at = ? WHERE state = ?',
+                (STATE_PENDING, now, now, STATE_FAILED)).rowcount
+
+    def purge(self, state=STATE_DONE):
+        """Delete items in state, return number of items"""
+        with self._lock, self._db:
+            return self._db.execute('DELETE FROM items WHERE state = ?',
+                                    (state,)).rowcount
+
+    def get(self, item_id):
+        """Return item row as dict or None"""
+        with self._lock:
+            row = self._db.execute('SELECT * FROM items WHERE id = ?',
+                                   (item_id,)).fetchone()
+
+        if row is None:
+            return None
+
+        item = dict(zip(row.keys(), row))
+        if item['result'] is not None:
+            item['result'] = json.loads(item['result'])
+        return item
+
+    def stats(self):
+        """Return dict of item counts by state"""
+        counts = dict((state, 0) for state in (STATE_PENDING, STATE_LEASED,
+                                               STATE_DONE, STATE_FAILED))
+        with self._lock:
+            for row in self._db.execute(
+                    'SELECT state, COUNT(*) FROM items GROUP BY state'):
+                counts[row[0]] = row[1]
+        return counts
+
+    def outstanding(self):
+        """Return number of items not yet done or failed"""
+        counts = self.stats()
+        return counts[STATE_PENDING] + counts[STATE_LEASED]
+
+    def next_due(self):
+        """Return seconds until the next item is due, None if none"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT MIN(CASE state WHEN ? THEN not_before'
+                ' ELSE lease_expires END) FROM items WHERE state IN (?, ?)',
+                (STATE_PENDING, STATE_PENDING, STATE_LEASED)).fetchone()
+
+        if row[0] is None:
+            return None
+        return max(row[0] - time.time(), 0)
+
+
+class QueueMetrics(object):
+    """Throughput counters of an UploadWorkerPool"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.started = time.time()
+        self.uploaded = 0
+        self.failed = 0
+        self.retried = 0
+        self.bytes_uploaded = 0
+
+    def record(self, outcome, size=0):
+        """Count item outcome: uploaded, retried or failed"""
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            if outcome == 'uploaded':
+                # sizes in API responses are strings
+                self.bytes_uploaded += int(size or 0)
+
+    def snapshot(self):
+        """Return dict of counters and rates since start"""
+        with self._lock:
+            elapsed = max(time.time() - self.started, 1e-9)
+            return {
+                'elapsed': elapsed,
+                'uploaded': self.uploaded,
+                'failed': self.failed,
+                'retried': self.retried,
+                'bytes_uploaded': self.bytes_uploaded,
+                'items_per_second': self.uploaded / elapsed,
+                'bytes_per_second': self.bytes_uploaded / elapsed
+            }
+
+
+class UploadWorkerPool(object):
+    """Upload items of an UploadQueue with a pool of worker threads
+
+    Example:
+
+        upload_queue = UploadQueue('/var/lib/app/uploads.db')
+        upload_queue.put('/tmp/report.pdf', 'mf:///Reports/', priority=10)
+
+        pool = UploadWorkerPool(client, upload_queue, workers=4)
+        pool.start()
+        ...
+        pool.stop()
+        print(pool.metrics.snapshot())
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, client, upload_queue, workers=UPLOAD_WORKERS,
+                 action_on_duplicate='replace', create_folders=False,
+                 checkpoint_journal=None, poll_interval=QUEUE_POLL_INTERVAL):
+        """Initialize UploadWorkerPool
+
+        client -- MediaFireClient instance
+        upload_queue -- UploadQueue instance
+        workers -- number of concurrent uploads
+        action_on_duplicate -- skip, keep, replace
+        create_folders -- create missing destination folders
+        checkpoint_journal -- UploadCheckpointJournal for resuming
+                              uploads interrupted by a restart
+        poll_interval -- seconds an idle worker waits for new items
+        """
+        # Avoid circular import
+        from mediafire.batch import BatchUploader
+
+        self._client = client
+        self.queue = upload_queue
+        self.workers = workers
+        self.action_on_duplicate = action_on_duplicate
+        self.poll_interval = poll_interval
+        self.metrics = QueueMetrics()
+
+        self._uploader = MediaFireUploader(
+            client.api, checkpoint_journal=checkpoint_journal)
+        # reuse destination folder resolution and caching
+        self._resolver = BatchUploader(client, create_folders=create_folders)
+
+        self._stop = Event()
+        self._threads = []
+    # pylint: enable=too-many-arguments
+
+    @staticmethod
+    def _is_permanent(error):
+        """Check whether error will not go away on retry"""
+        # Avoid circular import
+        from mediafire.client import (NotAFolderError, ResourceNotFoundError)
+
+        return isinstance(error, (ValueError, NotAFolderError,
+                                  ResourceNotFoundError))
+
+    def _process(self, item):
+        """Upload a single item"""
+        if not os.path.isfile(item.source):
+            self.queue.nack(item, "Source file is missing", retry=False)
+            self.metrics.record('failed')
+            return
+
+        # the folder may have been created since another item failed
+        self._resolver.forget_missing_folders()
+
+        try:
+            folder_key, name = self._resolver.resolve_destination(
+                item.source, item.dest_uri)
+
+            with open(item.source, 'rb') as fd:
+                result = self._uploader.upload(
+                    fd, name, folder_key=folder_key,
+                    action_on_duplicate=self.action_on_duplicate)
+        except Exception as ex:  # pylint: disable=broad-except
+            if self.queue.nack(item, ex, retry=not self._is_permanent(ex)):
+                logger.warning("Upload of %s failed, retrying: %s",
+                               item.source, ex)
+                self.metrics.record('retried')
+            else:
+                logger.error("Upload of %s failed: %s", item.source, ex)
+                self.metrics.record('failed')
+            return
+
+        self.queue.ack(item, dict(result._asdict()))
+        self.metrics.record('uploaded', size=result.size)
+
+    def _worker(self, drain):
+        """Lease and process items until stopped
+
+        Workers share an upload action token, so their uploads are not
+        sent one at a time like calls signed with the session key.
+        """
+        with self._client.api.action_token(
+                'upload', lifespan=ACTION_TOKEN_LIFESPAN):
+            self._work(drain)
+
+    def _work(self, drain):
+        """Lease and process items until stopped, see _worker()"""
+        while not self._stop.is_set():
+            item = self.queue.lease()
+            if item is not None:
+                try:
+                    self._process(item)
+                except Exception:  # pylint: disable=broad-except
+                    # keep the worker alive, an unacknowledged item is
+                    # leased again once its lease expires
+                    logger.exception("Worker failed on %s", item.source)
+                continue
+
+            wait = self.queue.next_due()
+            if drain and wait is None:
+                return
+
+            if wait is None or wait > self.poll_interval:
+                wait = self.poll_interval
+
+            self._stop.wait(wait)
+
+    def start(self, drain=False):
+        """Start worker threads
+
+        drain -- stop workers once no items are left
+        """
+        self._stop.clear()
+        self._threads = [
+            Thread(target=self._worker, args=(drain,),
+                   name='UploadWorker-{}'.format(number))
+            for number in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self, wait=True):
+        """Stop workers once their current uploads are finished"""
+        self._stop.set()
+        if wait:
+            self.join()
+
+    def join(self):
+        """Wait for worker threads to exit"""
+        for thread in self._threads:
+            thread.join()
+
+    def run(self):
+        """Upload all outstanding items, including retries, and return"""
+        self.start(drain=True)
+        self.join()
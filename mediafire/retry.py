@@ -0,0 +1,211 @@
+"""Retries of failed MediaFire API calls"""
+
+from __future__ import unicode_literals
+
+import logging
+import random
+import threading
+
+from requests.exceptions import (ConnectTimeout, RequestException)
+
+# pylint: disable=import-error,no-name-in-module
+try:
+    from requests.packages.urllib3.exceptions import NewConnectionError
+except ImportError:
+    # urllib3 bundled with requests < 2.9 reports refused connections as
+    # ProtocolError, which may also fail a request that was sent; only
+    # connect timeouts are known not to have reached the server there
+    from requests.packages.urllib3.exceptions import (
+        ConnectTimeoutError as NewConnectionError)
+# pylint: enable=import-error,no-name-in-module
+
+from mediafire import deadline
+
+# Retries of failed API calls, see RetryPolicy
+API_ERROR_MAX_RETRIES = 5
+
+# Exponential backoff between retries, in seconds
+API_RETRY_BASE_DELAY = 0.25
+API_RETRY_MAX_DELAY = 10
+
+# Retries may add this share of requests on top, plus a burst reserve
+RETRY_BUDGET_RATIO = 0.1
+RETRY_BUDGET_RESERVE = 10
+
+# MediaFireApiError codes of transient failures, any other code is fatal.
+# None is a response that could not be decoded, e.g. a truncated body.
+RETRIABLE_ERROR_CODES = frozenset([None, 100])
+
+# Actions safe to repeat besides */get_* and */fetch_* ones
+IDEMPOTENT_ACTIONS = frozenset([
+    'folder/search', 'upload/check', 'upload/poll_upload', 'file/zip'
+])
+
+logger = logging.getLogger(__name__)
+
+
+def was_request_sent(error):
+    """Check whether the request failing with error may have reached
+    the server
+    """
+    from mediafire.api import MediaFireConnectionError
+
+    if isinstance(error, MediaFireConnectionError):
+        return error.request_sent
+    if isinstance(error, ConnectTimeout):
+        return False
+    if isinstance(error, RequestException) and error.args:
+        # ConnectionError wraps urllib3 MaxRetryError
+        reason = getattr(error.args[0], 'reason', None)
+        return not isinstance(reason, NewConnectionError)
+    return True
+
+
+class RetryBudget(object):
+    """Token bucket limiting retries to a share of all requests
+
+    Every request deposits ratio tokens, every retry withdraws one, so
+    during an outage retries stop once the reserve is spent instead of
+    multiplying the load. Share one budget between clients to bound the
+    retries of the whole process.
+    """
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO,
+                 reserve=RETRY_BUDGET_RESERVE):
+        """Initialize RetryBudget
+
+        ratio -- tokens deposited per request
+        reserve -- initial and maximum number of tokens
+        """
+        self.ratio = ratio
+        self.reserve = reserve
+        self.tokens = float(reserve)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """Account for a request"""
+        with self._lock:
+            self.tokens = min(self.tokens + self.ratio, self.reserve)
+
+    def withdraw(self):
+        """Take a token for a retry, return False if there is none"""
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+# Budget of policies created without one
+DEFAULT_RETRY_BUDGET = RetryBudget()
+
+
+class RetryPolicy(object):
+    """When and how long to wait before repeating a failed API call
+
+    A call is retried when
+    * the request never reached the server, or
+    * the action is idempotent and the error is a connection error or
+      a MediaFireApiError with one of retriable_codes,
+    as long as attempts and the budget last. Retries wait with exponential
+    backoff and full jitter, never past the current mediafire.deadline.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, max_retries=API_ERROR_MAX_RETRIES,
+                 base_delay=API_RETRY_BASE_DELAY,
+                 max_delay=API_RETRY_MAX_DELAY,
+                 retriable_codes=RETRIABLE_ERROR_CODES,
+                 idempotent_actions=IDEMPOTENT_ACTIONS, budget=None):
+        """Initialize RetryPolicy
+
+        max_retries -- retries after the first attempt, 0 to disable
+        base_delay -- backoff of the first retry, doubled on each one
+        max_delay -- upper bound of the backoff, in seconds
+        retriable_codes -- MediaFireApiError codes of transient failures
+        idempotent_actions -- actions safe to repeat, besides */get_*
+                              and */fetch_* ones
+        budget -- RetryBudget, DEFAULT_RETRY_BUDGET if None
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retriable_codes = frozenset(
+            None if code is None else int(code) for code in retriable_codes)
+        self.idempotent_actions = frozenset(idempotent_actions)
+        self.budget = budget if budget is not None else DEFAULT_RETRY_BUDGET
+    # pylint: enable=too-many-arguments
+
+    def is_idempotent(self, action):
+        """Check whether action can be repeated without side effects"""
+        name = action.rpartition('/')[2]
+        return action in self.idempotent_actions or \
+            name.startswith('get_') or name.startswith('fetch_')
+
+    def is_retriable(self, error):
+        """Check whether error may go away on its own"""
+        from mediafire.api import (MediaFireApiError,
+                                   MediaFireConnectionError)
+
+        if isinstance(error, MediaFireApiError):
+            # codes are strings in some responses
+            try:
+                code = None if error.code is None else int(error.code)
+            except (TypeError, ValueError):
+                return False
+            return code in self.retriable_codes
+        return isinstance(error, (MediaFireConnectionError,
+                                  RequestException))
+
+    def should_retry(self, action, error, retry, idempotent=None):
+        """Check whether to make retry number retry (0-based) after error
+
+        idempotent -- override is_idempotent(action)
+        """
+        if retry >= self.max_retries:
+            return False
+        if not was_request_sent(error):
+            return True
+        if idempotent is None:
+            idempotent = self.is_idempotent(action)
+        return idempotent and self.is_retriable(error)
+
+    def delay(self, retry):
+        """Return seconds to wait before retry number retry (0-based)"""
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    def pause(self, retry):
+        """Wait before retry number retry if the budget allows it
+
+        Returns False without waiting if the budget is exhausted, raises
+        DeadlineExceeded if the current deadline passes meanwhile.
+        """
+        if not self.budget.withdraw():
+            logger.warning("Retry budget exhausted")
+            return False
+        deadline.sleep(self.delay(retry))
+        return True
+
+    def call(self, func, action, idempotent=None):
+        """Return func(), retrying failures according to the policy
+
+        func -- callable making a single attempt
+        action -- API action for logging and idempotency
+        idempotent -- override is_idempotent(action)
+        """
+        from mediafire.api import MediaFireError
+
+        self.budget.deposit()
+
+        retry = 0
+        while True:
+            try:
+                return func()
+            except (MediaFireError, RequestException) as ex:
+                if not self.should_retry(action, ex, retry, idempotent):
+                    raise
+                logger.info("Retrying %s after %s", action, ex)
+                if not self.pause(retry):
+                    raise
+                retry += 1
@@ -0,0 +1,968 @@
+"""In-process MediaFire API stand-in for load and benchmark testing
+
+StandInServer implements the subset of the MediaFire Core API 1.3 used by
+mediafire.api, mediafire.client and mediafire.uploader on a local HTTP
+server, keeping all state in memory:
+
+* user/get_session_token with credential and call signature checking,
+  secret key rotation through new_key
+* folder and file info, create, update, move, delete and purge
+* folder/get_content paging, filtering and ordering, folder/search
+* upload/check, simple, resumable (with unit bitmaps), instant and
+  poll_upload
+* direct download links with Range support
+* device/get_status and device/get_changes
+
+Request latency and transfer bandwidth are configurable, so the SDK can
+be benchmarked without network access:
+
+    with StandInServer(latency=0.02, bandwidth=10 * 1024 * 1024) as server:
+        api = MediaFireApi(api_base=server.url)
+        client = MediaFireClient(api=api)
+        client.login(email=server.email, password=server.password,
+                     app_id=server.app_id)
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import logging
+import mimetypes
+import random
+import string
+import threading
+import time
+
+from collections import deque
+
+from six.moves.urllib.parse import (parse_qsl, quote)
+
+from mediafire.api import API_VER
+from mediafire.bandwidth import BandwidthLimiter
+from mediafire.standin_http import (ThreadingHTTPServer, RequestHandler)
+
+logger = logging.getLogger(__name__)
+
+MEBIBYTE = 2 ** 20
+
+# Resumable upload unit size, a multiple of HASH_CHUNK_SIZE_BYTES
+UNIT_SIZE = MEBIBYTE
+
+# Number of secret keys accepted: only the current one, like the API
+SECRET_KEY_WINDOW = 1
+
+# folder/get_content chunk_size default and maximum
+CHUNK_SIZE_DEFAULT = 100
+CHUNK_SIZE_MAX = 1000
+
+# device/get_changes revisions per block
+CHANGES_LIST_BLOCK = 500
+
+# Error codes
+ERROR_INTERNAL = 100
+ERROR_MISSING_PARAMETER = 102
+ERROR_INVALID_SESSION = 105
+ERROR_INVALID_CREDENTIALS = 107
+ERROR_UNKNOWN_QUICKKEY = 110
+ERROR_UNKNOWN_FOLDERKEY = 112
+ERROR_ACCESS_DENIED = 114
+ERROR_UNKNOWN_ACTION = 123
+ERROR_INVALID_SIGNATURE = 127
+ERROR_HASH_NOT_FOUND = 160
+
+# upload/poll_upload statuses
+STATUS_WAITING_FOR_ASSEMBLY = 13
+STATUS_NO_MORE_REQUESTS = 99
+
+# doupload result codes
+RESULT_SUCCESS = 0
+RESULT_HASH_MISMATCH = -203
+RESULT_SIZE_MISMATCH = -204
+
+MEDIA_FILTERS = ('image', 'audio', 'video')
+
+
+class StandInApiError(Exception):
+    """API error to be returned to the client"""
+
+    def __init__(self, message, code=ERROR_INTERNAL):
+        self.message = message
+        self.code = code
+        super(StandInApiError, self).__init__(message, code)
+
+
+def _random_key(rng, length):
+    """Return random lowercase alphanumeric key"""
+    alphabet = string.ascii_lowercase + string.digits
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+
+def _timestamp():
+    """Return MediaFire-style creation timestamp"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+def _sha256(data):
+    """Return hex sha256 of data"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def encode_bitmap(units):
+    """Encode set of uploaded unit ids as resumable_upload bitmap node"""
+    words = []
+    if units:
+        for word_id in range(max(units) // 16 + 1):
+            word = 0
+            for bit in range(16):
+                if word_id * 16 + bit in units:
+                    word |= 1 << bit
+            words.append(str(word))
+    return {'count': str(len(words)), 'words': words}
+
+
+def _multipart_payload(body, content_type):
+    """Return contents of the first part of multipart/form-data body"""
+    boundary = None
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.strip().partition('=')
+        if key == 'boundary':
+            boundary = value.strip('"').encode('ascii')
+
+    if boundary is None:
+        raise StandInApiError("Missing multipart boundary",
+                              ERROR_MISSING_PARAMETER)
+
+    start = body.index(b'\r\n\r\n', body.index(b'--' + boundary)) + 4
+    end = body.index(b'\r\n--' + boundary, start)
+    return body[start:end]
+
+
+# pylint: disable=too-many-instance-attributes,too-many-public-methods
+class StandInServer(object):
+    """Local HTTP server speaking the MediaFire API"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, latency=0.0, bandwidth=None, email='user@example.com',
+                 password='secret', app_id='42511', api_key=None,
+                 new_key_every=1, secret_key_window=SECRET_KEY_WINDOW,
+                 unit_size=UNIT_SIZE, processing_polls=0, host='127.0.0.1',
+                 port=0, seed=None):
+        """Initialize StandInServer
+
+        latency -- seconds added to every request
+        bandwidth -- bytes per second of upload and of download bodies,
+                     None for no limit
+        email, password, app_id, api_key -- accepted credentials
+        new_key_every -- rotate secret key every n signed calls,
+                         0 to never rotate
+        secret_key_window -- number of recent secret keys accepted, more
+                             than 1 tolerates calls signed with a stale
+                             key, e.g. after a lost new_key response
+        unit_size -- resumable upload unit size
+        processing_polls -- upload/poll_upload calls reporting
+                            processing before the upload is complete
+        host, port -- address to listen on, port 0 picks a free one
+        seed -- seed for generated keys
+        """
+        self.latency = latency
+        self.email = email
+        self.password = password
+        self.app_id = app_id
+        self.api_key = api_key
+        self.new_key_every = new_key_every
+        self.secret_key_window = secret_key_window
+        self.unit_size = unit_size
+        self.processing_polls = processing_polls
+
+        self.upload_limiter = BandwidthLimiter(bandwidth)
+        self.download_limiter = BandwidthLimiter(bandwidth)
+
+        self._address = (host, port)
+        self._httpd = None
+        self._thread = None
+
+        self._rng = random.Random(seed)
+        self._lock = threading.RLock()
+
+        # number of API calls by action, for call count assertions
+        self.calls = {}
+
+        self._sessions = {}
+        self._action_tokens = set()
+
+        self._folders = {}
+        self._files = {}
+        # file contents by sha256, shared by files with equal content
+        self._blobs = {}
+        # upload key -> poll state
+        self._uploads = {}
+        # (hash, folder_key) -> resumable upload state
+        self._resumable = {}
+
+        self.device_revision = 0
+        self._changes = []
+
+        self.root_key = self._new_key(13, self._folders)
+        self._folders[self.root_key] = {
+            'folderkey': self.root_key,
+            'name': 'myfiles',
+            'parent_folderkey': None,
+            'description': '',
+            'privacy': 'private',
+            'created': _timestamp(),
+            'revision': 0
+        }
+    # pylint: enable=too-many-arguments
+
+    @property
+    def bandwidth(self):
+        """Transfer bandwidth in bytes per second"""
+        return self.upload_limiter.rate
+
+    @bandwidth.setter
+    def bandwidth(self, value):
+        """Change transfer bandwidth at runtime"""
+        self.upload_limiter.set_rate(value)
+        self.download_limiter.set_rate(value)
+
+    @property
+    def url(self):
+        """Base URL to pass as MediaFireApi api_base"""
+        host, port = self._httpd.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        """Start serving requests on a background thread"""
+        self._httpd = ThreadingHTTPServer(self._address, RequestHandler)
+        self._httpd.standin = self
+
+        # short poll interval keeps stop() quick
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        args=(0.05,), name='StandInServer')
+        self._thread.daemon = True
+        self._thread.start()
+
+        logger.debug("Stand-in serving at %s", self.url)
+        return self
+
+    def stop(self):
+        """Stop serving requests"""
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_details):
+        self.stop()
+
+    def _new_key(self, length, existing):
+        """Return unused random key"""
+        while True:
+            key = _random_key(self._rng, length)
+            if key not in existing:
+                return key
+
+    # Request dispatch
+
+    def handle_api(self, path, query, headers, body):
+        """Process API call, return response node dict"""
+        action = path[len('/api/' + API_VER + '/'):-len('.php')]
+
+        with self._lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+
+        response = {'action': action, 'current_api_version': API_VER}
+
+        try:
+            method = getattr(self, '_api_' + action.replace('/', '_'), None)
+            if method is None:
+                raise StandInApiError("Unknown API action",
+                                      ERROR_UNKNOWN_ACTION)
+
+            params = dict(parse_qsl(query, keep_blank_values=True))
+
+            with self._lock:
+                if action != 'user/get_session_token':
+                    response['new_key'] = self._authenticate(path, query,
+                                                             params)
+                response.update(method(params, headers, body))
+            response['result'] = 'Success'
+        except StandInApiError as ex:
+            response.update({'result': 'Error', 'message': ex.message,
+                             'error': ex.code})
+
+        return response
+
+    def _authenticate(self, path, query, params):
+        """Check session or action token and signature, return new_key"""
+        token = params.get('session_token')
+        if token is None:
+            raise StandInApiError("Session token is missing",
+                                  ERROR_INVALID_SESSION)
+
+        if token in self._action_tokens:
+            # action tokens are not signed
+            return 'no'
+
+        session = self._sessions.get(token)
+        if session is None:
+            raise StandInApiError("Session token is invalid",
+                                  ERROR_INVALID_SESSION)
+
+        query, _, signature = query.rpartition('&signature=')
+        for secret_key in session['secret_keys']:
+            signature_base = (str(secret_key % 256) + session['time'] +
+                              path + '?' + query).encode('ascii')
+            if hashlib.md5(signature_base).hexdigest() == signature:
+                break
+        else:
+            raise StandInApiError("The signature is invalid",
+                                  ERROR_INVALID_SIGNATURE)
+
+        session['calls'] += 1
+        if self.new_key_every and session['calls'] % self.new_key_every == 0:
+            session['secret_keys'].appendleft(
+                session['secret_keys'][0] * 16807 % 2147483647)
+            return 'yes'
+
+        return 'no'
+
+    @staticmethod
+    def _require(params, *names):
+        """Return values of required params"""
+        for name in names:
+            if not params.get(name):
+                raise StandInApiError("Missing parameter: " + name,
+                                      ERROR_MISSING_PARAMETER)
+        return [params[name] for name in names]
+
+    # State helpers, called with self._lock held
+
+    def _record_change(self, kind, item):
+        """Bump device revision, log change for device/get_changes"""
+        self.device_revision += 1
+        item['revision'] = self.device_revision
+        self._changes.append((self.device_revision, kind, dict(item)))
+
+    def _folder(self, folder_key):
+        """Return folder, root if folder_key is empty"""
+        folder = self._folders.get(folder_key or self.root_key)
+        if folder is None:
+            raise StandInApiError("Unknown or invalid FolderKey",
+                                  ERROR_UNKNOWN_FOLDERKEY)
+        return folder
+
+    def _file(self, quick_key):
+        """Return file by quickkey"""
+        item = self._files.get(quick_key)
+        if item is None:
+            raise StandInApiError("Unknown or invalid QuickKey",
+                                  ERROR_UNKNOWN_QUICKKEY)
+        return item
+
+    def _children(self, folder_key):
+        """Return (folders, files) directly in folder"""
+        folders = [folder for folder in self._folders.values()
+                   if folder['parent_folderkey'] == folder_key]
+        files = [item for item in self._files.values()
+                 if item['parent_folderkey'] == folder_key]
+        return folders, files
+
+    def _folder_info(self, folder):
+        """Return folder info node"""
+        folders, files = self._children(folder['folderkey'])
+        info = dict((key, value if value is not None else '')
+                    for key, value in folder.items())
+        info.update({
+            'revision': str(folder['revision']),
+            'folder_count': str(len(folders)),
+            'file_count': str(len(files))
+        })
+        if folder['parent_folderkey'] is None:
+            del info['parent_folderkey']
+        return info
+
+    @staticmethod
+    def _file_info(item):
+        """Return file info node"""
+        info = dict(item)
+        info.update({
+            'size': str(item['size']),
+            'revision': str(item['revision']),
+            'mimetype': mimetypes.guess_type(item['filename'])[0] or
+                        'application/octet-stream',
+            'downloads': '0',
+            'views': '0',
+            'password_protected': 'no'
+        })
+        return info
+
+    def _store_file(self, data_hash, size, filename, folder_key,
+                    action_on_duplicate):
+        """Create or replace file, return its record"""
+        self._folder(folder_key)
+
+        existing = [item for item in self._files.values()
+                    if item['parent_folderkey'] == folder_key and
+                    item['filename'] == filename]
+
+        if existing and action_on_duplicate == 'skip':
+            return existing[0]
+
+        if existing and action_on_duplicate == 'replace':
+            item = existing[0]
+            item.update({'hash': data_hash, 'size': size})
+        else:
+            if existing:
+                # keep both, like the server does when not told otherwise
+                base, dot, ext = filename.rpartition('.')
+                if not dot:
+                    base, ext = filename, ''
+                counter = 1
+                names = set(item['filename'] for item in self._files.values()
+                            if item['parent_folderkey'] == folder_key)
+                while filename in names:
+                    filename = '{}({}){}{}'.format(base, counter, dot, ext)
+                    counter += 1
+
+            quick_key = self._new_key(15, self._files)
+            item = {
+                'quickkey': quick_key,
+                'filename': filename,
+                'hash': data_hash,
+                'size': size,
+                'parent_folderkey': folder_key,
+                'description': '',
+                'privacy': 'private',
+                'created': _timestamp()
+            }
+            self._files[quick_key] = item
+
+        self._record_change('file', item)
+        return item
+
+    def _complete_upload(self, upload_key, item):
+        """Make upload/poll_upload report the stored file"""
+        self._uploads[upload_key] = {
+            'polls_left': self.processing_polls,
+            'quickkey': item['quickkey'],
+            'hash': item['hash'],
+            'filename': item['filename'],
+            'size': str(item['size']),
+            'created': item['created'],
+            'revision': str(item['revision'])
+        }
+
+    def _delete_folder(self, folder_key):
+        """Delete folder with everything in it"""
+        folders, files = self._children(folder_key)
+        for child in folders:
+            self._delete_folder(child['folderkey'])
+        for item in files:
+            del self._files[item['quickkey']]
+            self._record_change('deleted_file', {'quickkey': item['quickkey']})
+
+        del self._folders[folder_key]
+        self._record_change('deleted_folder', {'folderkey': folder_key})
+
+    def _subtree(self, folder_key):
+        """Yield folders and files below folder_key"""
+        folders, files = self._children(folder_key)
+        for item in files:
+            yield item
+        for folder in folders:
+            yield folder
+            for item in self._subtree(folder['folderkey']):
+                yield item
+
+    # user/*
+
+    # pylint: disable=unused-argument
+    def _api_user_get_session_token(self, params, headers, body):
+        """user/get_session_token"""
+        email, password, app_id, signature = self._require(
+            params, 'email', 'password', 'application_id', 'signature')
+
+        expected = hashlib.sha1(
+            (email + password + app_id + (self.api_key or '')).encode(
+                'utf-8')).hexdigest()
+
+        if (email, password, app_id) != (self.email, self.password,
+                                         self.app_id) or \
+                signature != expected:
+            raise StandInApiError("The Credentials you entered are invalid",
+                                  ERROR_INVALID_CREDENTIALS)
+
+        token = _random_key(self._rng, 144)
+        secret_key = self._rng.randint(10 ** 8, 2147483646)
+        session_time = '{:.4f}'.format(time.time())
+
+        self._sessions[token] = {
+            'secret_keys': deque([secret_key],
+                                 maxlen=self.secret_key_window),
+            'time': session_time,
+            'calls': 0
+        }
+
+        return {
+            'session_token': token,
+            'secret_key': str(secret_key),
+            'time': session_time,
+            'ekey': _random_key(self._rng, 32),
+            'pkey': _random_key(self._rng, 10)
+        }
+
+    def _api_user_renew_session_token(self, params, headers, body):
+        """user/renew_session_token"""
+        return {'session_token': params['session_token']}
+
+    def _api_user_get_action_token(self, params, headers, body):
+        """user/get_action_token"""
+        token = _random_key(self._rng, 60)
+        self._action_tokens.add(token)
+        return {'action_token': token}
+
+    def _api_user_destroy_action_token(self, params, headers, body):
+        """user/destroy_action_token"""
+        self._action_tokens.discard(params.get('action_token'))
+        return {}
+
+    def _api_user_get_info(self, params, headers, body):
+        """user/get_info"""
+        used = sum(len(data) for data in self._blobs.values())
+        return {'user_info': {'email': self.email, 'display_name': 'Stand-in',
+                              'used_storage_size': str(used)}}
+
+    # folder/*
+
+    def _api_folder_get_info(self, params, headers, body):
+        """folder/get_info"""
+        return {'folder_info': self._folder_info(
+            self._folder(params.get('folder_key')))}
+
+    def _api_folder_get_content(self, params, headers, body):
+        """folder/get_content"""
+        folder = self._folder(params.get('folder_key'))
+        content_type = params.get('content_type', 'files')
+        chunk = int(params.get('chunk', 1))
+        chunk_size = min(int(params.get('chunk_size', CHUNK_SIZE_DEFAULT)),
+                         CHUNK_SIZE_MAX)
+
+        folders, files = self._children(folder['folderkey'])
+
+        if content_type == 'folders':
+            items = [self._folder_info(item) for item in folders]
+            name_key = 'name'
+        else:
+            items = [self._file_info(item) for item in files]
+            name_key = 'filename'
+
+            filter_ = params.get('filter')
+            if filter_ in MEDIA_FILTERS:
+                items = [item for item in items
+                         if item['mimetype'].startswith(filter_ + '/')]
+
+        order_by = params.get('order_by', 'name')
+        if order_by == 'size' and content_type == 'files':
+            sort_key = lambda item: int(item['size'])
+        elif order_by == 'created':
+            sort_key = lambda item: item['created']
+        else:
+            sort_key = lambda item: item[name_key].lower()
+
+        items.sort(key=sort_key,
+                   reverse=params.get('order_direction') == 'desc')
+
+        start = (chunk - 1) * chunk_size
+        page = items[start:start + chunk_size]
+
+        return {'folder_content': {
+            'chunk_size': str(chunk_size),
+            'content_type': content_type,
+            'chunk_number': str(chunk),
+            'folderkey': folder['folderkey'],
+            content_type: page,
+            'more_chunks': 'yes' if start + chunk_size < len(items) else 'no',
+            'revision': str(folder['revision'])
+        }}
+
+    def _api_folder_search(self, params, headers, body):
+        """folder/search"""
+        search_text, = self._require(params, 'search_text')
+        folder = self._folder(params.get('folder_key'))
+        search_text = search_text.lower()
+
+        results = []
+        for item in self._subtree(folder['folderkey']):
+            if 'quickkey' in item:
+                if search_text in item['filename'].lower():
+                    results.append(self._file_info(item))
+            elif search_text in item['name'].lower():
+                results.append(self._folder_info(item))
+
+        return {'results': results, 'results_count': str(len(results))}
+
+    def _api_folder_create(self, params, headers, body):
+        """folder/create"""
+        name, = self._require(params, 'foldername')
+        parent = self._folder(params.get('parent_key'))
+
+        if params.get('action_on_duplicate') == 'skip':
+            for folder in self._children(parent['folderkey'])[0]:
+                if folder['name'] == name:
+                    return {'folder_key': folder['folderkey'],
+                            'name': name,
+                            'parent_folderkey': parent['folderkey'],
+                            'new_device_revision': str(self.device_revision)}
+
+        folder_key = self._new_key(13, self._folders)
+        folder = {
+            'folderkey': folder_key,
+            'name': name,
+            'parent_folderkey': parent['folderkey'],
+            'description': '',
+            'privacy': 'private',
+            'created': _timestamp()
+        }
+        self._folders[folder_key] = folder
+        self._record_change('folder', folder)
+
+        return {'folder_key': folder_key, 'name': name,
+                'parent_folderkey': parent['folderkey'],
+                'revision': str(folder['revision']),
+                'new_device_revision': str(self.device_revision)}
+
+    def _api_folder_update(self, params, headers, body):
+        """folder/update"""
+        folder_key, = self._require(params, 'folder_key')
+        folder = self._folder(folder_key)
+
+        for param, field in (('foldername', 'name'),
+                             ('description', 'description'),
+                             ('privacy', 'privacy')):
+            if param in params:
+                folder[field] = params[param]
+
+        self._record_change('folder', folder)
+        return {'new_device_revision': str(self.device_revision)}
+
+    def _api_folder_move(self, params, headers, body):
+        """folder/move"""
+        folder_key, = self._require(params, 'folder_key_src')
+        folder = self._folder(folder_key)
+        folder['parent_folderkey'] = self._folder(
+            params.get('folder_key_dst'))['folderkey']
+
+        self._record_change('folder', folder)
+        return {'new_device_revision': str(self.device_revision)}
+
+    def _api_folder_delete(self, params, headers, body):
+        """folder/delete"""
+        folder_key, = self._require(params, 'folder_key')
+        if self._folder(folder_key)['parent_folderkey'] is None:
+            raise StandInApiError("Root folder cannot be deleted",
+                                  ERROR_ACCESS_DENIED)
+
+        self._delete_folder(folder_key)
+        return {'new_device_revision': str(self.device_revision)}
+
+    _api_folder_purge = _api_folder_delete
+
+    # file/*
+
+    def _api_file_get_info(self, params, headers, body):
+        """file/get_info"""
+        quick_key, = self._require(params, 'quick_key')
+        return {'file_info': self._file_info(self._file(quick_key))}
+
+    def _api_file_get_links(self, params, headers, body):
+        """file/get_links"""
+        quick_key, = self._require(params, 'quick_key')
+        item = self._file(quick_key)
+
+        return {'links': [{
+            'quickkey': quick_key,
+            'direct_download': '{}/download/{}/{}'.format(
+                self.url, quick_key,
+                quote(item['filename'].encode('utf-8')))
+        }]}
+
+    def _api_file_update(self, params, headers, body):
+        """file/update"""
+        quick_key, = self._require(params, 'quick_key')
+        item = self._file(quick_key)
+
+        for field in ('filename', 'description', 'privacy'):
+            if field in params:
+                item[field] = params[field]
+
+        self._record_change('file', item)
+        return {'new_device_revision': str(self.device_revision)}
+
+    def _api_file_move(self, params, headers, body):
+        """file/move"""
+        quick_key, = self._require(params, 'quick_key')
+        item = self._file(quick_key)
+        item['parent_folderkey'] = self._folder(
+            params.get('folder_key'))['folderkey']
+
+        self._record_change('file', item)
+        return {'new_device_revision': str(self.device_revision)}
+
+    def _api_file_delete(self, params, headers, body):
+        """file/delete"""
+        quick_key, = self._require(params, 'quick_key')
+        self._file(quick_key)
+
+        del self._files[quick_key]
+        self._record_change('deleted_file', {'quickkey': quick_key})
+        return {'new_device_revision': str(self.device_revision)}
+
+    _api_file_purge = _api_file_delete
+
+    # device/*
+
+    def _api_device_get_status(self, params, headers, body):
+        """device/get_status"""
+        return {'device_status': {
+            'device_revision': str(self.device_revision)}}
+
+    def _api_device_get_changes(self, params, headers, body):
+        """device/get_changes"""
+        revision = int(params.get('revision', 0))
+
+        updated = {'files': [], 'folders': []}
+        deleted = {'files': [], 'folders': []}
+
+        for change_revision, kind, item in self._changes:
+            if not revision < change_revision <= \
+                    revision + CHANGES_LIST_BLOCK:
+                continue
+
+            change = dict((key, '{}'.format(value))
+                          for key, value in item.items()
+                          if key in ('quickkey', 'folderkey', 'filename',
+                                     'name', 'parent_folderkey',
+                                     'revision') and value is not None)
+
+            if kind == 'file':
+                updated['files'].append(change)
+            elif kind == 'folder':
+                updated['folders'].append(change)
+            elif kind == 'deleted_file':
+                deleted['files'].append(change)
+            else:
+                deleted['folders'].append(change)
+
+        return {'updated': updated, 'deleted': deleted,
+                'device_revision': str(self.device_revision),
+                'changes_list_block': str(CHANGES_LIST_BLOCK)}
+
+    # upload/*
+
+    def _api_upload_check(self, params, headers, body):
+        """upload/check"""
+        filename, = self._require(params, 'filename')
+        folder = self._folder(params.get('folder_key'))
+        data_hash = params.get('hash')
+        size = int(params.get('size', 0))
+
+        siblings = self._children(folder['folderkey'])[1]
+        same_name = [item for item in siblings if item['filename'] == filename]
+
+        result = {
+            'hash_exists': 'yes' if data_hash in self._blobs else 'no',
+            'in_account': 'yes' if data_hash in self._blobs else 'no',
+            'in_folder': 'yes' if any(item['hash'] == data_hash
+                                      for item in siblings) else 'no',
+            'file_exists': 'yes' if same_name else 'no',
+            'used_storage_size': str(sum(len(data)
+                                         for data in self._blobs.values()))
+        }
+
+        if same_name:
+            result['duplicate_quickkey'] = same_name[0]['quickkey']
+            result['different_hash'] = \
+                'no' if same_name[0]['hash'] == data_hash else 'yes'
+
+        if params.get('resumable') == 'yes':
+            number_of_units = max((size + self.unit_size - 1) //
+                                  self.unit_size, 1)
+
+            if data_hash in self._blobs:
+                # content is stored already
+                units = set(range(number_of_units))
+                upload_key = ''
+            else:
+                state = self._resumable.setdefault(
+                    (data_hash, folder['folderkey']),
+                    {'upload_key': self._new_key(11, self._uploads),
+                     'units': {}})
+                # units carry no name, remember the one being checked
+                state['filename'] = filename
+                units = set(state['units'])
+                upload_key = state['upload_key']
+
+            result['resumable_upload'] = {
+                'all_units_ready': 'yes' if len(units) == number_of_units
+                                   else 'no',
+                'number_of_units': str(number_of_units),
+                'unit_size': str(self.unit_size),
+                'bitmap': encode_bitmap(units),
+                'upload_key': upload_key
+            }
+
+        return result
+
+    def _api_upload_simple(self, params, headers, body):
+        """upload/simple"""
+        filename = headers.get('x-filename', '')
+        folder = self._folder(params.get('folder_key'))
+
+        upload_key = self._new_key(11, self._uploads)
+        data_hash = _sha256(body)
+
+        if headers.get('x-filehash') not in (None, '', data_hash):
+            return {'doupload': {'result': str(RESULT_HASH_MISMATCH),
+                                 'key': ''}}
+        if headers.get('x-filesize') not in (None, '', 'None') and \
+                int(headers['x-filesize']) != len(body):
+            return {'doupload': {'result': str(RESULT_SIZE_MISMATCH),
+                                 'key': ''}}
+
+        self._blobs[data_hash] = body
+        item = self._store_file(data_hash, len(body), filename,
+                                folder['folderkey'],
+                                params.get('action_on_duplicate'))
+        self._complete_upload(upload_key, item)
+
+        return {'doupload': {'result': str(RESULT_SUCCESS),
+                             'key': upload_key}}
+
+    def _api_upload_resumable(self, params, headers, body):
+        """upload/resumable"""
+        folder = self._folder(params.get('folder_key'))
+        data_hash = headers['x-filehash']
+        size = int(headers['x-filesize'])
+        unit_id = int(headers['x-unit-id'])
+
+        data = _multipart_payload(body, headers.get('content-type', ''))
+        if _sha256(data) != headers['x-unit-hash'] or \
+                len(data) != int(headers['x-unit-size']):
+            return {'doupload': {'result': str(RESULT_HASH_MISMATCH),
+                                 'key': ''}}
+
+        number_of_units = max((size + self.unit_size - 1) // self.unit_size,
+                              1)
+
+        state_key = (data_hash, folder['folderkey'])
+        state = self._resumable.get(state_key)
+        if state is None:
+            raise StandInApiError("Resumable upload was not checked",
+                                  ERROR_MISSING_PARAMETER)
+
+        state['units'][unit_id] = data
+        self._uploads.setdefault(state['upload_key'], None)
+
+        all_units_ready = len(state['units']) == number_of_units
+
+        if all_units_ready:
+            content = b''.join(state['units'][unit]
+                               for unit in range(number_of_units))
+            del self._resumable[state_key]
+
+            if _sha256(content) != data_hash:
+                self._uploads[state['upload_key']] = {
+                    'fileerror': str(RESULT_HASH_MISMATCH)}
+            else:
+                self._blobs[data_hash] = content
+                item = self._store_file(data_hash, len(content),
+                                        state['filename'], folder['folderkey'],
+                                        params.get('action_on_duplicate'))
+                self._complete_upload(state['upload_key'], item)
+
+        return {
+            'doupload': {'result': str(RESULT_SUCCESS),
+                         'key': state['upload_key']},
+            'resumable_upload': {
+                'all_units_ready': 'yes' if all_units_ready else 'no',
+                'number_of_units': str(number_of_units),
+                'unit_size': str(self.unit_size),
+                'bitmap': encode_bitmap(set(range(number_of_units))
+                                        if all_units_ready
+                                        else set(state['units']))
+            }
+        }
+
+    def _api_upload_instant(self, params, headers, body):
+        """upload/instant"""
+        filename, data_hash = self._require(params, 'filename', 'hash')
+        folder = self._folder(params.get('folder_key'))
+
+        if data_hash not in self._blobs:
+            raise StandInApiError("Hash not found", ERROR_HASH_NOT_FOUND)
+
+        item = self._store_file(data_hash, len(self._blobs[data_hash]),
+                                filename, folder['folderkey'],
+                                params.get('action_on_duplicate'))
+
+        return {'quickkey': item['quickkey'], 'filename': item['filename'],
+                'new_device_revision': str(self.device_revision)}
+
+    def _api_upload_poll_upload(self, params, headers, body):
+        """upload/poll_upload"""
+        upload_key, = self._require(params, 'key')
+        if upload_key not in self._uploads:
+            raise StandInApiError("Unknown upload key",
+                                  ERROR_MISSING_PARAMETER)
+
+        upload = self._uploads[upload_key]
+        doupload = {'result': '0', 'status': str(STATUS_NO_MORE_REQUESTS),
+                    'description': 'No more requests for this key',
+                    'fileerror': '', 'quickkey': '', 'hash': '',
+                    'filename': '', 'size': '', 'created': '',
+                    'revision': ''}
+
+        if upload is None or upload.get('polls_left', 0) > 0:
+            if upload is not None:
+                upload['polls_left'] -= 1
+            doupload.update({'status': str(STATUS_WAITING_FOR_ASSEMBLY),
+                             'description': 'Waiting for assembly'})
+        else:
+            doupload.update((key, value) for key, value in upload.items()
+                            if key != 'polls_left')
+
+        return {'doupload': doupload}
+    # pylint: enable=unused-argument
+
+    # Downloads
+
+    def download_range(self, quick_key, range_header):
+        """Return (status, data, content_range) for a direct download"""
+        with self._lock:
+            item = self._files.get(quick_key)
+            if item is None:
+                return 404, b'', None
+            data = self._blobs[item['hash']]
+
+        if not range_header or not range_header.startswith('bytes='):
+            return 200, data, None
+
+        start, _, end = range_header[len('bytes='):].partition('-')
+        if start == '':
+            start = max(len(data) - int(end), 0)
+            end = len(data) - 1
+        else:
+            start = int(start)
+            end = min(int(end), len(data) - 1) if end else len(data) - 1
+
+        if start >= len(data) or start > end:
+            return 416, b'', 'bytes */{}'.format(len(data))
+
+        return 206, data[start:end + 1], 'bytes {}-{}/{}'.format(
+            start, end, len(data))
+# pylint: enable=too-many-instance-attributes,too-many-public-methods
@@ -0,0 +1,146 @@
+"""HTTP transport of StandInServer"""
+
+from __future__ import unicode_literals
+
+import json
+import logging
+import time
+
+import six
+
+from six.moves import (BaseHTTPServer, socketserver)
+from six.moves.urllib.parse import urlparse
+
+# Transfer buffer size for request and download bodies
+BUFFER_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+    """HTTP server handling each connection on its own thread"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Route HTTP requests to StandInServer"""
+
+    # keep connections alive like the real API does
+    protocol_version = 'HTTP/1.1'
+
+    # send headers and body in one segment, avoid delayed ACK stalls
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def log_message(self, format_, *args):  # pylint: disable=arguments-differ
+        """Log to the module logger instead of stderr"""
+        logger.debug(format_, *args)
+
+    @property
+    def standin(self):
+        """StandInServer instance"""
+        return self.server.standin
+
+    def _read_body(self):
+        """Read request body at the configured bandwidth"""
+        limiter = self.standin.upload_limiter
+        chunks = []
+
+        if self.headers.get('Transfer-Encoding', '') == 'chunked':
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                limiter.consume(size)
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get('Content-Length', 0))
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, BUFFER_SIZE))
+                if not chunk:
+                    break
+                limiter.consume(len(chunk))
+                chunks.append(chunk)
+                remaining -= len(chunk)
+
+        return b''.join(chunks)
+
+    def _headers_dict(self):
+        """Return lowercase request headers, decoding UTF-8 values"""
+        headers = {}
+        for key in self.headers.keys():
+            value = self.headers.get(key)
+            if six.PY3:
+                # http.server decodes headers as latin-1
+                try:
+                    value = value.encode('latin-1').decode('utf-8')
+                except (UnicodeEncodeError, UnicodeDecodeError):
+                    pass
+            elif isinstance(value, bytes):
+                value = value.decode('utf-8')
+            headers[key.lower()] = value
+        return headers
+
+    def _send_headers(self, status, content_type, length,
+                      extra_headers=None):
+        """Send status line and headers"""
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(length))
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """API call"""
+        time.sleep(self.standin.latency)
+
+        url = urlparse(self.path)
+        body = self._read_body()
+        headers = self._headers_dict()
+
+        if url.query:
+            # uploads carry the query in the URL, the body is the file
+            query = url.query
+        else:
+            query = body.decode('utf-8')
+            body = b''
+
+        if not url.path.startswith('/api/'):
+            self._send_headers(404, 'text/plain', 0)
+            return
+
+        response = self.standin.handle_api(url.path, query, headers, body)
+
+        payload = json.dumps({'response': response}).encode('utf-8')
+        self._send_headers(200, 'application/json', len(payload))
+        self.wfile.write(payload)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Direct download"""
+        time.sleep(self.standin.latency)
+
+        parts = urlparse(self.path).path.split('/')
+        if len(parts) < 3 or parts[1] != 'download':
+            self._send_headers(404, 'text/plain', 0)
+            return
+
+        status, data, content_range = self.standin.download_range(
+            parts[2], self.headers.get('Range'))
+
+        extra_headers = {'Accept-Ranges': 'bytes'}
+        if content_range is not None:
+            extra_headers['Content-Range'] = content_range
+
+        self._send_headers(status, 'application/octet-stream', len(data),
+                           extra_headers)
+
+        limiter = self.standin.download_limiter
+        for offset in range(0, len(data), BUFFER_SIZE):
+            chunk = data[offset:offset + BUFFER_SIZE]
+            limiter.consume(len(chunk))
+            self.wfile.write(chunk)
@@ -5,10 +5,15 @@ from __future__ import unicode_literals
 import os
 import io
 import logging
+import threading
 
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+# Duplicated descriptors share the file offset, seek and read must not
+# interleave between views where os.pread is not available
+_seek_lock = threading.Lock()
+
 
 class SubsetIO(io.IOBase):
     """minimal file-like object exposing subset of parent file"""
@@ -22,9 +27,11 @@ class SubsetIO(io.IOBase):
 
         try:
             self.parent_fd = os.fdopen(os.dup(fd.fileno()), 'rb')
+            self._fileno = self.parent_fd.fileno()
         except io.UnsupportedOperation:
             logger.debug("Re-using parent fd (not thread-safe)")
             self.parent_fd = fd
+            self._fileno = None
 
         self.offset = offset
         # name also makes requests.utils.super_len() work
@@ -43,16 +50,28 @@ class SubsetIO(io.IOBase):
         if self.len < 0:
             self.len = 0
 
-        self.parent_fd.seek(self.offset)
+        # position within the view
+        self._pos = 0
+
+    def _read_at(self, position, size):
+        """Read size bytes at position of the parent file"""
+        if self._fileno is not None and hasattr(os, 'pread'):
+            return os.pread(self._fileno, size, position)
+
+        with _seek_lock:
+            self.parent_fd.seek(position)
+            return self.parent_fd.read(size)
 
     def read(self, limit=-1):
         """Read content. See file.read"""
-        remaining = self.len - self.parent_fd.tell() + self.offset
+        remaining = self.len - self._pos
 
         if limit > remaining or limit == -1:
             limit = remaining
 
-        return self.parent_fd.read(limit)
+        data = self._read_at(self.offset + self._pos, limit)
+        self._pos += len(data)
+        return data
 
     def seek(self, offset, whence=os.SEEK_SET):
         """Seek to position in stream, see file.seek"""
@@ -70,12 +89,11 @@ class SubsetIO(io.IOBase):
         if pos > self.offset + self.len or pos < self.offset:
             raise ValueError("seek position beyond chunk area")
 
-        self.parent_fd.seek(pos, os.SEEK_SET)
+        self._pos = pos - self.offset
 
     def tell(self):
         """Get current position in file, see file.tell"""
-        result = self.parent_fd.tell() - self.offset
-        return result
+        return self._pos
 
     def close(self):
         """Close file, see file.close"""
@@ -0,0 +1,381 @@
+"""Optional tracing spans across client, uploader and API calls
+
+Tracing is off unless a tracer is installed with set_tracer(). Any tracer
+with OpenTelemetry-style start_as_current_span(name, attributes=...) and
+start_span(name, attributes=...) works, including opentelemetry.trace.get_tracer(...) itself. The built-in
+Tracer needs no dependencies and exports finished spans, e.g. as JSON
+lines with JsonFileExporter.
+
+Example:
+
+    from mediafire import tracing
+
+    tracing.set_tracer(tracing.Tracer(
+        tracing.JsonFileExporter('/tmp/mediafire-spans.json')))
+"""
+
+from __future__ import unicode_literals
+
+import functools
+import io
+import json
+import random
+import threading
+import time
+import traceback
+
+from contextlib import contextmanager
+
+import six
+
+STATUS_UNSET = 'UNSET'
+STATUS_OK = 'OK'
+STATUS_ERROR = 'ERROR'
+
+# Tracer used by the SDK, None when tracing is off
+_tracer = None
+
+_random = random.SystemRandom()
+
+
+def _nanoseconds(timestamp):
+    """Convert time.time() value to integer nanoseconds"""
+    return int(timestamp * 1e9)
+
+
+class Span(object):
+    """Timed operation, possibly nested in a parent span
+
+    Implements the subset of the OpenTelemetry Span API used by the SDK.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, name, parent=None, attributes=None, exporter=None):
+        """Initialize Span
+
+        name -- operation name
+        parent -- enclosing Span or None for a new trace
+        attributes -- dict of initial attributes
+        exporter -- exporter to export the span to when it ends
+        """
+        self.name = name
+        self._exporter = exporter
+        self.trace_id = parent.trace_id if parent is not None else \
+            '{:032x}'.format(_random.getrandbits(128))
+        self.span_id = '{:016x}'.format(_random.getrandbits(64))
+        self.parent_id = parent.span_id if parent is not None else None
+
+        self.start_time = time.time()
+        self.end_time = None
+
+        self.attributes = {}
+        self.events = []
+        self.status = STATUS_UNSET
+        self.status_description = None
+
+        self.set_attributes(attributes or {})
+    # pylint: enable=too-many-arguments
+
+    def set_attribute(self, key, value):
+        """Set attribute, None values are ignored"""
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes):
+        """Set all attributes from dict"""
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def add_event(self, name, attributes=None, timestamp=None):
+        """Record a point in time within the span"""
+        self.events.append({
+            'name': name,
+            'time_unix_nano': _nanoseconds(timestamp or time.time()),
+            'attributes': dict(attributes or {})
+        })
+
+    def record_exception(self, exception):
+        """Add exception event"""
+        self.add_event('exception', {
+            'exception.type': type(exception).__name__,
+            'exception.message': six.text_type(exception),
+            'exception.stacktrace': ''.join(traceback.format_exception(
+                type(exception), exception, None))
+        })
+
+    def set_status(self, status, description=None):
+        """Set STATUS_OK or STATUS_ERROR"""
+        self.status = status
+        self.status_description = description
+
+    def is_recording(self):
+        """Check whether the span has not ended yet"""
+        return self.end_time is None
+
+    def end(self):
+        """Mark the span finished and export it"""
+        if self.end_time is None:
+            self.end_time = time.time()
+            if self._exporter is not None:
+                self._exporter.export(self)
+
+    def to_dict(self):
+        """Serialize span, field names follow OpenTelemetry"""
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_id,
+            'start_time_unix_nano': _nanoseconds(self.start_time),
+            'end_time_unix_nano': _nanoseconds(self.end_time)
+                                  if self.end_time is not None else None,
+            'attributes': self.attributes,
+            'events': self.events,
+            'status': {
+                'code': self.status,
+                'description': self.status_description
+            }
+        }
+
+
+class Tracer(object):
+    """Tracer keeping the current span per thread
+
+    exporter.export(span) is called for every finished span.
+    """
+
+    def __init__(self, exporter=None):
+        """Initialize Tracer
+
+        exporter -- JsonFileExporter, InMemoryExporter or any object with
+                    export(span), None to drop finished spans
+        """
+        self.exporter = exporter
+        self._local = threading.local()
+
+    def current_span(self):
+        """Return active span of this thread or None"""
+        return getattr(self._local, 'span', None)
+
+    @contextmanager
+    def use_span(self, span):
+        """Make span the current span of this thread without ending it"""
+        previous = self.current_span()
+        self._local.span = span
+        try:
+            yield span
+        finally:
+            self._local.span = previous
+
+    def start_span(self, name, attributes=None, **_):
+        """Start span nested in the current one without making it current
+
+        The span is exported when it ends. Other OpenTelemetry keyword
+        arguments are accepted and ignored.
+        """
+        return Span(name, parent=self.current_span(), attributes=attributes,
+                    exporter=self.exporter)
+
+    @contextmanager
+    def start_as_current_span(self, name, attributes=None, **_):
+        """Start span nested in the current one, end and export on exit
+
+        Exceptions are recorded on the span and re-raised. Other
+        OpenTelemetry keyword arguments are accepted and ignored.
+        """
+        span = self.start_span(name, attributes=attributes)
+
+        try:
+            with self.use_span(span):
+                yield span
+        except Exception as ex:
+            _set_error(span, ex)
+            raise
+        finally:
+            span.end()
+
+
+class InMemoryExporter(object):  # pylint: disable=too-few-public-methods
+    """Keep finished spans in a list"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = []
+
+    def export(self, span):
+        """Store span"""
+        with self._lock:
+            self.spans.append(span)
+
+
+class JsonFileExporter(object):
+    """Append finished spans to a file, one JSON object per line"""
+
+    def __init__(self, path):
+        """Initialize JsonFileExporter
+
+        path -- file to append to, created if missing
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = io.open(path, 'a', encoding='utf-8')
+
+    def export(self, span):
+        """Write span"""
+        line = six.text_type(json.dumps(span.to_dict(), sort_keys=True))
+        with self._lock:
+            self._fd.write(line + '\n')
+            self._fd.flush()
+
+    def close(self):
+        """Close the file"""
+        with self._lock:
+            self._fd.close()
+
+
+class _NoOpSpan(object):
+    """Span of disabled tracing"""
+
+    def set_attribute(self, key, value):
+        """Ignore attribute"""
+        pass
+
+    def set_attributes(self, attributes):
+        """Ignore attributes"""
+        pass
+
+    def is_recording(self):  # pylint: disable=no-self-use
+        """Never recording"""
+        return False
+
+
+class _NoOpContext(object):  # pylint: disable=too-few-public-methods
+    """Reusable context manager yielding the no-op span"""
+
+    def __enter__(self):
+        return _NOOP_SPAN
+
+    def __exit__(self, *exc_details):
+        return False
+
+
+_NOOP_SPAN = _NoOpSpan()
+_NOOP_CONTEXT = _NoOpContext()
+
+
+def set_tracer(tracer):
+    """Install tracer for the SDK, None turns tracing off"""
+    global _tracer  # pylint: disable=global-statement
+    _tracer = tracer
+
+
+def get_tracer():
+    """Return installed tracer or None"""
+    return _tracer
+
+
+def span(name, attributes=None):
+    """Return context manager of a span nested in the current one
+
+    The span does nothing when tracing is off.
+    """
+    if _tracer is None:
+        return _NOOP_CONTEXT
+
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+def _set_error(span, exception):
+    """Record exception on span and set its status to error"""
+    span.record_exception(exception)
+
+    if isinstance(span, Span):
+        span.set_status(STATUS_ERROR, six.text_type(exception))
+        return
+
+    # pylint: disable=import-error
+    from opentelemetry.trace import (Status, StatusCode)
+    # pylint: enable=import-error
+    span.set_status(Status(StatusCode.ERROR, six.text_type(exception)))
+
+
+@contextmanager
+def detached_span(name, attributes=None):
+    """Context manager of a span nested in the current one, the span is
+    not made current
+
+    For generators: the current span is kept per thread, a span made
+    current across a yield would stay current in the caller. Pass the
+    span to bind() to run work in it. Ends the span on exit, exceptions
+    are recorded on it and re-raised.
+    """
+    if _tracer is None:
+        yield _NOOP_SPAN
+        return
+
+    span = _tracer.start_span(name, attributes=attributes)
+    try:
+        yield span
+    except Exception as ex:
+        _set_error(span, ex)
+        raise
+    finally:
+        span.end()
+
+
+def traced(name):
+    """Decorator running the function in a span called name"""
+    def decorator(func):
+        """Wrap func"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            """Call func in a span"""
+            if _tracer is None:
+                return func(*args, **kwargs)
+
+            with _tracer.start_as_current_span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind(func, parent=None):
+    """Return func running in the current span when called from another
+    thread, e.g. from a ThreadPoolExecutor
+
+    parent -- span to run func in instead, e.g. of detached_span()
+    """
+    tracer = _tracer
+    if tracer is None or parent is _NOOP_SPAN:
+        return func
+
+    if isinstance(tracer, Tracer):
+        if parent is None:
+            parent = tracer.current_span()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            """Call func with the captured span as current"""
+            with tracer.use_span(parent):
+                return func(*args, **kwargs)
+        return wrapper
+
+    try:
+        from opentelemetry import context  # pylint: disable=import-error
+    except ImportError:
+        return func
+
+    captured = context.get_current()
+    if parent is not None:
+        from opentelemetry import trace  # pylint: disable=import-error
+        captured = trace.set_span_in_context(parent, captured)
+
+    @functools.wraps(func)
+    def otel_wrapper(*args, **kwargs):
+        """Call func in the captured OpenTelemetry context"""
+        token = context.attach(captured)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            context.detach(token)
+    return otel_wrapper
@@ -3,13 +3,18 @@
 from __future__ import unicode_literals
 
 import hashlib
+import io
 import logging
 import math
 import os
+import threading
 import time
 
 from collections import namedtuple
 
+from concurrent.futures import (Future, ThreadPoolExecutor)
+
+from mediafire import (deadline, tracing)
 from mediafire.subsetio import SubsetIO
 from mediafire.api import MediaFireConnectionError
 
@@ -21,8 +26,11 @@ UPLOAD_SIMPLE_LIMIT_BYTES = 4 * MEBIBYTE
 # Retry resumable uploads 5 times
 UPLOAD_RETRY_COUNT = 5
 
-# Upload polling interval in seconds
+# Upload polling interval in seconds: start with UPLOAD_POLL_INTERVAL_MIN,
+# multiply by UPLOAD_POLL_BACKOFF after every poll up to UPLOAD_POLL_INTERVAL
 UPLOAD_POLL_INTERVAL = 5
+UPLOAD_POLL_INTERVAL_MIN = 0.5
+UPLOAD_POLL_BACKOFF = 2
 
 # Length of upload key
 UPLOAD_KEY_LENGTH = 11
@@ -44,7 +52,8 @@ class _UploadInfo(object):
 
     def __init__(self, fd=None, name=None, folder_key=None, path=None,
                  hash_info=None, size=None, filedrop_key=None,
-                 action_on_duplicate=None):
+                 action_on_duplicate=None, poller=None, checkpoint=None,
+                 stats=None):
         self.fd = fd
         self.name = name
         self.folder_key = folder_key
@@ -53,6 +62,12 @@ class _UploadInfo(object):
         self.size = size
         self.filedrop_key = filedrop_key
         self.action_on_duplicate = action_on_duplicate
+        # UploadPoller to hand the upload key over to instead of waiting
+        self.poller = poller
+        # UploadCheckpoint to record resumable upload progress in
+        self.checkpoint = checkpoint
+        # UploadStats to record the cost in, None to not collect them
+        self.stats = stats
 
 
 class _UploadUnitInfo(object):
@@ -65,13 +80,100 @@ class _UploadUnitInfo(object):
 
 
 UploadResult = namedtuple('UploadResult', [
-    'action', 'quickkey', 'hash_', 'filename', 'size', 'created', 'revision'
+    'action', 'quickkey', 'hash_', 'filename', 'size', 'created', 'revision',
+    # UploadStats if the uploader collects them, None otherwise
+    'stats'
 ])
+UploadResult.__new__.__defaults__ = (None,)
+
+UnitTransfer = namedtuple('UnitTransfer', ['unit_id', 'size', 'seconds'])
 
 
 # pylint: enable=too-few-public-methods,too-many-arguments
+class UploadStats(object):
+    """Cost of a single upload, see MediaFireUploader(collect_stats=True)
+
+    started -- time.time() the upload started
+    total_time -- seconds from start to UploadResult
+    hash_time -- seconds spent computing file and unit hashes
+    check_time, check_count -- time in and number of upload/check calls
+    transfer_time -- seconds spent sending file data
+    units -- list of UnitTransfer of resumable units, in completion order
+    unit_retries -- units that had to be sent more than once
+    retries -- upload attempts repeated after retriable errors
+    poll_time, poll_count -- time until upload/poll_upload reported the
+                             result and the number of polls
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sent_units = set()
+
+        self.started = time.time()
+        self.total_time = None
+        self.hash_time = 0.0
+        self.check_time = 0.0
+        self.check_count = 0
+        self.transfer_time = 0.0
+        self.bytes_transferred = 0
+        self.units = []
+        self.unit_retries = 0
+        self.retries = 0
+        self.poll_time = 0.0
+        self.poll_count = 0
+
+    def record_unit(self, unit_id, size, seconds):
+        """Record a successfully sent resumable unit"""
+        with self._lock:
+            if unit_id in self._sent_units:
+                self.unit_retries += 1
+            self._sent_units.add(unit_id)
+            self.units.append(UnitTransfer(unit_id, size, seconds))
+
+    def finish(self):
+        """Set total_time"""
+        self.total_time = time.time() - self.started
+
+    @property
+    def throughput(self):
+        """Bytes per second while sending file data, None if not sent"""
+        if not self.transfer_time:
+            return None
+        return self.bytes_transferred / self.transfer_time
+
+    def to_dict(self):
+        """Return stats as a JSON-serializable dict"""
+        with self._lock:
+            units = [{
+                'unit_id': unit.unit_id,
+                'size': unit.size,
+                'seconds': unit.seconds,
+                'throughput': unit.size / unit.seconds
+                              if unit.seconds else None
+            } for unit in self.units]
+
+        return {
+            'total_time': self.total_time,
+            'hash_time': self.hash_time,
+            'check_time': self.check_time,
+            'check_count': self.check_count,
+            'transfer_time': self.transfer_time,
+            'bytes_transferred': self.bytes_transferred,
+            'throughput': self.throughput,
+            'units': units,
+            'unit_retries': self.unit_retries,
+            'retries': self.retries,
+            'poll_time': self.poll_time,
+            'poll_count': self.poll_count
+        }
+
+
 class UploadSession(object):  # pylint: disable=too-few-public-methods
-    """Allocate/deallocate action token automatically"""
+    """Allocate/deallocate action token automatically
+
+    Sessions used at the same time share one token and the token set
+    before is restored on exit, see MediaFireApi.action_token.
+    """
 
     def __init__(self, api):
         """Initialize context manager
@@ -80,18 +182,17 @@ class UploadSession(object):  # pylint: disable=too-few-public-methods
         """
         self.action_token = None
         self._api = api
+        self._token = None
 
     def __enter__(self):
         """Allocate action token"""
-        self.action_token = self._api.user_get_action_token(
-            type_="upload", lifespan=1440)['action_token']
-
-        self._api.set_action_token(type_="upload",
-                                   action_token=self.action_token)
+        self._token = self._api.action_token("upload", lifespan=1440)
+        self.action_token = self._token.__enter__()
 
     def __exit__(self, *exc_details):
         """Destroys action token"""
-        self._api.user_destroy_action_token(action_token=self.action_token)
+        self._token.__exit__(*exc_details)
+        self._token = None
 
 
 class UploadError(Exception):
@@ -104,6 +205,29 @@ class RetriableUploadError(UploadError):
     pass
 
 
+class UploadRejectedError(UploadError):
+    """upload/simple refused the upload with a doupload result code"""
+    def __init__(self, message, result):
+        """Initialize exception
+
+        message -- error message
+        result -- doupload result code
+        """
+        self.result = result
+        super(UploadRejectedError, self).__init__(message)
+
+
+# doupload results of upload/simple
+UPLOAD_RESULT_HASH_MISMATCH = -203
+UPLOAD_RESULT_SIZE_MISMATCH = -204
+
+# Fast path rejections that upload/check and a fresh send can sort out:
+# the data received did not match the file_hash/file_size sent along.
+# Anything else is raised, the regular path would fail the same way.
+UPLOAD_FAST_PATH_FALLBACK_RESULTS = frozenset([UPLOAD_RESULT_HASH_MISMATCH,
+                                               UPLOAD_RESULT_SIZE_MISMATCH])
+
+
 MediaFireHashInfo = namedtuple('MediaFireHashInfo', [
     # sha256 digest of the whole file
     'file',
@@ -119,13 +243,14 @@ def decode_resumable_upload_bitmap(bitmap_node, number_of_units):
 
     bitmap_node -- bitmap node of resumable_upload with
                    'count' number and 'words' containing array
+                   of 16-bit words, lowest unit first
     number_of_units -- number of units we are uploading to
                        define the number of bits for bitmap
     """
     bitmap = 0
     for token_id in range(int(bitmap_node['count'])):
         value = int(bitmap_node['words'][token_id])
-        bitmap = bitmap | (value << (0xf * token_id))
+        bitmap = bitmap | (value << (16 * token_id))
 
     result = {}
 
@@ -136,6 +261,66 @@ def decode_resumable_upload_bitmap(bitmap_node, number_of_units):
     return result
 
 
+def upload_poll_intervals():
+    """Yield delays between upload/poll_upload calls
+
+    Polls are quick at first, since small files are usually processed
+    within a second, and back off to UPLOAD_POLL_INTERVAL.
+    """
+    interval = UPLOAD_POLL_INTERVAL_MIN
+    while True:
+        yield interval
+        interval = min(interval * UPLOAD_POLL_BACKOFF, UPLOAD_POLL_INTERVAL)
+
+
+def _check_poll_status(upload_key, doupload):
+    """Return True if upload/poll_upload says there is nothing to wait for
+
+    Raises RetriableUploadError if upload needs to be restarted.
+    """
+    logger.debug("poll(%s): status=%d, description=%s, filename=%s,"
+                 " result=%d",
+                 upload_key, int(doupload['status']),
+                 doupload['description'], doupload['filename'],
+                 int(doupload['result']))
+
+    if int(doupload['result']) != 0:
+        return True
+
+    if doupload['fileerror'] != '':
+        # TODO: we may have to handle this a bit more dramatically
+        logger.warning("poll(%s): fileerror=%d", upload_key,
+                       int(doupload['fileerror']))
+        return True
+
+    if int(doupload['status']) == STATUS_NO_MORE_REQUESTS:
+        return True
+    elif int(doupload['status']) == STATUS_UPLOAD_IN_PROGRESS:
+        # BUG: http://forum.mediafiredev.com/showthread.php?588
+        raise RetriableUploadError(
+            "Invalid state transition ({})".format(
+                doupload['description']
+            )
+        )
+
+    return False
+
+
+def _poll_upload_result(doupload, action, stats=None):
+    """Build UploadResult from upload/poll_upload doupload node"""
+    return UploadResult(
+        action=action,
+        quickkey=doupload['quickkey'],
+        hash_=doupload['hash'],
+        filename=doupload['filename'],
+        size=doupload['size'],
+        created=doupload['created'],
+        revision=doupload['revision'],
+        stats=stats
+    )
+
+
+@tracing.traced('uploader.compute_hash_info')
 def compute_hash_info(fd, unit_size=None):
     """Get MediaFireHashInfo structure from the fd, unit_size
 
@@ -187,16 +372,32 @@ def compute_hash_info(fd, unit_size=None):
 class MediaFireUploader(object):
     """API encapsulating Upload magic"""
 
-    def __init__(self, api):
+    # pylint: disable=too-many-arguments
+    def __init__(self, api, checkpoint_journal=None, concurrency=None,
+                 fast_path=False, collect_stats=False):
         """Initialize MediaFireUploader
 
         api -- MediaFireApi instance
+        checkpoint_journal -- UploadCheckpointJournal to resume
+                              interrupted resumable uploads from
+        concurrency -- AIMDController to upload resumable units in
+                       parallel, units are uploaded one by one if None
+        fast_path -- send small files with explicit action_on_duplicate
+                     straight to upload/simple, skipping upload/check
+        collect_stats -- attach UploadStats to every UploadResult
         """
         self._api = api
+        self._journal = checkpoint_journal
+        self.concurrency = concurrency
+        self.fast_path = fast_path
+        self.collect_stats = collect_stats
+    # pylint: enable=too-many-arguments
 
-    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-arguments,too-many-locals
+    @tracing.traced('uploader.upload')
     def upload(self, fd, name=None, folder_key=None, filedrop_key=None,
-               path=None, action_on_duplicate=None):
+               path=None, action_on_duplicate=None, hash_info=None,
+               poller=None, stats=None):
         """Upload file, returns UploadResult object
 
         fd -- file-like object to upload from, expects exclusive access
@@ -205,20 +406,42 @@ class MediaFireUploader(object):
         path -- path to file relative to folder_key
         filedrop_key -- filedrop to use instead of folder_key
         action_on_duplicate -- skip, keep, replace
+        hash_info -- MediaFireHashInfo of fd computed beforehand with
+                     compute_hash_info(), e.g. by a batch hashing ahead
+        poller -- UploadPoller to hand polling over to, a Future of the
+                  UploadResult is returned if the upload needs polling
+        stats -- UploadStats to record in, e.g. with hash_time of
+                 hash_info, created if collect_stats is set otherwise
+
+        Retries and polling stop with DeadlineExceeded once the current
+        mediafire.deadline has passed.
         """
 
+        if stats is None and self.collect_stats:
+            stats = UploadStats()
+
         # Get file handle content length in the most reliable way
         fd.seek(0, os.SEEK_END)
         size = fd.tell()
         fd.seek(0, os.SEEK_SET)
 
-        if size > UPLOAD_SIMPLE_LIMIT_BYTES:
-            resumable = True
+        checkpoint = None
+        if self._journal is not None and size > UPLOAD_SIMPLE_LIMIT_BYTES:
+            checkpoint = self._journal.lookup(
+                fd, name=name, folder_key=folder_key, path=path,
+                filedrop_key=filedrop_key)
+
+        if hash_info is not None:
+            logger.debug("Using precomputed checksum")
+        elif checkpoint is not None and checkpoint.hash_info is not None:
+            logger.debug("Using checksum from checkpoint %s", checkpoint.key)
+            hash_info = checkpoint.hash_info
         else:
-            resumable = False
-
-        logger.debug("Calculating checksum")
-        hash_info = compute_hash_info(fd)
+            logger.debug("Calculating checksum")
+            started = time.time()
+            hash_info = compute_hash_info(fd)
+            if stats is not None:
+                stats.hash_time += time.time() - started
 
         if hash_info.size != size:
             # Has the file changed beween computing the hash
@@ -228,56 +451,134 @@ class MediaFireUploader(object):
         upload_info = _UploadInfo(fd=fd, name=name, folder_key=folder_key,
                                   hash_info=hash_info, size=size, path=path,
                                   filedrop_key=filedrop_key,
-                                  action_on_duplicate=action_on_duplicate)
+                                  action_on_duplicate=action_on_duplicate,
+                                  poller=poller, checkpoint=checkpoint,
+                                  stats=stats)
+
+        result = self._upload(upload_info)
+
+        if checkpoint is not None:
+            if isinstance(result, Future):
+                def discard(future):
+                    """Forget the checkpoint once polling succeeded"""
+                    if future.exception() is None:
+                        self._journal.discard(checkpoint)
+                result.add_done_callback(discard)
+            else:
+                self._journal.discard(checkpoint)
 
-        # Check whether file is present
-        check_result = self._upload_check(upload_info, resumable)
+        return result
+    # pylint: enable=too-many-arguments,too-many-locals
 
-        upload_result = None
-        upload_func = None
+    # pylint: disable=too-many-arguments
+    @tracing.traced('uploader.upload')
+    def upload_instant(self, name, hash_info, folder_key=None,
+                       filedrop_key=None, path=None,
+                       action_on_duplicate=None, stats=None):
+        """Place a copy of content already stored in MediaFire, returns
+        UploadResult object
 
-        folder_key = check_result.get('folder_key', None)
-        if folder_key is not None:
-            # We know precisely what folder_key to use, drop path
-            upload_info.folder_key = folder_key
-            upload_info.path = None
+        name -- file name
+        hash_info -- MediaFireHashInfo of the content
+        stats -- UploadStats to record in, created if collect_stats is
+                 set otherwise
 
-        if check_result['hash_exists'] == 'yes':
-            # file exists somewhere in MediaFire
-            if check_result['in_folder'] == 'yes' and \
-                    check_result['file_exists'] == 'yes':
-                # file exists in this directory
-                different_hash = check_result.get('different_hash', 'no')
-                if different_hash == 'no':
-                    # file is already there
-                    upload_func = self._upload_none
-
-            if not upload_func:
-                # different hash or in other folder
-                upload_func = self._upload_instant
-
-        if not upload_func:
-            if resumable:
-                resumable_upload_info = check_result['resumable_upload']
-                upload_info.hash_info = compute_hash_info(
-                    fd, int(resumable_upload_info['unit_size']))
-                upload_func = self._upload_resumable
-            else:
-                upload_func = self._upload_simple
+        Other arguments are the same as for upload(). No upload/check is
+        made, use it when the content is known to be stored, e.g. after
+        uploading a copy of it.
+        """
+        if stats is None and self.collect_stats:
+            stats = UploadStats()
+
+        upload_info = _UploadInfo(name=name, folder_key=folder_key,
+                                  hash_info=hash_info, size=hash_info.size,
+                                  path=path, filedrop_key=filedrop_key,
+                                  action_on_duplicate=action_on_duplicate,
+                                  stats=stats)
+
+        return self._with_stats(upload_info,
+                                self._upload_instant(upload_info))
+    # pylint: enable=too-many-arguments
+
+    def _upload(self, upload_info):
+        """Upload file described by _UploadInfo with file hash computed
+
+        Returns Future instead of UploadResult if upload_info.poller is
+        set and the upload needs polling.
+        """
+        return self._with_stats(upload_info,
+                                self._upload_with_retries(upload_info))
+
+    @staticmethod
+    def _with_stats(upload_info, upload_result):
+        """Return upload_result carrying upload_info.stats
+
+        Futures are returned as is, UploadPoller attaches the stats.
+        """
+        stats = upload_info.stats
+        if stats is None or not isinstance(upload_result, UploadResult):
+            return upload_result
+
+        stats.finish()
+        return upload_result._replace(stats=stats)
+
+    def _upload_with_retries(self, upload_info):
+        """Check and upload, retrying retriable errors, see _upload()
+
+        With fast_path the first attempt sends a small file with
+        upload/simple right away, upload/check is called only if the
+        data sent did not match, see UPLOAD_FAST_PATH_FALLBACK_RESULTS.
+        """
+
+        stats = upload_info.stats
+        resumable = upload_info.size > UPLOAD_SIMPLE_LIMIT_BYTES
+
+        fast = self.fast_path and not resumable and \
+            upload_info.action_on_duplicate is not None
+
+        upload_result = None
+        check_result = None
+        upload_func = self._upload_simple if fast else None
 
         # Retry retriable exceptions
         retries = UPLOAD_RETRY_COUNT
         while retries > 0:
+            if upload_func is None:
+                # Check whether file is present
+                check_result = self._upload_check(upload_info, resumable)
+                upload_func = self._select_upload_func(
+                    upload_info, check_result, resumable)
+
             try:
                 # Provide check_result to avoid calling API twice
                 upload_result = upload_func(upload_info, check_result)
+            except deadline.DeadlineExceeded:
+                raise
+            except UploadRejectedError as ex:
+                if not fast or \
+                        ex.result not in UPLOAD_FAST_PATH_FALLBACK_RESULTS:
+                    raise
+                logger.debug("upload/simple fast path failed, falling back"
+                             " to upload/check: %s", ex)
+                fast = False
+                upload_func = None
             except (RetriableUploadError, MediaFireConnectionError):
                 retries -= 1
+                if stats is not None:
+                    stats.retries += 1
                 logger.exception("%s failed (%d retries left)",
                                  upload_func.__name__, retries)
-                # Refresh check_result for next iteration
-                check_result = self._upload_check(upload_info, resumable)
+                # Back off, unless the retry budget is exhausted
+                if retries > 0 and not self._api.retry_policy.pause(
+                        UPLOAD_RETRY_COUNT - retries - 1):
+                    break
+                if not fast:
+                    # Refresh check_result for next iteration
+                    check_result = self._upload_check(upload_info, resumable)
             except Exception:
+                if fast:
+                    # the regular path would fail the same way
+                    raise
                 logger.exception("%s failed", upload_func)
                 break
             else:
@@ -287,12 +588,63 @@ class MediaFireUploader(object):
             raise UploadError("Upload failed")
 
         return upload_result
-    # pylint: enable=too-many-arguments
 
-    def _poll_upload(self, upload_key, action):
+    def _select_upload_func(self, upload_info, check_result, resumable):
+        """Return upload function for check_result, see _upload_check()"""
+
+        fd = upload_info.fd
+        stats = upload_info.stats
+
+        folder_key = check_result.get('folder_key', None)
+        if folder_key is not None:
+            # We know precisely what folder_key to use, drop path
+            upload_info.folder_key = folder_key
+            upload_info.path = None
+
+        if check_result['hash_exists'] == 'yes':
+            # file exists somewhere in MediaFire
+            if check_result['in_folder'] == 'yes' and \
+                    check_result['file_exists'] == 'yes':
+                # file exists in this directory
+                different_hash = check_result.get('different_hash', 'no')
+                if different_hash == 'no':
+                    # file is already there
+                    return self._upload_none
+
+            # different hash or in other folder
+            return self._upload_instant
+
+        if not resumable:
+            return self._upload_simple
+
+        resumable_upload_info = check_result['resumable_upload']
+        unit_size = int(resumable_upload_info['unit_size'])
+        checkpoint = upload_info.checkpoint
+
+        if checkpoint is not None and \
+                checkpoint.unit_size == unit_size and \
+                checkpoint.hash_info.units:
+            logger.debug("Using unit hashes from checkpoint")
+        else:
+            started = time.time()
+            upload_info.hash_info = compute_hash_info(fd, unit_size)
+            if stats is not None:
+                stats.hash_time += time.time() - started
+
+        if checkpoint is not None:
+            checkpoint.hash_info = upload_info.hash_info
+            checkpoint.unit_size = unit_size
+            self._journal.save(checkpoint)
+
+        return self._upload_resumable
+
+    @tracing.traced('uploader.poll')
+    def _poll_upload(self, upload_key, action, poller=None, stats=None):
         """Poll upload until quickkey is found
 
         upload_key -- upload_key returned by upload/* functions
+        poller -- UploadPoller to hand over to, Future is returned then
+        stats -- UploadStats to record polls in
         """
 
         if len(upload_key) != UPLOAD_KEY_LENGTH:
@@ -308,59 +660,45 @@ class MediaFireUploader(object):
                 revision=None
             )
 
-        quick_key = None
-        while quick_key is None:
+        if poller is not None:
+            return poller.submit(upload_key, action, stats=stats)
+
+        started = time.time()
+        for interval in upload_poll_intervals():
             poll_result = self._api.upload_poll(upload_key)
             doupload = poll_result['doupload']
+            if stats is not None:
+                stats.poll_count += 1
 
-            logger.debug("poll(%s): status=%d, description=%s, filename=%s,"
-                         " result=%d",
-                         upload_key, int(doupload['status']),
-                         doupload['description'], doupload['filename'],
-                         int(doupload['result']))
-
-            if int(doupload['result']) != 0:
+            if _check_poll_status(upload_key, doupload):
                 break
 
-            if doupload['fileerror'] != '':
-                # TODO: we may have to handle this a bit more dramatically
-                logger.warning("poll(%s): fileerror=%d", upload_key,
-                               int(doupload['fileerror']))
-                break
+            deadline.sleep(interval)
 
-            if int(doupload['status']) == STATUS_NO_MORE_REQUESTS:
-                quick_key = doupload['quickkey']
-            elif int(doupload['status']) == STATUS_UPLOAD_IN_PROGRESS:
-                # BUG: http://forum.mediafiredev.com/showthread.php?588
-                raise RetriableUploadError(
-                    "Invalid state transition ({})".format(
-                        doupload['description']
-                    )
-                )
-            else:
-                time.sleep(UPLOAD_POLL_INTERVAL)
+        if stats is not None:
+            stats.poll_time += time.time() - started
 
-        return UploadResult(
-            action=action,
-            quickkey=doupload['quickkey'],
-            hash_=doupload['hash'],
-            filename=doupload['filename'],
-            size=doupload['size'],
-            created=doupload['created'],
-            revision=doupload['revision']
-        )
+        return _poll_upload_result(doupload, action, stats)
 
+    @tracing.traced('uploader.check')
     def _upload_check(self, upload_info, resumable=False):
         """Wrapper around upload/check"""
-        return self._api.upload_check(
-            filename=upload_info.name,
-            size=upload_info.size,
-            hash_=upload_info.hash_info.file,
-            folder_key=upload_info.folder_key,
-            filedrop_key=upload_info.filedrop_key,
-            path=upload_info.path,
-            resumable=resumable
-        )
+        started = time.time()
+        try:
+            return self._api.upload_check(
+                filename=upload_info.name,
+                size=upload_info.size,
+                hash_=upload_info.hash_info.file,
+                folder_key=upload_info.folder_key,
+                filedrop_key=upload_info.filedrop_key,
+                path=upload_info.path,
+                resumable=resumable
+            )
+        finally:
+            stats = upload_info.stats
+            if stats is not None:
+                stats.check_time += time.time() - started
+                stats.check_count += 1
 
     # pylint: disable=no-self-use
     # We just provide a consistent interface
@@ -377,6 +715,7 @@ class MediaFireUploader(object):
         )
     # pylint: enable=no-self-use
 
+    @tracing.traced('uploader.instant')
     def _upload_instant(self, upload_info, _=None):
         """Instant upload and return quickkey
 
@@ -406,6 +745,7 @@ class MediaFireUploader(object):
             created=None
         )
 
+    @tracing.traced('uploader.simple')
     def _upload_simple(self, upload_info, _=None):
         """Simple upload and return quickkey
 
@@ -415,6 +755,10 @@ class MediaFireUploader(object):
         check_result -- ignored
         """
 
+        # a failed attempt may have consumed part of the file
+        upload_info.fd.seek(0)
+
+        started = time.time()
         upload_result = self._api.upload_simple(
             upload_info.fd,
             upload_info.name,
@@ -425,11 +769,23 @@ class MediaFireUploader(object):
             file_hash=upload_info.hash_info.file,
             action_on_duplicate=upload_info.action_on_duplicate)
 
+        stats = upload_info.stats
+        if stats is not None:
+            stats.transfer_time += time.time() - started
+            stats.bytes_transferred += upload_info.size
+
         logger.debug("upload_result: %s", upload_result)
 
-        upload_key = upload_result['doupload']['key']
+        doupload = upload_result['doupload']
+        result = int(doupload.get('result', 0))
+        if result != 0:
+            raise UploadRejectedError(
+                "upload/simple failed with result {}".format(result), result)
+
+        upload_key = doupload['key']
 
-        return self._poll_upload(upload_key, 'upload/simple')
+        return self._poll_upload(upload_key, 'upload/simple',
+                                 poller=upload_info.poller, stats=stats)
 
     def _upload_resumable_unit(self, uu_info):
         """Upload a single unit and return raw upload/resumable result
@@ -443,17 +799,47 @@ class MediaFireUploader(object):
         if uu_info.hash_ is None:
             raise ValueError('UploadUnitInfo.hash_ is now required')
 
-        return self._api.upload_resumable(
-            uu_info.fd,
-            uu_info.upload_info.size,
-            uu_info.upload_info.hash_info.file,
-            uu_info.hash_,
-            uu_info.uid,
-            unit_size,
-            filedrop_key=uu_info.upload_info.filedrop_key,
-            folder_key=uu_info.upload_info.folder_key,
-            path=uu_info.upload_info.path,
-            action_on_duplicate=uu_info.upload_info.action_on_duplicate)
+        with tracing.span('uploader.unit', {'mediafire.unit_id': uu_info.uid,
+                                            'mediafire.unit_size': unit_size}):
+            return self._api.upload_resumable(
+                uu_info.fd,
+                uu_info.upload_info.size,
+                uu_info.upload_info.hash_info.file,
+                uu_info.hash_,
+                uu_info.uid,
+                unit_size,
+                filedrop_key=uu_info.upload_info.filedrop_key,
+                folder_key=uu_info.upload_info.folder_key,
+                path=uu_info.upload_info.path,
+                action_on_duplicate=uu_info.upload_info.action_on_duplicate)
+
+    def _upload_resumable_unit_at(self, upload_info, unit_id, unit_size):
+        """Upload unit unit_id of upload_info.fd, return upload/resumable
+        result
+        """
+        offset = unit_id * unit_size
+
+        with SubsetIO(upload_info.fd, offset, unit_size) as unit_fd:
+
+            unit_info = _UploadUnitInfo(
+                upload_info=upload_info,
+                hash_=upload_info.hash_info.units[unit_id],
+                fd=unit_fd,
+                uid=unit_id)
+
+            started = time.time()
+            if self.concurrency is None:
+                upload_result = self._upload_resumable_unit(unit_info)
+            else:
+                with self.concurrency.slot() as slot:
+                    upload_result = self._upload_resumable_unit(unit_info)
+                    slot.bytes = unit_fd.len
+
+            if upload_info.stats is not None:
+                upload_info.stats.record_unit(unit_id, unit_fd.len,
+                                              time.time() - started)
+
+        return upload_result
 
     def _upload_resumable_all(self, upload_info, bitmap,
                               number_of_units, unit_size):
@@ -465,40 +851,77 @@ class MediaFireUploader(object):
         unit_size -- size of a single upload unit in bytes
         """
 
-        fd = upload_info.fd
-
-        upload_key = None
+        upload_status = decode_resumable_upload_bitmap(
+            bitmap, number_of_units)
 
+        unit_ids = []
         for unit_id in range(number_of_units):
-            upload_status = decode_resumable_upload_bitmap(
-                bitmap, number_of_units)
-
             if upload_status[unit_id]:
                 logger.debug("Skipping unit %d/%d - already uploaded",
                              unit_id + 1, number_of_units)
-                continue
+            else:
+                unit_ids.append(unit_id)
 
-            logger.debug("Uploading unit %d/%d",
-                         unit_id + 1, number_of_units)
+        if not unit_ids:
+            return None
 
-            offset = unit_id * unit_size
+        logger.debug("Uploading unit %d/%d", unit_ids[0] + 1,
+                     number_of_units)
 
-            with SubsetIO(fd, offset, unit_size) as unit_fd:
+        # upload_key is needed for polling, the first unit creates it
+        upload_result = self._upload_resumable_unit_at(
+            upload_info, unit_ids[0], unit_size)
+        upload_key = upload_result['doupload']['key']
 
-                unit_info = _UploadUnitInfo(
-                    upload_info=upload_info,
-                    hash_=upload_info.hash_info.units[unit_id],
-                    fd=unit_fd,
-                    uid=unit_id)
+        if self.concurrency is None or \
+                not self._has_fileno(upload_info.fd):
+            # SubsetIO shares the parent position without a real file
+            for unit_id in unit_ids[1:]:
+                logger.debug("Uploading unit %d/%d",
+                             unit_id + 1, number_of_units)
+                self._upload_resumable_unit_at(upload_info, unit_id,
+                                               unit_size)
+        else:
+            self._upload_units_concurrently(upload_info, unit_ids[1:],
+                                            unit_size)
 
-                upload_result = self._upload_resumable_unit(unit_info)
+        return upload_key
 
-                # upload_key is needed for polling
-                if upload_key is None:
-                    upload_key = upload_result['doupload']['key']
+    @staticmethod
+    def _has_fileno(fd):
+        """Check whether fd is backed by a file descriptor"""
+        try:
+            fd.fileno()
+        except (AttributeError, io.UnsupportedOperation, OSError):
+            return False
+        return True
+
+    def _upload_units_concurrently(self, upload_info, unit_ids, unit_size):
+        """Upload units with self.concurrency deciding the parallelism
+
+        Units are sent with an upload action token, calls signed with the
+        session key would be sent one at a time. Raises the first error
+        after all units have been tried.
+        """
+        executor = ThreadPoolExecutor(
+            max_workers=self.concurrency.max_limit)
+        # units are traced as children of the current span and share
+        # the deadline of the upload
+        upload_unit = deadline.bind(
+            tracing.bind(self._upload_resumable_unit_at))
+        with UploadSession(self._api):
+            try:
+                futures = [executor.submit(upload_unit,
+                                           upload_info, unit_id, unit_size)
+                           for unit_id in unit_ids]
+            finally:
+                executor.shutdown(wait=True)
 
-        return upload_key
+        for future in futures:
+            if future.exception() is not None:
+                raise future.exception()
 
+    @tracing.traced('uploader.resumable')
     def _upload_resumable(self, upload_info, check_result):
         """Resumable upload and return quickkey
 
@@ -525,9 +948,14 @@ class MediaFireUploader(object):
         all_units_ready = resumable_upload['all_units_ready'] == 'yes'
         bitmap = resumable_upload['bitmap']
 
+        stats = upload_info.stats
+
         while not all_units_ready and retries > 0:
+            started = time.time()
             upload_key = self._upload_resumable_all(upload_info, bitmap,
                                                     number_of_units, unit_size)
+            if stats is not None:
+                stats.transfer_time += time.time() - started
 
             check_result = self._upload_check(upload_info, resumable=True)
 
@@ -539,11 +967,26 @@ class MediaFireUploader(object):
                 retries -= 1
                 logger.debug("Some units failed to upload (%d retries left)",
                              retries)
+                if retries > 0 and not self._api.retry_policy.pause(
+                        UPLOAD_RETRY_COUNT - retries - 1):
+                    break
 
         if not all_units_ready:
             # Most likely non-retriable
             raise UploadError("Could not upload all units")
 
+        if upload_key is None:
+            # all units were sent before, e.g. by an interrupted upload
+            upload_key = resumable_upload.get('upload_key')
+            if not upload_key:
+                logger.debug("No upload_key for uploaded units, using"
+                             " upload/instant")
+                return self._upload_instant(upload_info)
+
         logger.debug("Upload complete, polling for status")
 
-        return self._poll_upload(upload_key, 'upload/resumable')
+        if stats is not None:
+            stats.bytes_transferred = sum(unit.size for unit in stats.units)
+
+        return self._poll_upload(upload_key, 'upload/resumable',
+                                 poller=upload_info.poller, stats=stats)
@@ -0,0 +1,163 @@
+"""Request instrumentation tests"""
+
+from __future__ import unicode_literals
+
+import unittest
+
+import responses
+
+from tests.api.base import MediaFireApiTestCaseWithSessionToken
+
+from mediafire.api import (MediaFireApi, MediaFireApiError)
+from mediafire.instrumentation import (Histogram, HistogramCollector,
+                                       RequestObserver, PHASES)
+from mediafire.standin import StandInServer
+
+
+class RecordingObserver(RequestObserver):
+    """Observer keeping every RequestStats it sees"""
+
+    def __init__(self):
+        self.started = []
+        self.finished = []
+
+    def request_started(self, stats):
+        self.started.append(stats.action)
+
+    def request_finished(self, stats):
+        self.finished.append(stats)
+
+
+class BrokenObserver(RequestObserver):
+    """Observer failing on every call"""
+
+    def request_finished(self, stats):
+        raise RuntimeError("observer bug")
+
+
+class HistogramTests(unittest.TestCase):
+    """Histogram tests"""
+
+    def test_empty(self):
+        """Test that empty histogram has no percentiles"""
+        histogram = Histogram()
+
+        self.assertIsNone(histogram.percentile(50))
+        self.assertEqual(histogram.summary()['count'], 0)
+
+    def test_percentiles(self):
+        """Test that percentiles are within precision"""
+        histogram = Histogram(precision=0.01)
+        for value in range(1, 1001):
+            histogram.add(value / 1000.0)
+
+        for percent in (50, 95, 99):
+            self.assertAlmostEqual(histogram.percentile(percent),
+                                   percent / 100.0,
+                                   delta=percent / 100.0 * 0.01)
+
+        self.assertEqual(histogram.percentile(100), 1.0)
+        self.assertEqual(histogram.summary()['min'], 0.001)
+
+    def test_zero(self):
+        """Test that zero durations are counted"""
+        histogram = Histogram()
+        histogram.add(0.0)
+
+        self.assertEqual(histogram.percentile(99), 0.0)
+
+
+class ObserverTests(MediaFireApiTestCaseWithSessionToken):
+    """Observer notification tests"""
+
+    def setUp(self):
+        super(ObserverTests, self).setUp()
+        self.observer = RecordingObserver()
+        self.api.observers.append(self.observer)
+        self.url = self.build_url('user/get_info')
+
+    @responses.activate
+    def test_success(self):
+        """Test that observer receives stats of a successful call"""
+        body = '{"response": {"result": "Success", "user_info": {}}}'
+        responses.add(responses.POST, self.url, body=body, status=200,
+                      content_type="application/json")
+
+        self.api.user_get_info()
+
+        self.assertEqual(self.observer.started, ['user/get_info'])
+        stats = self.observer.finished[0]
+        self.assertEqual(stats.action, 'user/get_info')
+        self.assertEqual(stats.status_code, 200)
+        self.assertEqual(stats.bytes_in, len(body))
+        self.assertGreater(stats.bytes_out, 0)
+        self.assertIsNone(stats.error)
+        self.assertGreater(stats.timings['sign'], 0)
+        self.assertGreaterEqual(stats.total, sum(stats.timings.values()))
+
+    @responses.activate
+    def test_error_code(self):
+        """Test that observer receives the API error code"""
+        body = """{"response": {"result": "Error", "message": "Denied",
+                                "error": "110"}}"""
+        responses.add(responses.POST, self.url, body=body, status=403,
+                      content_type="application/json")
+
+        with self.assertRaises(MediaFireApiError):
+            self.api.user_get_info()
+
+        stats = self.observer.finished[0]
+        self.assertEqual(stats.error_code, '110')
+        self.assertIsInstance(stats.error, MediaFireApiError)
+
+    @responses.activate
+    def test_broken_observer(self):
+        """Test that failing observer does not fail the call"""
+        body = '{"response": {"result": "Success", "user_info": {}}}'
+        responses.add(responses.POST, self.url, body=body, status=200,
+                      content_type="application/json")
+        self.api.observers.insert(0, BrokenObserver())
+
+        self.api.user_get_info()
+
+        self.assertEqual(len(self.observer.finished), 1)
+
+
+class CollectorTests(unittest.TestCase):
+    """HistogramCollector against StandInServer"""
+
+    def test_summary(self):
+        """Test that connection phases and errors are collected"""
+        collector = HistogramCollector()
+
+        with StandInServer(latency=0.01) as server:
+            api = MediaFireApi(api_base=server.url, observers=[collector])
+            api.session = api.user_get_session_token(
+                email=server.email, password=server.password,
+                app_id=server.app_id)
+
+            for _ in range(3):
+                api.user_get_info()
+            with self.assertRaises(MediaFireApiError):
+                api.file_get_info('nonexistent')
+
+        summary = collector.summary()
+
+        user_info = summary['user/get_info']
+        self.assertEqual(user_info['total']['count'], 3)
+        self.assertEqual(user_info['errors'], 0)
+        self.assertGreaterEqual(user_info['ttfb']['p50'], 0.01)
+        self.assertEqual(set(user_info) & set(PHASES), set(PHASES))
+
+        self.assertGreater(
+            summary['user/get_session_token']['connect']['max'], 0)
+        self.assertEqual(summary['file/get_info']['errors'], 1)
+
+        self.assertEqual(collector.histogram('user/get_info').count, 3)
+
+        collector.reset()
+        self.assertEqual(collector.summary(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
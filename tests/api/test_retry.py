@@ -0,0 +1,190 @@
+"""Retry policy tests"""
+
+from __future__ import unicode_literals
+
+import socket
+import time
+import unittest
+
+import requests
+import responses
+
+from requests.exceptions import (ConnectTimeout, ReadTimeout)
+
+from tests.api.base import MediaFireApiTestCase
+
+from mediafire.api import (MediaFireApi, MediaFireApiError,
+                           MediaFireConnectionError, RetryBudget,
+                           RetryPolicy, API_ERROR_MAX_RETRIES)
+from mediafire.retry import was_request_sent
+from mediafire.deadline import (Deadline, DeadlineExceeded)
+
+ERROR_BODY = """
+{"response": {
+    "result": "Error",
+    "message": "Internal server error",
+    "error": "{}"}}
+"""
+
+SUCCESS_BODY = """
+{"response": {"result": "Success"}}
+"""
+
+
+class RetryPolicyTests(unittest.TestCase):
+    """RetryPolicy decisions"""
+
+    def setUp(self):
+        self.policy = RetryPolicy(max_retries=2, budget=RetryBudget())
+
+    def test_classification(self):
+        """Test that only transient errors of safe calls are retried"""
+        internal = MediaFireApiError("Internal server error", '100')
+        session = MediaFireApiError("Session token is missing", 105)
+        dropped = MediaFireConnectionError("Dropped")
+        refused = MediaFireConnectionError("Refused", request_sent=False)
+
+        self.assertTrue(self.policy.should_retry('file/get_info', internal, 0))
+        self.assertTrue(self.policy.should_retry('folder/search', dropped, 0))
+        self.assertFalse(self.policy.should_retry('file/get_info', session, 0))
+
+        self.assertFalse(self.policy.should_retry('folder/create', internal, 0))
+        self.assertFalse(self.policy.should_retry('folder/create', dropped, 0))
+        self.assertTrue(self.policy.should_retry('folder/create', refused, 0))
+        self.assertTrue(self.policy.should_retry('folder/create', dropped, 0,
+                                                 idempotent=True))
+
+        self.assertFalse(self.policy.should_retry('folder/create', refused, 2))
+        self.assertEqual(RetryPolicy().max_retries, API_ERROR_MAX_RETRIES)
+
+    def test_refused_not_sent(self):
+        """Test that a refused connection did not reach the server"""
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        port = listener.getsockname()[1]
+        # nothing listens on the port once it is closed
+        listener.close()
+
+        with self.assertRaises(requests.ConnectionError) as context:
+            requests.get('http://127.0.0.1:{}/'.format(port))
+
+        self.assertFalse(was_request_sent(context.exception))
+        self.assertTrue(was_request_sent(ReadTimeout()))
+
+    def test_delay(self):
+        """Test that backoff grows exponentially up to max_delay"""
+        policy = RetryPolicy(base_delay=1, max_delay=5)
+
+        for retry in range(10):
+            delay = policy.delay(retry)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(5, 2 ** retry))
+
+    def test_budget(self):
+        """Test that retries are limited by deposits and the reserve"""
+        budget = RetryBudget(ratio=0.5, reserve=2)
+
+        self.assertTrue(budget.withdraw())
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+
+        budget.deposit()
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertTrue(budget.withdraw())
+
+        for _ in range(10):
+            budget.deposit()
+        self.assertEqual(budget.tokens, 2)
+
+
+class RetryRequestTests(MediaFireApiTestCase):
+    """Retries of MediaFireApi requests"""
+
+    def setUp(self):
+        self.budget = RetryBudget()
+        self.api = MediaFireApi(retry_policy=RetryPolicy(
+            base_delay=0, budget=self.budget))
+
+    def add_error(self, action, code):
+        """Add error response to action"""
+        responses.add(responses.POST, self.build_url(action),
+                      body=ERROR_BODY.replace('{}', code),
+                      content_type="application/json")
+
+    def add_success(self, action):
+        """Add successful response to action"""
+        responses.add(responses.POST, self.build_url(action),
+                      body=SUCCESS_BODY, content_type="application/json")
+
+    @responses.activate
+    def test_retriable(self):
+        """Test that transient errors of idempotent calls are retried"""
+        self.add_error('system/get_status', '100')
+        responses.add(responses.POST, self.build_url('system/get_status'),
+                      body=ReadTimeout())
+        self.add_success('system/get_status')
+
+        self.api.system_get_status()
+
+        self.assertEqual(len(responses.calls), 3)
+
+    @responses.activate
+    def test_fatal(self):
+        """Test that fatal error codes are not retried"""
+        self.add_error('system/get_status', '105')
+        self.add_success('system/get_status')
+
+        with self.assertRaises(MediaFireApiError):
+            self.api.system_get_status()
+
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_not_idempotent(self):
+        """Test that side effects are only repeated if never sent"""
+        responses.add(responses.POST, self.build_url('folder/create'),
+                      body=ConnectTimeout())
+        self.add_success('folder/create')
+
+        self.api.request('folder/create', {'foldername': 'a'})
+
+        self.add_error('folder/create', '100')
+        self.add_success('folder/create')
+
+        with self.assertRaises(MediaFireApiError):
+            self.api.request('folder/create', {'foldername': 'a'})
+
+        self.assertEqual(len(responses.calls), 3)
+
+    @responses.activate
+    def test_budget_exhausted(self):
+        """Test that retries stop once the budget is spent"""
+        self.budget.tokens = 1
+        for _ in range(3):
+            self.add_error('system/get_status', '100')
+
+        with self.assertRaises(MediaFireApiError):
+            self.api.system_get_status()
+
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_deadline(self):
+        """Test that backoff does not sleep past the deadline"""
+        self.api.retry_policy = RetryPolicy(base_delay=10, max_delay=10,
+                                            budget=self.budget)
+        for _ in range(3):
+            self.add_error('system/get_status', '100')
+
+        started = time.time()
+        with Deadline(0.2):
+            with self.assertRaises(DeadlineExceeded):
+                # full jitter may pick a short first delay
+                self.api.system_get_status()
+
+        self.assertLess(time.time() - started, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
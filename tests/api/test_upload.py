@@ -8,6 +8,8 @@ import io
 import responses
 import unittest
 
+from mediafire.bandwidth import BandwidthLimiter
+
 from tests.api.base import MediaFireApiTestCaseWithSessionToken
 
 
@@ -46,5 +48,36 @@ class TestUploadSimple(MediaFireApiTestCaseWithSessionToken):
 
         self.assertEqual(x_filename, "тест.bin".encode('utf-8'))
 
+    @responses.activate
+    def test_upload_limiter(self):
+        """upload/simple body is throttled by upload_limiter"""
+
+        body = r"""
+            {"response":{
+            "action":"upload\/simple",
+            "doupload":{"result":"0","key":"53u05frn7sm"},
+            "server":"live","result":"Success","new_key":"yes",
+            "current_api_version":"1.1"}}
+        """
+
+        responses.add(responses.POST, self.url, body=body, status=200,
+                      content_type="application/json")
+
+        consumed = []
+
+        class RecordingLimiter(BandwidthLimiter):
+            """Limiter remembering consumed amounts"""
+            def consume(self, amount):
+                consumed.append(amount)
+
+        self.api.upload_limiter = RecordingLimiter(rate=10 ** 6)
+        self.api.upload_simple(io.BytesIO(b"payload"), "a.bin",
+                               file_size=7, file_hash='0')
+
+        request = responses.calls[0].request
+
+        self.assertEqual(sum(consumed), 7)
+        self.assertEqual(request.headers['Content-Length'], '7')
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,72 @@
+"""Concurrent download tests"""
+
+from __future__ import unicode_literals
+
+import threading
+import unittest
+
+from mediafire.client import (MediaFireClient, File, DownloadError)
+from mediafire.concurrency import AIMDController
+
+
+class DummyDownloadClient(MediaFireClient):
+    """MediaFireClient with download_file served from memory"""
+
+    def __init__(self):
+        super(DummyDownloadClient, self).__init__(_api=object)
+        self.downloaded = []
+        self._lock = threading.Lock()
+
+    def download_file(self, src_uri, target):
+        """Pretend to download src_uri"""
+        if src_uri.endswith('broken'):
+            raise DownloadError("Hash mismatch")
+        with self._lock:
+            self.downloaded.append(src_uri)
+        return File({'quickkey': 'q' * 15, 'size': '100'})
+
+
+class DownloadFilesTests(unittest.TestCase):
+    """MediaFireClient.download_files tests"""
+
+    def test_download_files(self):
+        """Test that every item yields a result"""
+        client = DummyDownloadClient()
+        controller = AIMDController(max_limit=4)
+        items = [('mf:///f{}'.format(i), '/tmp/') for i in range(10)]
+        items.append(('mf:///broken', '/tmp/'))
+
+        results = list(client.download_files(items, concurrency=controller))
+
+        self.assertEqual(len(results), 11)
+        self.assertEqual(sorted(client.downloaded),
+                         sorted(uri for uri, _ in items[:-1]))
+
+        failed = [result for result in results if result.error is not None]
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(failed[0].src_uri, 'mf:///broken')
+        self.assertIsInstance(failed[0].error, DownloadError)
+        self.assertIsNone(failed[0].resource)
+
+    def test_close_cancels_pending(self):
+        """Test that items are read lazily and queued ones are cancelled"""
+        client = DummyDownloadClient()
+        controller = AIMDController(max_limit=2)
+        read = []
+
+        def items():
+            """Yield items, recording how far they were read"""
+            for i in range(40):
+                read.append(i)
+                yield ('mf:///f{}'.format(i), '/tmp/')
+
+        results = client.download_files(items(), concurrency=controller)
+        next(results)
+        results.close()
+
+        self.assertLessEqual(len(read), 4)
+        self.assertLessEqual(len(client.downloaded), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
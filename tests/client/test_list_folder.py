@@ -0,0 +1,104 @@
+"""Folder listing push-down tests"""
+
+from __future__ import unicode_literals
+
+import unittest
+
+from mediafire.client import (MediaFireClient, File)
+
+FOLDER_KEY = 'v' * 13
+
+
+class DummyMediaFireApi(object):
+    """MediaFireApi serving 250 files in pages of chunk_size"""
+
+    def __init__(self):
+        self.calls = []
+
+    def folder_get_info(self, folder_key=None):
+        """folder/get_info"""
+        return {"folder_info": {"folderkey": folder_key}}
+
+    def folder_get_content(self, folder_key, content_type=None, chunk=None,
+                           **kwargs):
+        """folder/get_content"""
+        self.calls.append(dict(kwargs, chunk=chunk,
+                               content_type=content_type))
+
+        chunk_size = kwargs.get('chunk_size', 100)
+        total = 250
+
+        start = (chunk - 1) * chunk_size
+        end = min(start + chunk_size, total)
+
+        files = [{"filename": "{}.avi".format(i), "size": str(total - i),
+                  "quickkey": str(i).rjust(15, 'q')}
+                 for i in range(start, end)]
+
+        return {"folder_content": {
+            content_type: files,
+            "more_chunks": "yes" if end < total else "no"
+        }}
+
+
+class MediaFireListFolderTests(unittest.TestCase):
+    """Tests for MediaFireClient.list_folder"""
+
+    def setUp(self):
+        self.client = MediaFireClient(_api=DummyMediaFireApi)
+
+    def test_params_pushed_down(self):
+        """Test that filter and ordering are sent to the server"""
+        result = list(self.client.list_folder(
+            'mf:' + FOLDER_KEY, filter_='video', order_by='size',
+            order_direction='desc', limit=20))
+
+        self.assertEqual(len(result), 20)
+        self.assertIsInstance(result[0], File)
+
+        calls = self.client.api.calls
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0]['filter_'], 'video')
+        self.assertEqual(calls[0]['order_by'], 'size')
+        self.assertEqual(calls[0]['order_direction'], 'desc')
+        self.assertEqual(calls[0]['chunk_size'], 100)
+        self.assertEqual(calls[0]['content_type'], 'files')
+
+    def test_chunk_size_follows_limit(self):
+        """Test that page size is matched to the limit"""
+        result = list(self.client.list_folder('mf:' + FOLDER_KEY,
+                                              limit=150))
+
+        self.assertEqual(len(result), 150)
+        self.assertEqual(len(self.client.api.calls), 1)
+        self.assertEqual(self.client.api.calls[0]['chunk_size'], 150)
+
+    def test_paging_stops_at_limit(self):
+        """Test that no more pages are fetched than needed"""
+        result = list(self.client.list_folder(
+            'mf:' + FOLDER_KEY, limit=60,
+            predicate=lambda item: int(item['filename'][:-4]) % 2 == 0))
+
+        self.assertEqual(len(result), 60)
+        # 50 matches on the first page, 10 more on the second
+        self.assertEqual(len(self.client.api.calls), 2)
+
+    def test_predicate(self):
+        """Test that client-side predicate is applied before limit"""
+        result = list(self.client.list_folder(
+            'mf:' + FOLDER_KEY, limit=5,
+            predicate=lambda item: item['filename'].startswith('2')))
+
+        self.assertEqual([item['filename'] for item in result],
+                         ['2.avi', '20.avi', '21.avi', '22.avi', '23.avi'])
+
+    def test_no_limit_lists_everything(self):
+        """Test that all pages are fetched without limit"""
+        result = list(self.client.list_folder('mf:' + FOLDER_KEY))
+
+        self.assertEqual(len(result), 250)
+        self.assertNotIn('chunk_size', self.client.api.calls[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+"""Metadata mirror tests"""
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mediafire.client import (MediaFireClient, File, Folder)
+from mediafire.mirror import MetadataMirror
+from tests.client.test_tree_stats import (DummyMediaFireApi as TreeApi,
+                                          ROOT_KEY)
+
+
+class DummyMediaFireApi(TreeApi):
+    """TREE-serving MediaFireApi where None means the root folder"""
+
+    def folder_get_info(self, folder_key=None):
+        """folder/get_info"""
+        return super(DummyMediaFireApi, self).folder_get_info(
+            folder_key or ROOT_KEY)
+
+    def folder_get_content(self, folder_key, content_type=None, chunk=None):
+        """folder/get_content"""
+        return super(DummyMediaFireApi, self).folder_get_content(
+            folder_key or ROOT_KEY, content_type=content_type, chunk=chunk)
+
+    def file_delete(self, quick_key):
+        """file/delete"""
+        return {}
+
+    def file_update(self, quick_key, **kwargs):
+        """file/update"""
+        return {}
+
+    def folder_update(self, folder_key, **kwargs):
+        """folder/update"""
+        return {}
+
+    revision = 10
+    changes = {}
+
+    def device_get_status(self):
+        """device/get_status"""
+        return {"device_status": {"device_revision": str(self.revision)}}
+
+    def device_get_changes(self, revision=None):
+        """device/get_changes"""
+        self.calls += 1
+        return dict(self.changes, device_revision=str(self.revision),
+                    changes_list_block="500")
+
+    def file_get_info(self, quick_key=None):
+        """file/get_info"""
+        self.calls += 1
+        return {"file_info": {"quickkey": quick_key, "hash": "f" * 64,
+                              "size": "5", "revision": "12"}}
+
+
+class MetadataMirrorTests(unittest.TestCase):
+    """Tests for MetadataMirror"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.mirror = MetadataMirror(os.path.join(self.tmpdir, 'mirror.db'))
+        self.client = MediaFireClient(_api=DummyMediaFireApi,
+                                      mirror=self.mirror)
+        self.mirror.build(self.client)
+        self.client.api.calls = 0
+
+    def tearDown(self):
+        self.mirror.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_lookup_by_path(self):
+        """Test that path lookups are served locally"""
+        result = self.client.get_resource_by_uri('mf:///c/e/e2.txt')
+
+        self.assertIsInstance(result, File)
+        self.assertEqual(result['size'], '2000')
+        self.assertEqual(result['parent_folderkey'], 'e' * 13)
+        self.assertEqual(self.client.api.calls, 0)
+
+    def test_lookup_by_key_and_hash(self):
+        """Test key lookups and hash index"""
+        result = self.mirror.get_by_key('c' * 13)
+        self.assertIsInstance(result, Folder)
+
+        self.assertEqual(self.mirror.find_by_hash('unknown'), [])
+
+    def test_listing(self):
+        """Test that folder listings are served locally"""
+        names = [item.get('name', item.get('filename')) for item in
+                 self.client.get_folder_contents_iter('mf:///')]
+
+        self.assertEqual(names, ['c', 'd', 'a.txt', 'b.txt'])
+        self.assertEqual(self.client.api.calls, 0)
+
+    def test_delete_updates_mirror(self):
+        """Test that client mutations are reflected in the mirror"""
+        self.client.delete_file('mf:///a.txt')
+
+        self.assertIsNone(self.mirror.get_by_path('/a.txt'))
+
+    def test_rename_updates_mirror(self):
+        """Test that renames keep the mirrored subtree with new paths"""
+        self.client.update_folder_metadata('mf:///c', foldername='renamed')
+        self.client.update_file_metadata('mf:///renamed/e/e1.txt',
+                                         filename='moved.txt',
+                                         description='notes')
+
+        self.assertIsNone(self.mirror.get_by_path('/c'))
+        self.assertEqual(self.mirror.get_by_path('/renamed')['name'],
+                         'renamed')
+        self.assertEqual(
+            self.mirror.get_by_path('/renamed/e/e2.txt')['size'], '2000')
+        result = self.mirror.get_by_path('/renamed/e/moved.txt')
+        self.assertEqual(result['description'], 'notes')
+        self.assertEqual(result['parent_folderkey'], 'e' * 13)
+
+        self.assertIsNotNone(self.mirror.get('e' * 13))
+        self.client.api.calls = 0
+        self.client.get_resource_by_uri('mf:///renamed/e/e2.txt')
+        self.assertEqual(self.client.api.calls, 0)
+
+    def test_relisting_drops_removed_subtree(self):
+        """Test that a folder missing from a new listing is dropped"""
+        files, folders = self.mirror.get(ROOT_KEY)
+        self.mirror.put(ROOT_KEY, files,
+                        [item for item in folders if item['name'] != 'c'])
+
+        self.assertIsNone(self.mirror.get_by_path('/c'))
+        self.assertIsNone(self.mirror.get_by_path('/c/e/e1.txt'))
+
+    def test_stale_entries_not_served(self):
+        """Test that entries older than max_age are ignored"""
+        self.mirror.max_age = -1
+
+        self.assertIsNone(self.mirror.get_by_path('/a.txt'))
+        self.assertIsNone(self.mirror.get(ROOT_KEY))
+
+
+class MetadataMirrorSyncTests(unittest.TestCase):
+    """Tests for incremental MetadataMirror.sync"""
+
+    def setUp(self):
+        self.mirror = MetadataMirror()
+        self.client = MediaFireClient(_api=DummyMediaFireApi,
+                                      mirror=self.mirror)
+        self.mirror.build(self.client)
+        self.client.api.calls = 0
+
+    def tearDown(self):
+        self.mirror.close()
+
+    def test_no_changes(self):
+        """Test that sync without new revisions makes no listing calls"""
+        self.mirror.sync(self.client)
+        self.assertEqual(self.client.api.calls, 0)
+
+    def test_apply_changes(self):
+        """Test that moves, updates and deletes are applied"""
+        self.client.api.revision = 12
+        self.client.api.changes = {
+            "updated": {
+                "folders": [{"folderkey": "e" * 13, "name": "e",
+                             "parent_folderkey": "d" * 13,
+                             "revision": "11"}],
+                "files": [{"quickkey": "new".ljust(15, 'q'),
+                           "filename": "new.txt",
+                           "parent_folderkey": ROOT_KEY,
+                           "revision": "12"}]
+            },
+            "deleted": {
+                "files": [{"quickkey": "a.txt".ljust(15, 'q')}],
+                "folders": []
+            }
+        }
+
+        self.mirror.sync(self.client)
+
+        # one get_changes block plus one file_get_info
+        self.assertEqual(self.client.api.calls, 2)
+        self.assertEqual(self.mirror.get_state('device_revision'), '12')
+
+        self.assertIsNone(self.mirror.get_by_path('/a.txt'))
+        self.assertIsNone(self.mirror.get_by_path('/c/e'))
+        self.assertEqual(
+            self.mirror.get_by_path('/d/e/e1.txt')['quickkey'],
+            'e1.txt'.ljust(15, 'q'))
+
+        new_file = self.mirror.get_by_path('/new.txt')
+        self.assertEqual(new_file['hash'], 'f' * 64)
+        self.assertEqual(len(self.mirror.find_by_hash('f' * 64)), 1)
+
+    def test_new_folder_tree(self):
+        """Test that folders are applied after their parents regardless of
+        revision order
+        """
+        self.client.api.revision = 14
+        self.client.api.changes = {
+            "updated": {
+                "folders": [{"folderkey": "m" * 13, "name": "m",
+                             "parent_folderkey": "n" * 13,
+                             "revision": "13"},
+                            {"folderkey": "n" * 13, "name": "n",
+                             "parent_folderkey": ROOT_KEY,
+                             "revision": "14"}]
+            }
+        }
+
+        self.mirror.sync(self.client)
+
+        self.assertEqual(self.mirror.get_by_path('/n/m')['folderkey'],
+                         'm' * 13)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,6 +4,8 @@ from __future__ import unicode_literals
 
 import unittest
 
+from contextlib import contextmanager
+
 from mediafire.client import (MediaFireClient, ResourceNotFoundError,
                               NotAFolderError)
 
@@ -15,6 +17,11 @@ class DummyMediaFireApi(object):
     Interpreting the actual HTTP payload at this level is tedious.
     """
 
+    @contextmanager
+    def action_token(self, type_, lifespan=None):
+        """No session, so calls are not signed and need no token"""
+        yield
+
     def folder_get_content(self, folder_key, content_type=None, chunk=None):
         """folder/get_content"""
 
@@ -0,0 +1,72 @@
+"""Server-side search tests"""
+
+from __future__ import unicode_literals
+
+import unittest
+
+from contextlib import contextmanager
+
+from mediafire.client import (MediaFireClient, File, Folder)
+
+
+class DummyMediaFireApi(object):
+    """MediaFireApi returning canned folder/search results"""
+
+    def __init__(self):
+        self.searches = []
+
+    @contextmanager
+    def action_token(self, type_, lifespan=None):
+        """No session, so calls are not signed and need no token"""
+        yield
+
+    def folder_get_info(self, folder_key=None):
+        """folder/get_info"""
+        return {"folder_info": {"folderkey": folder_key}}
+
+    def folder_search(self, search_text, folder_key=None, filter_=None,
+                      search_all=None):
+        """folder/search"""
+        self.searches.append((search_text, folder_key, filter_))
+
+        return {
+            "results": [
+                {"type": "file", "filename": "report.txt",
+                 "quickkey": "q" * 15},
+                {"type": "folder", "name": "reports",
+                 "folderkey": folder_key[0] * 13}
+            ]
+        }
+
+
+class MediaFireSearchTests(unittest.TestCase):
+    """Tests for MediaFireClient.search"""
+
+    def setUp(self):
+        self.client = MediaFireClient(_api=DummyMediaFireApi)
+
+    def test_search_types(self):
+        """Test that results are converted to File and Folder"""
+        result = list(self.client.search('report', uri='mf:' + 'a' * 13,
+                                         filter_='document'))
+
+        self.assertEqual(len(result), 2)
+        self.assertIsInstance(result[0], File)
+        self.assertIsInstance(result[1], Folder)
+        self.assertEqual(self.client.api.searches,
+                         [('report', 'a' * 13, 'document')])
+
+    def test_search_many_folders(self):
+        """Test that several folders are searched and deduplicated"""
+        result = list(self.client.search(
+            'report', uri=['mf:' + 'a' * 13, 'mf:' + 'b' * 13]))
+
+        keys = sorted(item.get('quickkey', item.get('folderkey'))
+                      for item in result)
+
+        self.assertEqual(keys, ['a' * 13, 'b' * 13, 'q' * 15])
+        self.assertEqual(len(self.client.api.searches), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
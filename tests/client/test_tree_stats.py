@@ -0,0 +1,99 @@
+"""Tree statistics tests"""
+
+from __future__ import unicode_literals
+
+import unittest
+
+from contextlib import contextmanager
+
+from mediafire.client import (MediaFireClient, ListingCache)
+
+ROOT_KEY = 'r' * 13
+
+# folder_key: (files, folders)
+TREE = {
+    ROOT_KEY: ([('a.txt', 10), ('b.txt', 20)], ['c' * 13, 'd' * 13]),
+    'c' * 13: ([('c.txt', 100)], ['e' * 13]),
+    'd' * 13: ([], []),
+    'e' * 13: ([('e1.txt', 1000), ('e2.txt', 2000)], [])
+}
+
+
+class DummyMediaFireApi(object):
+    """MediaFireApi serving TREE listings with file sizes"""
+
+    def __init__(self):
+        self.calls = 0
+
+    @contextmanager
+    def action_token(self, type_, lifespan=None):
+        """No session, so calls are not signed and need no token"""
+        yield
+
+    def folder_get_info(self, folder_key=None):
+        """folder/get_info"""
+        return {"folder_info": {"folderkey": folder_key, "name": "root"}}
+
+    def folder_get_content(self, folder_key, content_type=None, chunk=None):
+        """folder/get_content"""
+        self.calls += 1
+        files, folders = TREE[folder_key]
+
+        if content_type == 'files':
+            node = [{"filename": name, "size": str(size),
+                     "quickkey": name.ljust(15, 'q')}
+                    for name, size in files]
+        else:
+            node = [{"name": key[0], "folderkey": key} for key in folders]
+
+        return {"folder_content": {content_type: node, "more_chunks": "no"}}
+
+
+class MediaFireTreeStatsTests(unittest.TestCase):
+    """Tests for MediaFireClient.tree_stats"""
+
+    def setUp(self):
+        self.client = MediaFireClient(_api=DummyMediaFireApi)
+
+    def test_totals(self):
+        """Test that sizes and counts are aggregated bottom-up"""
+        result = list(self.client.tree_stats('mf:' + ROOT_KEY))
+
+        self.assertEqual(len(result), 4)
+
+        root = result[-1]
+        self.assertEqual(root.folderkey, ROOT_KEY)
+        self.assertEqual(root.files, 2)
+        self.assertEqual(root.size, 30)
+        self.assertEqual(root.total_files, 5)
+        self.assertEqual(root.total_size, 3130)
+        self.assertEqual(root.total_folders, 3)
+
+        stats = dict((item.folderkey, item) for item in result)
+        self.assertEqual(stats['c' * 13].total_size, 3100)
+        self.assertEqual(stats['c' * 13].path, ROOT_KEY + '/c')
+        self.assertEqual(stats['d' * 13].total_files, 0)
+
+    def test_children_before_parents(self):
+        """Test that a folder is reported after all of its subfolders"""
+        order = [item.folderkey
+                 for item in self.client.tree_stats('mf:' + ROOT_KEY)]
+
+        self.assertLess(order.index('e' * 13), order.index('c' * 13))
+        self.assertLess(order.index('c' * 13), order.index(ROOT_KEY))
+
+    def test_cached_listings(self):
+        """Test that cached listings are not fetched again"""
+        cache = ListingCache()
+
+        list(self.client.tree_stats('mf:' + ROOT_KEY, cache=cache))
+        calls = self.client.api.calls
+
+        result = list(self.client.tree_stats('mf:' + ROOT_KEY, cache=cache))
+
+        self.assertEqual(self.client.api.calls, calls)
+        self.assertEqual(result[-1].total_size, 3130)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Tree walker tests"""
+
+from __future__ import unicode_literals
+
+import threading
+import time
+import unittest
+
+from mediafire.client import (MediaFireClient, NotAFolderError)
+from tests.client.test_resource_lookup import DummyMediaFireApi
+from tests.client.test_tree_stats import (DummyMediaFireApi as TreeApi,
+                                          ROOT_KEY)
+
+
+class SlowMediaFireApi(TreeApi):
+    """TREE-serving MediaFireApi with a slow listing of folder d"""
+
+    def __init__(self):
+        super(SlowMediaFireApi, self).__init__()
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def folder_get_content(self, folder_key, content_type=None, chunk=None):
+        """folder/get_content"""
+        with self._lock:
+            self.active += 1
+        try:
+            time.sleep(0.2 if folder_key == 'd' * 13 else 0)
+            return super(SlowMediaFireApi, self).folder_get_content(
+                folder_key, content_type=content_type, chunk=chunk)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class MediaFireWalkTests(unittest.TestCase):
+    """Tests for MediaFireClient.walk"""
+
+    def setUp(self):
+        self.client = MediaFireClient(_api=DummyMediaFireApi)
+
+    def test_walk_yields_all_folders(self):
+        """Test that every folder in the tree is visited once"""
+        result = dict(
+            (path, (folder, files, folders))
+            for path, folder, files, folders in self.client.walk('mf:///a')
+        )
+
+        self.assertEqual(sorted(result.keys()), ['/a', '/a/b'])
+
+        folder, files, folders = result['/a/b']
+        self.assertEqual(folder['folderkey'], 'b' * 13)
+        self.assertEqual([f['quickkey'] for f in files], ['i' * 15])
+        self.assertEqual(folders, [])
+
+    def test_walk_prune(self):
+        """Test that removing subfolders prunes the crawl"""
+        paths = []
+        for path, _, _, folders in self.client.walk('mf:///a'):
+            paths.append(path)
+            del folders[:]
+
+        self.assertEqual(paths, ['/a'])
+
+    def test_walk_file_raises_error(self):
+        """Test that walking a file raises NotAFolderError"""
+        with self.assertRaises(NotAFolderError):
+            list(self.client.walk('mf:' + 'i' * 15))
+
+    def test_walk_close_waits(self):
+        """Test that closing the walk waits for listings in flight"""
+        client = MediaFireClient(_api=SlowMediaFireApi)
+        walk = client.walk('mf:' + ROOT_KEY, max_workers=2)
+
+        next(walk)
+        path = next(walk)[0]
+        walk.close()
+
+        self.assertEqual(path, ROOT_KEY + '/c')
+        self.assertEqual(client.api.active, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
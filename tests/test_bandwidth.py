@@ -0,0 +1,88 @@
+"""Bandwidth limiter tests"""
+
+from __future__ import unicode_literals
+
+import io
+import threading
+import time
+import unittest
+
+from mediafire.bandwidth import (BandwidthLimiter, ThrottledReader,
+                                 throttle_iter)
+
+
+class BandwidthLimiterTests(unittest.TestCase):
+    """BandwidthLimiter tests"""
+
+    def test_unlimited(self):
+        """Test that limiter without rate does not wait"""
+        limiter = BandwidthLimiter()
+
+        start = time.time()
+        limiter.consume(10 ** 9)
+
+        self.assertLess(time.time() - start, 0.1)
+
+    def test_rate(self):
+        """Test that consumption is paced at rate"""
+        limiter = BandwidthLimiter(rate=10 ** 6)
+
+        start = time.time()
+        limiter.consume(200000)
+
+        self.assertGreater(time.time() - start, 0.15)
+
+    def test_shared(self):
+        """Test that threads share the rate"""
+        limiter = BandwidthLimiter(rate=10 ** 6)
+        threads = [threading.Thread(target=limiter.consume, args=(100000,))
+                   for _ in range(2)]
+
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertGreater(time.time() - start, 0.15)
+
+    def test_set_rate(self):
+        """Test that rate change applies to a waiting consumer"""
+        limiter = BandwidthLimiter(rate=1000)
+
+        timer = threading.Timer(0.05, limiter.set_rate, args=(None,))
+        timer.start()
+
+        start = time.time()
+        # would take over a minute at 1000 bytes per second
+        limiter.consume(65536)
+        timer.join()
+
+        self.assertLess(time.time() - start, 5)
+
+
+class ThrottledReaderTests(unittest.TestCase):
+    """ThrottledReader tests"""
+
+    def test_read(self):
+        """Test that wrapped stream content and length are kept"""
+        source = io.BytesIO(b'0123456789')
+        source.seek(2)
+        limiter = BandwidthLimiter()
+
+        reader = ThrottledReader(source, limiter)
+
+        self.assertEqual(reader.len, 8)
+        self.assertEqual(reader.read(3), b'234')
+        self.assertEqual(reader.read(), b'56789')
+
+    def test_throttle_iter(self):
+        """Test that chunks are passed through"""
+        chunks = [b'a', b'bc']
+        self.assertEqual(list(throttle_iter(chunks, BandwidthLimiter())),
+                         chunks)
+        self.assertEqual(list(throttle_iter(chunks, None)), chunks)
+
+
+if __name__ == "__main__":
+    unittest.main()
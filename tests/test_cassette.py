@@ -0,0 +1,106 @@
+"""Record/replay transport tests"""
+
+from __future__ import unicode_literals
+
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mediafire import cassette
+from mediafire.api import MediaFireApi
+from mediafire.cassette import CassetteError
+from mediafire.client import MediaFireClient
+from mediafire.standin import StandInServer
+
+
+class CassetteTests(unittest.TestCase):
+    """Record against StandInServer, replay without it"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'session.cassette.gz')
+
+        with StandInServer(seed=1, latency=0.02) as server:
+            self.server = server
+            self.api_base = server.url
+            self.api = MediaFireApi(api_base=self.api_base)
+            with cassette.record(self.api, self.path) as recorded:
+                self.recorded = recorded
+                self.expected = self.run_session(MediaFireClient(
+                    api=self.api))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_session(self, client):
+        """Log in, upload, look up and download a file"""
+        client.login(email=self.server.email, password=self.server.password,
+                     app_id=self.server.app_id)
+        client.create_folder('mf:///up')
+        client.upload_file(io.BytesIO(b'hello'), 'mf:///up/hello.txt')
+
+        target = io.BytesIO()
+        resource = client.download_file('mf:///up/hello.txt', target)
+        return resource['quickkey'], target.getvalue()
+
+    def test_replay(self):
+        """Test that the recorded session replays without the server"""
+        api = MediaFireApi(api_base=self.api_base)
+
+        with cassette.replay(api, self.path) as adapter:
+            result = self.run_session(MediaFireClient(api=api))
+            self.assertEqual(adapter.unplayed(), 0)
+
+        self.assertEqual(result, self.expected)
+        self.assertEqual(result[1], b'hello')
+
+    def test_scrubbed(self):
+        """Test that no credentials or tokens are written"""
+        with gzip.open(self.path, 'rb') as fd:
+            content = fd.read()
+
+        for secret in (self.server.email, self.api.session['session_token']):
+            self.assertNotIn(secret.encode('utf-8'), content)
+
+        self.assertIn(b'["password","SCRUBBED"]', content)
+        self.assertIn(b'["signature","SCRUBBED"]', content)
+        self.assertIn(b'"secret_key\\":\\"0\\"', content)
+
+        # one line per exchange
+        self.assertEqual(content.count(b'\n'),
+                         len(self.recorded.interactions))
+
+    def test_time_scale(self):
+        """Test that recorded response times are replayed"""
+        recorded = sum(interaction['response']['elapsed']
+                       for interaction in self.recorded.interactions)
+        api = MediaFireApi(api_base=self.api_base)
+
+        started = time.time()
+        with cassette.replay(api, self.path, time_scale=1.0):
+            self.run_session(MediaFireClient(api=api))
+
+        self.assertGreaterEqual(time.time() - started, recorded)
+
+    def test_unrecorded(self):
+        """Test that requests not in the cassette fail"""
+        api = MediaFireApi(api_base=self.api_base)
+        client = MediaFireClient(api=api)
+
+        with cassette.replay(api, self.path):
+            with self.assertRaises(CassetteError):
+                client.login(email=self.server.email,
+                             password=self.server.password,
+                             app_id='other')
+
+        # original transport is restored
+        self.assertNotIsInstance(api.http.get_adapter('http://'),
+                                 cassette.ReplayAdapter)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""Adaptive concurrency tests"""
+
+from __future__ import unicode_literals
+
+import threading
+import time
+import unittest
+
+from mediafire import concurrency
+from mediafire.concurrency import AIMDController
+
+
+class FakeClock(object):
+    """Manually advanced time.time() replacement"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        """Return current fake time"""
+        return self.now
+
+
+class AIMDControllerTests(unittest.TestCase):
+    """AIMDController tests"""
+
+    def setUp(self):
+        self.orig_time = concurrency.time
+        self.clock = FakeClock()
+        concurrency.time = self.clock
+
+    def tearDown(self):
+        concurrency.time = self.orig_time
+
+    def run_round(self, controller, nbytes, duration):
+        """Complete one round of transfers of nbytes in duration each"""
+        started = [controller.acquire() for _ in range(controller.limit)]
+        self.clock.now += duration
+        for start in started:
+            controller.release(start, nbytes)
+
+    def test_increase_while_throughput_grows(self):
+        """Test additive increase up to max_limit"""
+        controller = AIMDController(max_limit=4)
+
+        for _ in range(5):
+            # same per-transfer time, more transfers in parallel
+            self.run_round(controller, 1000, 1)
+
+        self.assertEqual(controller.limit, 4)
+
+    def test_hold_on_plateau(self):
+        """Test that limit stops growing when throughput does not"""
+        controller = AIMDController(max_limit=8, initial=2)
+
+        # first round always probes upwards
+        self.run_round(controller, 1000, 1)
+        self.assertEqual(controller.limit, 3)
+
+        # three transfers moving as much as two did: bandwidth bound
+        self.run_round(controller, 2000 // 3, 1)
+        self.assertEqual(controller.limit, 3)
+
+    def test_error_decrease(self):
+        """Test multiplicative decrease on failure"""
+        controller = AIMDController(min_limit=2, max_limit=16, initial=12)
+
+        controller.release(controller.acquire(), error=IOError())
+        self.assertEqual(controller.limit, 6)
+
+        for _ in range(5):
+            controller.release(controller.acquire(), error=IOError())
+        self.assertEqual(controller.limit, 2)
+
+    def test_latency_overload(self):
+        """Test decrease when latency grows far over the best seen"""
+        controller = AIMDController(max_limit=16, initial=8)
+
+        self.run_round(controller, 1000, 1)
+        self.run_round(controller, 1000, 10)
+
+        self.assertEqual(controller.limit, 4)
+
+    def test_slot_error(self):
+        """Test that exception inside slot counts as failure"""
+        controller = AIMDController(initial=4)
+
+        with self.assertRaises(IOError):
+            with controller.slot():
+                raise IOError("timeout")
+
+        self.assertEqual(controller.limit, 2)
+
+    def test_invalid_bounds(self):
+        """Test bounds validation"""
+        self.assertRaises(ValueError, AIMDController, min_limit=0)
+        self.assertRaises(ValueError, AIMDController, min_limit=4,
+                          max_limit=2)
+
+
+class AIMDControllerBlockingTests(unittest.TestCase):
+    """AIMDController slot limit tests"""
+
+    def test_acquire_blocks_at_limit(self):
+        """Test that no more than limit slots are held"""
+        controller = AIMDController(initial=2, max_limit=2)
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def transfer():
+            """Hold a slot for a moment"""
+            with controller.slot():
+                with lock:
+                    active.append(1)
+                    peak.append(len(active))
+                time.sleep(0.01)
+                with lock:
+                    active.pop()
+
+        threads = [threading.Thread(target=transfer) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(max(peak), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+"""Deadline and timeout tests"""
+
+from __future__ import unicode_literals
+
+import io
+import threading
+import time
+import unittest
+
+from mediafire import deadline, uploader
+from mediafire.api import (MediaFireConnectionError, RetryPolicy)
+from mediafire.deadline import (Deadline, DeadlineExceeded)
+
+from tests.test_standin import StandInTestCase
+
+
+class DeadlineTests(unittest.TestCase):
+    """Deadline bookkeeping tests"""
+
+    def test_request_timeout(self):
+        """Test that timeouts are limited by the remaining time"""
+        self.assertEqual(deadline.request_timeout((3, 60)), (3, 60))
+
+        with Deadline(5):
+            connect, read = deadline.request_timeout((3, 60))
+            self.assertEqual(connect, 3)
+            self.assertLessEqual(read, 5)
+
+            self.assertLessEqual(deadline.request_timeout(None), 5)
+
+        with Deadline(timeout=(1, 2)):
+            self.assertEqual(deadline.request_timeout((3, 60)), (1, 2))
+
+            # inner deadline keeps the timeout override
+            with Deadline(60):
+                self.assertEqual(deadline.request_timeout((3, 60)), (1, 2))
+
+        self.assertIsNone(deadline.current())
+
+    def test_request_timeout_expired(self):
+        """Test that no timeout is built once the deadline has passed"""
+        with Deadline(0):
+            with self.assertRaises(DeadlineExceeded):
+                deadline.request_timeout((3, 60))
+            with self.assertRaises(DeadlineExceeded):
+                deadline.request_timeout(None)
+
+    def test_nested(self):
+        """Test that nested deadlines never extend the outer one"""
+        with Deadline(1):
+            with Deadline(60) as inner:
+                self.assertLessEqual(inner.remaining(), 1)
+
+        with Deadline(0):
+            self.assertTrue(deadline.expired())
+            with self.assertRaises(DeadlineExceeded):
+                deadline.check()
+
+    def test_bind(self):
+        """Test that bound functions see the caller's deadline"""
+        seen = []
+
+        with Deadline(5) as outer:
+            thread = threading.Thread(
+                target=deadline.bind(lambda: seen.append(deadline.current())))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(seen, [outer])
+
+    def test_sleep(self):
+        """Test that sleep stops at the deadline"""
+        started = time.time()
+
+        with Deadline(0.05):
+            with self.assertRaises(DeadlineExceeded):
+                deadline.sleep(10)
+
+        self.assertLess(time.time() - started, 1)
+
+
+class DeadlineStandInTests(StandInTestCase):
+    """Deadlines of operations against a slow StandInServer"""
+
+    server_options = {'processing_polls': 1000}
+
+    def setUp(self):
+        super(DeadlineStandInTests, self).setUp()
+        self.client.create_folder('mf:///up')
+        self.orig_poll = uploader.UPLOAD_POLL_INTERVAL_MIN
+        uploader.UPLOAD_POLL_INTERVAL_MIN = 0.01
+
+    def tearDown(self):
+        uploader.UPLOAD_POLL_INTERVAL_MIN = self.orig_poll
+        super(DeadlineStandInTests, self).tearDown()
+
+    def test_read_timeout(self):
+        """Test that per-call timeouts fail slow calls"""
+        self.server.latency = 0.5
+        # user/get_info is idempotent, time a single attempt
+        self.api.retry_policy = RetryPolicy(max_retries=0)
+
+        started = time.time()
+        with Deadline(timeout=(1, 0.1)):
+            with self.assertRaises(MediaFireConnectionError):
+                self.api.user_get_info()
+
+        self.assertLess(time.time() - started, 0.4)
+
+    def test_resolution(self):
+        """Test that the deadline bounds path resolution"""
+        self.server.latency = 0.1
+
+        started = time.time()
+        with Deadline(0.25):
+            with self.assertRaises(DeadlineExceeded):
+                self.client.get_resource_by_uri('mf:///up/a/b/c')
+
+        self.assertLess(time.time() - started, 0.4)
+
+    def test_upload_polling(self):
+        """Test that upload stops polling at the deadline"""
+        started = time.time()
+        with Deadline(0.5):
+            with self.assertRaises(DeadlineExceeded):
+                self.client.upload_file(io.BytesIO(b'hello'),
+                                        'mf:///up/hello.txt')
+
+        self.assertLess(time.time() - started, 1)
+        self.assertGreater(self.server.calls['upload/poll_upload'], 1)
+
+
+class DownloadDeadlineTests(StandInTestCase):
+    """Deadline of a slow download"""
+
+    def test_download(self):
+        """Test that the deadline bounds a download in progress"""
+        self.client.create_folder('mf:///up')
+        self.client.upload_file(io.BytesIO(b'x' * 1024 * 1024),
+                                'mf:///up/big.bin')
+        self.server.bandwidth = 256 * 1024
+
+        started = time.time()
+        with Deadline(0.5):
+            with self.assertRaises(DeadlineExceeded):
+                self.client.download_file('mf:///up/big.bin', io.BytesIO())
+
+        self.assertLess(time.time() - started, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
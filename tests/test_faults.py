@@ -0,0 +1,144 @@
+"""Fault injection tests"""
+
+from __future__ import unicode_literals
+
+import io
+import time
+import unittest
+
+from mediafire import faults
+from mediafire.api import (MediaFireApiError, MediaFireConnectionError,
+                           RetryPolicy)
+from mediafire.cassette import wrap_adapters
+from mediafire.faults import (FaultInjector, FAULT_DROP)
+from mediafire.standin import ERROR_INVALID_SIGNATURE
+
+from tests.test_standin import StandInTestCase
+
+
+class DropFirstUpload(FaultInjector):
+    """Drop the connection of the first upload/simple request only"""
+
+    dropped = False
+
+    def draw(self, request):
+        delay, _, fraction, error_code = super(DropFirstUpload,
+                                               self).draw(request)
+        if 'upload/simple' in request.url and not self.dropped:
+            self.dropped = True
+            return delay, FAULT_DROP, 0.5, error_code
+        return delay, None, fraction, error_code
+
+
+class FaultInjectionTests(StandInTestCase):
+    """Faults injected into requests to StandInServer"""
+
+    def setUp(self):
+        super(FaultInjectionTests, self).setUp()
+        # one attempt per call, see tests/api/test_retry.py for retries
+        self.api.retry_policy = RetryPolicy(max_retries=0)
+
+    def test_error(self):
+        """Test that injected errors never reach the server"""
+        calls = dict(self.server.calls)
+
+        with faults.inject(self.api, error_rate=1.0) as injector:
+            with self.assertRaises(MediaFireApiError) as context:
+                self.api.user_get_info()
+
+        self.assertEqual(context.exception.code, 100)
+        self.assertEqual(self.server.calls, calls)
+        self.assertEqual(injector.errors, 1)
+        self.assertGreater(injector.wasted_bytes, 0)
+
+    def test_drop(self):
+        """Test that dropped connections surface as connection errors"""
+        with faults.inject(self.api, drop_rate=1.0) as injector:
+            with self.assertRaises(MediaFireConnectionError):
+                self.api.user_get_info()
+
+        # the server did the work, the request was wasted
+        self.assertEqual(self.server.calls['user/get_info'], 1)
+        self.assertEqual(injector.drops, 1)
+        self.assertGreater(injector.wasted_bytes, 0)
+
+        # original transport is restored, but the new_key was lost with
+        # the response, so the session is left with a stale secret key
+        with self.assertRaises(MediaFireApiError) as context:
+            self.api.user_get_info()
+
+        self.assertEqual(context.exception.code, ERROR_INVALID_SIGNATURE)
+
+    def test_latency(self):
+        """Test that latency is added to every request"""
+        started = time.time()
+        with faults.inject(self.api, latency=0.05, jitter=0.01) as injector:
+            self.api.user_get_info()
+            self.api.user_get_info()
+
+        self.assertGreaterEqual(time.time() - started, 0.1)
+        self.assertEqual(injector.requests, 2)
+        self.assertGreaterEqual(injector.delay, 0.1)
+
+    def test_new_key(self):
+        """Test that missed key rotations break signatures eventually"""
+        with faults.inject(self.api, new_key_rate=1.0) as injector:
+            with self.assertRaises(MediaFireApiError) as context:
+                for _ in range(50):
+                    self.api.user_get_info()
+
+        self.assertEqual(context.exception.code, ERROR_INVALID_SIGNATURE)
+        self.assertGreater(injector.new_key_flips, 1)
+
+    def test_seed(self):
+        """Test that the same seed injects the same faults"""
+        def run():
+            """Return fault counters of ten calls"""
+            with faults.inject(self.api, drop_rate=0.3, error_rate=0.3,
+                               seed=42) as injector:
+                for _ in range(10):
+                    try:
+                        self.api.user_get_info()
+                    except (MediaFireApiError, MediaFireConnectionError):
+                        pass
+            return injector.drops, injector.errors
+
+        self.assertEqual(run(), run())
+
+    def test_upload_retry(self):
+        """Test that a dropped upload/simple is retried from the start"""
+        self.client.create_folder('mf:///up')
+        injector = DropFirstUpload()
+
+        with wrap_adapters(self.api, injector.adapter):
+            self.client.upload_file(io.BytesIO(b'hello world'),
+                                    'mf:///up/hello.txt')
+
+        self.assertTrue(injector.dropped)
+        self.assertGreater(injector.wasted_bytes, 0)
+
+        target = io.BytesIO()
+        self.client.download_file('mf:///up/hello.txt', target)
+        self.assertEqual(target.getvalue(), b'hello world')
+
+
+class KeyWindowFaultTests(StandInTestCase):
+    """Faults injected into a StandInServer accepting recent secret keys"""
+
+    server_options = {'secret_key_window': 2}
+
+    def setUp(self):
+        super(KeyWindowFaultTests, self).setUp()
+        self.api.retry_policy = RetryPolicy(max_retries=0)
+
+    def test_drop(self):
+        """Test that a secret key window tolerates a lost new_key"""
+        with faults.inject(self.api, drop_rate=1.0):
+            with self.assertRaises(MediaFireConnectionError):
+                self.api.user_get_info()
+
+        self.api.user_get_info()
+
+
+if __name__ == "__main__":
+    unittest.main()
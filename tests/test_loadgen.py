@@ -0,0 +1,74 @@
+"""Load generator tests"""
+
+from __future__ import unicode_literals
+
+import unittest
+
+from mediafire.loadgen import (LoadGenerator, format_report)
+from mediafire.standin import StandInServer
+
+
+class LoadGeneratorTests(unittest.TestCase):
+    """LoadGenerator against StandInServer"""
+
+    def setUp(self):
+        self.server = StandInServer(seed=1).start()
+        self.options = {'api_base': self.server.url,
+                        'email': self.server.email,
+                        'password': self.server.password,
+                        'app_id': self.server.app_id}
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_run(self):
+        """Test that every operation of every client is reported"""
+        generator = LoadGenerator(clients=3, file_size=1024, seed=1,
+                                  **self.options)
+        generator.setup()
+        report = generator.run(operations=10)
+
+        operations = report['operations']
+        self.assertEqual(sum(entry['count'] for entry in operations.values()),
+                         30)
+        self.assertEqual(set(operations),
+                         set(['list', 'lookup', 'upload', 'download']))
+
+        for entry in operations.values():
+            self.assertEqual(entry['errors'], 0)
+            self.assertGreater(entry['throughput'], 0)
+            self.assertLessEqual(entry['p50'], entry['p99'])
+
+        self.assertEqual(operations['upload']['bytes'],
+                         operations['upload']['count'] * 1024)
+        self.assertIn('folder/get_content', report['api'])
+        self.assertIn('lookup', format_report(report))
+
+    def test_mix(self):
+        """Test that only operations in the mix are run"""
+        generator = LoadGenerator(clients=2, mix={'lookup': 1}, seed=1,
+                                  **self.options)
+        generator.setup()
+        report = generator.run(operations=5)
+
+        self.assertEqual(list(report['operations']), ['lookup'])
+        self.assertEqual(report['operations']['lookup']['count'], 10)
+
+        with self.assertRaises(ValueError):
+            LoadGenerator(mix={'delete': 1})
+
+    def test_errors(self):
+        """Test that failed operations are counted, not timed"""
+        generator = LoadGenerator(clients=1, mix={'download': 1},
+                                  **self.options)
+        # no setup(), there is nothing to download
+
+        entry = generator.run(operations=3)['operations']['download']
+
+        self.assertEqual(entry['errors'], 3)
+        self.assertEqual(entry['count'], 0)
+        self.assertIsNone(entry['p99'])
+
+
+if __name__ == "__main__":
+    unittest.main()
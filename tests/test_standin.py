@@ -0,0 +1,310 @@
+"""MediaFire API stand-in server tests"""
+
+from __future__ import unicode_literals
+
+import io
+import os
+import tempfile
+import time
+import unittest
+
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+
+from mediafire import uploader
+from mediafire.batch import BatchUploader
+from mediafire.api import (MediaFireApi, MediaFireApiError)
+from mediafire.client import (MediaFireClient, File, Folder)
+from mediafire.concurrency import AIMDController
+from mediafire.standin import (StandInServer, encode_bitmap,
+                               ERROR_INVALID_SIGNATURE,
+                               ERROR_INVALID_CREDENTIALS)
+from mediafire.uploader import (decode_resumable_upload_bitmap,
+                                MediaFireUploader, HASH_CHUNK_SIZE_BYTES)
+
+
+class StandInTestCase(unittest.TestCase):
+    """Base class for tests against a running stand-in"""
+
+    server_options = {}
+
+    def setUp(self):
+        self.server = StandInServer(seed=1, **self.server_options).start()
+        self.api = MediaFireApi(api_base=self.server.url)
+        self.client = MediaFireClient(api=self.api)
+        self.client.login(email=self.server.email,
+                          password=self.server.password,
+                          app_id=self.server.app_id)
+
+    def tearDown(self):
+        self.server.stop()
+
+
+class BitmapTests(unittest.TestCase):
+    """Bitmap encoding tests"""
+
+    def test_roundtrip(self):
+        """Test that SDK decodes stand-in bitmaps over many words"""
+        units = set([0, 3, 15, 16, 17, 40, 99])
+        decoded = decode_resumable_upload_bitmap(encode_bitmap(units), 100)
+
+        self.assertEqual(set(unit for unit, ready in decoded.items()
+                             if ready), units)
+
+
+class SessionTests(StandInTestCase):
+    """Session and signature tests"""
+
+    def test_key_rotation(self):
+        """Test that signed calls keep working while the key rotates"""
+        secret_key = self.api.session['secret_key']
+
+        for _ in range(5):
+            self.client.get_resource_by_uri('mf:///')
+
+        self.assertNotEqual(self.api.session['secret_key'], secret_key)
+
+    def test_concurrent_calls(self):
+        """Test that concurrent signed calls never use a stale key"""
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(
+                lambda _: self.api.user_get_info(), range(20)))
+
+        self.assertEqual(len(results), 20)
+
+    def test_action_token(self):
+        """Test that action token users share one, then restore the last"""
+        self.api.set_action_token(type_='upload', action_token='previous')
+
+        with self.api.action_token('upload') as token:
+            with self.api.action_token('upload') as nested:
+                self.assertEqual(nested, token)
+            self.api.user_get_info()
+
+        # pylint: disable=protected-access
+        self.assertEqual(self.api._action_tokens, {'upload': 'previous'})
+        self.assertEqual(self.server.calls['user/get_action_token'], 1)
+        self.assertEqual(self.server.calls['user/destroy_action_token'], 1)
+
+    def test_stale_key(self):
+        """Test that only the current secret key is accepted"""
+        secret_key = self.api.session['secret_key']
+        self.api.user_get_info()
+
+        self.api.session['secret_key'] = secret_key
+        with self.assertRaises(MediaFireApiError) as context:
+            self.api.user_get_info()
+
+        self.assertEqual(context.exception.code, ERROR_INVALID_SIGNATURE)
+
+    def test_bad_signature(self):
+        """Test that a call signed with a wrong key is rejected"""
+        self.api.session['secret_key'] = '1'
+
+        with self.assertRaises(MediaFireApiError) as context:
+            self.api.user_get_info()
+
+        self.assertEqual(context.exception.code, ERROR_INVALID_SIGNATURE)
+
+    def test_bad_credentials(self):
+        """Test that login with a wrong password is rejected"""
+        with self.assertRaises(MediaFireApiError) as context:
+            self.client.login(email=self.server.email, password='wrong',
+                              app_id=self.server.app_id)
+
+        self.assertEqual(context.exception.code, ERROR_INVALID_CREDENTIALS)
+
+
+class ConcurrencyTests(StandInTestCase):
+    """Concurrent calls against a stand-in with latency"""
+
+    def test_walk(self):
+        """Test that walk listings are in flight concurrently"""
+        for name in 'abcdef':
+            self.client.create_folder('mf:///{}/sub'.format(name),
+                                      recursive=True)
+        self.server.latency = 0.1
+
+        started = time.time()
+        paths = [path for path, _, _, _ in
+                 self.client.walk('mf:///', max_workers=4)]
+
+        # 13 folders listed with 2 calls each take 2.6s one at a time
+        self.assertEqual(len(paths), 13)
+        self.assertLess(time.time() - started, 2)
+
+        calls = self.server.calls
+        self.assertEqual(calls['user/get_action_token'], 1)
+        self.assertEqual(calls['user/destroy_action_token'], 1)
+
+    def test_resumable_units(self):
+        """Test that resumable upload units are in flight concurrently"""
+        self.addCleanup(setattr, uploader, 'UPLOAD_SIMPLE_LIMIT_BYTES',
+                        uploader.UPLOAD_SIMPLE_LIMIT_BYTES)
+        self.addCleanup(setattr, uploader, 'UPLOAD_POLL_INTERVAL_MIN',
+                        uploader.UPLOAD_POLL_INTERVAL_MIN)
+        uploader.UPLOAD_SIMPLE_LIMIT_BYTES = HASH_CHUNK_SIZE_BYTES
+        uploader.UPLOAD_POLL_INTERVAL_MIN = 0.01
+        self.server.unit_size = HASH_CHUNK_SIZE_BYTES
+        mf_uploader = MediaFireUploader(
+            self.api, concurrency=AIMDController(min_limit=4, max_limit=4))
+
+        with tempfile.TemporaryFile() as fd:
+            fd.write(os.urandom(HASH_CHUNK_SIZE_BYTES * 20 + 100))
+            fd.seek(0)
+            self.server.latency = 0.1
+
+            started = time.time()
+            result = mf_uploader.upload(fd, 'big.bin')
+
+        # 21 units take 2.1s one at a time
+        self.assertEqual(result.action, 'upload/resumable')
+        self.assertLess(time.time() - started, 1.8)
+        self.assertEqual(self.server.calls['upload/resumable'], 21)
+        self.assertEqual(self.server.calls['user/destroy_action_token'], 1)
+        # pylint: disable=protected-access
+        self.assertEqual(self.api._action_tokens, {})
+
+
+class SecretKeyWindowTests(StandInTestCase):
+    """Session tests with recent secret keys accepted"""
+
+    server_options = {'secret_key_window': 2}
+
+    def test_stale_key(self):
+        """Test that a call signed with the previous key is accepted"""
+        secret_key = self.api.session['secret_key']
+        self.api.user_get_info()
+
+        # as if the new_key response was lost
+        self.api.session['secret_key'] = secret_key
+        self.api.user_get_info()
+
+
+class FolderTests(StandInTestCase):
+    """Folder operation tests"""
+
+    def test_create_and_resolve(self):
+        """Test that created folders resolve by path"""
+        folder = self.client.create_folder('mf:///a/b/c', recursive=True)
+
+        resource = self.client.get_resource_by_uri('mf:///a/b/c')
+
+        self.assertIsInstance(resource, Folder)
+        self.assertEqual(resource['folderkey'], folder['folderkey'])
+
+    def test_get_content_paging(self):
+        """Test that listings are paged by chunk_size"""
+        self.client.create_folder('mf:///many')
+        for number in range(7):
+            self.client.upload_file(io.BytesIO(b'x'),
+                                    'mf:///many/f{}.txt'.format(number))
+
+        self.server.calls.clear()
+        items = list(self.client.list_folder('mf:///many'))
+
+        self.assertEqual(len(items), 7)
+
+        folder_key = self.client.get_resource_by_uri(
+            'mf:///many')['folderkey']
+        content = self.api.folder_get_content(
+            folder_key=folder_key, content_type='files', chunk=2,
+            chunk_size=3, order_by='name', order_direction='desc')
+        names = [item['filename']
+                 for item in content['folder_content']['files']]
+
+        self.assertEqual(names, ['f3.txt', 'f2.txt', 'f1.txt'])
+        self.assertEqual(content['folder_content']['more_chunks'], 'yes')
+
+    def test_delete(self):
+        """Test that deleted folder is gone"""
+        self.client.create_folder('mf:///gone')
+        self.client.delete_folder('mf:///gone')
+
+        self.assertEqual(
+            [item['name'] for item in
+             self.client.get_folder_contents_iter('mf:///')], [])
+
+
+class UploadDownloadTests(StandInTestCase):
+    """Upload and download tests"""
+
+    server_options = {'unit_size': HASH_CHUNK_SIZE_BYTES,
+                      'processing_polls': 1}
+
+    def setUp(self):
+        super(UploadDownloadTests, self).setUp()
+        self.orig_limit = uploader.UPLOAD_SIMPLE_LIMIT_BYTES
+        self.orig_poll = uploader.UPLOAD_POLL_INTERVAL_MIN
+        uploader.UPLOAD_POLL_INTERVAL_MIN = 0.01
+        self.client.create_folder('mf:///up')
+
+    def tearDown(self):
+        uploader.UPLOAD_SIMPLE_LIMIT_BYTES = self.orig_limit
+        uploader.UPLOAD_POLL_INTERVAL_MIN = self.orig_poll
+        super(UploadDownloadTests, self).tearDown()
+
+    def test_simple_then_instant(self):
+        """Test upload/simple and upload/instant of the same content"""
+        first = self.client.upload_file(io.BytesIO(b'hello'),
+                                        'mf:///up/hello.txt')
+        second = self.client.upload_file(io.BytesIO(b'hello'),
+                                         'mf:///up/copy.txt')
+
+        self.assertEqual(first.action, 'upload/simple')
+        self.assertEqual(second.action, 'upload/instant')
+        self.assertNotEqual(first.quickkey, second.quickkey)
+
+        resource = self.client.get_resource_by_uri('mf:///up/copy.txt')
+        self.assertIsInstance(resource, File)
+        self.assertEqual(resource['size'], '5')
+
+    def test_resumable(self):
+        """Test resumable upload of many units and download back"""
+        uploader.UPLOAD_SIMPLE_LIMIT_BYTES = HASH_CHUNK_SIZE_BYTES
+        data = os.urandom(HASH_CHUNK_SIZE_BYTES * 20 + 100)
+
+        result = self.client.upload_file(io.BytesIO(data), 'mf:///up/big.bin')
+
+        self.assertEqual(result.action, 'upload/resumable')
+        self.assertEqual(self.server.calls['upload/resumable'], 21)
+
+        target = io.BytesIO()
+        self.client.download_file('mf:///up/big.bin', target)
+        self.assertEqual(target.getvalue(), data)
+
+    def test_upload_after_batch(self):
+        """Test that batches restore the upload action token on exit"""
+        batch = BatchUploader(self.client, upload_workers=2)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            runs = [executor.submit(list, batch.upload(
+                [(io.BytesIO(os.urandom(16)), 'mf:///up/{}{}'.format(run, i))
+                 for i in range(3)])) for run in ('x', 'y')]
+            results = [item for run in runs for item in run.result()]
+
+        self.assertEqual([item.error for item in results], [None] * 6)
+        self.assertEqual(self.server.calls['user/get_action_token'],
+                         self.server.calls['user/destroy_action_token'])
+        self.assertEqual(self.api._action_tokens, {})
+
+        result = self.client.upload_file(io.BytesIO(b'later'),
+                                         'mf:///up/later.txt')
+        self.assertEqual(result.action, 'upload/simple')
+
+    def test_range(self):
+        """Test partial direct download"""
+        result = self.client.upload_file(io.BytesIO(b'0123456789'),
+                                         'mf:///up/digits.txt')
+        link = self.api.file_get_links(result.quickkey)['links'][0]
+
+        response = requests.get(link['direct_download'],
+                                headers={'Range': 'bytes=2-5'})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'2345')
+        self.assertEqual(response.headers['Content-Range'], 'bytes 2-5/10')
+
+
+if __name__ == "__main__":
+    unittest.main()
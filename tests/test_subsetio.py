@@ -63,6 +63,19 @@ class TestSubsetIOBasics(SubsetIOTest):
             with self.assertRaises(ValueError):
                 chunked_fd.seek(11)
 
+    def test_shared_offset(self):
+        """Test that interleaved reads of views do not mix up data"""
+        first = SubsetIO(self.fd, 0, 11)
+        second = SubsetIO(self.fd, 11 * 1024, 11)
+
+        self.assertEqual(first.read(4), b'0123')
+        self.assertEqual(second.read(4), b'0123')
+        self.assertEqual(first.read(), b'4567890')
+        self.assertEqual(second.read(), b'4567890')
+
+        first.close()
+        second.close()
+
 
 class TestSubsetIOStringIO(unittest.TestCase):
     """Test SubsetIO with StringIO"""
@@ -0,0 +1,277 @@
+"""Tracing tests"""
+
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mediafire import tracing, uploader
+from mediafire.concurrency import AIMDController
+from mediafire.tracing import (Tracer, InMemoryExporter, JsonFileExporter,
+                               STATUS_ERROR)
+from mediafire.uploader import (MediaFireUploader, HASH_CHUNK_SIZE_BYTES)
+
+from tests.test_standin import StandInTestCase
+
+
+class TracerTests(unittest.TestCase):
+    """Built-in tracer tests"""
+
+    def setUp(self):
+        self.exporter = InMemoryExporter()
+        tracing.set_tracer(Tracer(self.exporter))
+
+    def tearDown(self):
+        tracing.set_tracer(None)
+
+    def test_nesting(self):
+        """Test that spans nest within the thread"""
+        with tracing.span('outer') as outer:
+            with tracing.span('inner', {'answer': 42, 'none': None}):
+                pass
+
+        inner, exported_outer = self.exporter.spans
+
+        self.assertIs(exported_outer, outer)
+        self.assertEqual(inner.parent_id, outer.span_id)
+        self.assertEqual(inner.trace_id, outer.trace_id)
+        self.assertIsNone(outer.parent_id)
+        self.assertEqual(inner.attributes, {'answer': 42})
+        self.assertGreaterEqual(outer.end_time, inner.end_time)
+
+    def test_exception(self):
+        """Test that exceptions are recorded and re-raised"""
+        @tracing.traced('failing')
+        def failing():
+            """Raise ValueError"""
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            failing()
+
+        span = self.exporter.spans[0]
+        self.assertEqual(span.status, STATUS_ERROR)
+        self.assertEqual(span.events[0]['name'], 'exception')
+        self.assertEqual(span.events[0]['attributes']['exception.type'],
+                         'ValueError')
+
+    def test_bind(self):
+        """Test that bound function runs in the caller's span"""
+        def child():
+            """Open span in another thread"""
+            with tracing.span('child'):
+                pass
+
+        with tracing.span('parent') as parent:
+            thread = threading.Thread(target=tracing.bind(child))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(self.exporter.spans[0].parent_id, parent.span_id)
+
+    def test_detached_span(self):
+        """Test that detached span is not current but can be bound"""
+        def child():
+            """Open span in another thread"""
+            with tracing.span('child'):
+                pass
+
+        tracer = tracing.get_tracer()
+        with tracing.span('outer') as outer:
+            with tracing.detached_span('detached') as detached:
+                self.assertIs(tracer.current_span(), outer)
+                thread = threading.Thread(
+                    target=tracing.bind(child, parent=detached))
+                thread.start()
+                thread.join()
+
+        child, exported_detached, _ = self.exporter.spans
+
+        self.assertIs(exported_detached, detached)
+        self.assertEqual(detached.parent_id, outer.span_id)
+        self.assertEqual(child.parent_id, detached.span_id)
+
+    def test_disabled(self):
+        """Test that nothing is recorded without a tracer"""
+        tracing.set_tracer(None)
+
+        with tracing.span('ignored') as span:
+            span.set_attribute('key', 'value')
+            self.assertFalse(span.is_recording())
+
+        self.assertEqual(self.exporter.spans, [])
+
+
+class JsonFileExporterTests(unittest.TestCase):
+    """JsonFileExporter tests"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'spans.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_export(self):
+        """Test that finished spans are written as JSON lines"""
+        exporter = JsonFileExporter(self.path)
+        tracer = Tracer(exporter)
+
+        with tracer.start_as_current_span('outer'):
+            with tracer.start_as_current_span('inner', {'size': 1}):
+                pass
+        exporter.close()
+
+        with io.open(self.path, encoding='utf-8') as fd:
+            spans = [json.loads(line) for line in fd]
+
+        self.assertEqual([span['name'] for span in spans],
+                         ['inner', 'outer'])
+        self.assertEqual(spans[0]['parent_span_id'], spans[1]['span_id'])
+        self.assertEqual(spans[0]['attributes'], {'size': 1})
+        self.assertGreaterEqual(spans[1]['end_time_unix_nano'],
+                                spans[1]['start_time_unix_nano'])
+
+
+class UploadTracingTests(StandInTestCase):
+    """Spans of an upload against StandInServer"""
+
+    server_options = {'unit_size': HASH_CHUNK_SIZE_BYTES}
+
+    def setUp(self):
+        super(UploadTracingTests, self).setUp()
+        self.orig_limit = uploader.UPLOAD_SIMPLE_LIMIT_BYTES
+        uploader.UPLOAD_SIMPLE_LIMIT_BYTES = HASH_CHUNK_SIZE_BYTES
+        self.client.create_folder('mf:///up')
+
+        self.exporter = InMemoryExporter()
+        tracing.set_tracer(Tracer(self.exporter))
+
+    def tearDown(self):
+        tracing.set_tracer(None)
+        uploader.UPLOAD_SIMPLE_LIMIT_BYTES = self.orig_limit
+        super(UploadTracingTests, self).tearDown()
+
+    def parent_names(self):
+        """Return dict of span name to set of parent span names"""
+        by_id = dict((span.span_id, span) for span in self.exporter.spans)
+        result = {}
+        for span in self.exporter.spans:
+            parent = by_id.get(span.parent_id)
+            result.setdefault(span.name, set()).add(
+                parent.name if parent is not None else None)
+        return result
+
+    def test_resumable(self):
+        """Test that uploader phases nest HTTP calls, units included"""
+        folder_key = self.client.get_resource_by_uri('mf:///up')['folderkey']
+        self.exporter.spans = []
+        # a real file, so units are uploaded in parallel
+        fd = tempfile.TemporaryFile()
+        fd.write(os.urandom(HASH_CHUNK_SIZE_BYTES * 4))
+
+        media_uploader = MediaFireUploader(
+            self.api, concurrency=AIMDController(max_limit=4))
+        media_uploader.upload(fd, 'big.bin', folder_key=folder_key)
+        fd.close()
+
+        parents = self.parent_names()
+
+        self.assertEqual(parents['uploader.upload'], set([None]))
+        self.assertEqual(parents['uploader.compute_hash_info'],
+                         set(['uploader.upload']))
+        self.assertEqual(parents['upload/check'], set(['uploader.check']))
+        self.assertEqual(parents['uploader.unit'],
+                         set(['uploader.resumable']))
+        self.assertEqual(parents['upload/resumable'], set(['uploader.unit']))
+        self.assertEqual(parents['upload/poll_upload'],
+                         set(['uploader.poll']))
+
+        units = [span for span in self.exporter.spans
+                 if span.name == 'uploader.unit']
+        self.assertEqual(sorted(span.attributes['mediafire.unit_id']
+                                for span in units), [0, 1, 2, 3])
+
+        resumable = [span for span in self.exporter.spans
+                     if span.name == 'upload/resumable'][0]
+        self.assertEqual(resumable.attributes['http.status_code'], 200)
+        self.assertGreater(resumable.attributes['mediafire.bytes_out'],
+                           HASH_CHUNK_SIZE_BYTES)
+
+    def test_client(self):
+        """Test that client operations are the root spans"""
+        self.client.upload_file(io.BytesIO(b'hello'), 'mf:///up/hello.txt')
+        self.client.download_file('mf:///up/hello.txt', io.BytesIO())
+
+        parents = self.parent_names()
+
+        self.assertEqual(parents['client.upload_file'], set([None]))
+        self.assertEqual(parents['client.download_file'], set([None]))
+        self.assertEqual(parents['uploader.upload'],
+                         set(['client.upload_file']))
+        self.assertEqual(parents['client.download'],
+                         set(['client.download_file']))
+        self.assertIn('client.download_file',
+                      parents['client.get_resource_by_uri'])
+
+
+class CrawlTracingTests(StandInTestCase):
+    """Spans of a tree crawl against StandInServer"""
+
+    def setUp(self):
+        super(CrawlTracingTests, self).setUp()
+        for name in 'abc':
+            self.client.create_folder('mf:///{}/sub'.format(name),
+                                      recursive=True)
+
+        self.exporter = InMemoryExporter()
+        tracing.set_tracer(Tracer(self.exporter))
+
+    def tearDown(self):
+        tracing.set_tracer(None)
+        super(CrawlTracingTests, self).tearDown()
+
+    def test_tree_stats(self):
+        """Test that listings nest in the tree_stats span"""
+        stats = list(self.client.tree_stats('mf:///', max_workers=2))
+
+        self.assertEqual(len(stats), 7)
+
+        root = [span for span in self.exporter.spans
+                if span.name == 'client.tree_stats']
+        listings = [span for span in self.exporter.spans
+                    if span.name == 'folder/get_content']
+
+        self.assertEqual(len(root), 1)
+        self.assertGreater(root[0].end_time, root[0].start_time)
+        self.assertTrue(listings)
+        for span in listings:
+            self.assertEqual(span.parent_id, root[0].span_id)
+            self.assertLessEqual(span.end_time, root[0].end_time)
+
+    def test_tree_stats_not_current(self):
+        """Test that the tree_stats span does not leak into the caller"""
+        tracer = tracing.get_tracer()
+
+        with tracing.span('outer') as outer:
+            stats = self.client.tree_stats('mf:///', max_workers=2)
+            next(stats)
+            self.assertIs(tracer.current_span(), outer)
+
+        next(stats)
+        self.assertIsNone(tracer.current_span())
+        stats.close()
+
+        root = [span for span in self.exporter.spans
+                if span.name == 'client.tree_stats']
+        self.assertEqual(root[0].parent_id, outer.span_id)
+        self.assertFalse(root[0].is_recording())
+
+
+if __name__ == "__main__":
+    unittest.main()
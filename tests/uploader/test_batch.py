@@ -0,0 +1,324 @@
+"""Batch uploader tests"""
+
+from __future__ import unicode_literals
+
+import io
+import threading
+import time
+import unittest
+
+import six
+
+if six.PY3:
+    from unittest.mock import MagicMock
+elif six.PY2:
+    from mock import MagicMock
+
+from mediafire import batch
+from mediafire.api import MediaFireApi
+from mediafire.batch import BatchUploader
+from mediafire.client import (Folder, ResourceNotFoundError)
+from mediafire.uploader import (UploadResult, RetriableUploadError,
+                                compute_hash_info)
+
+from concurrent.futures import Future
+
+
+class DummyApi(MediaFireApi):
+    """Logged in MediaFireApi with action token calls mocked"""
+
+    def __init__(self):
+        super(DummyApi, self).__init__()
+        self.session = {'session_token': 'session', 'secret_key': '1',
+                        'time': '1.0'}
+        self.user_get_action_token = MagicMock(
+            return_value={'action_token': 'token'})
+        self.user_destroy_action_token = MagicMock()
+
+
+class DummyClient(object):
+    """MediaFireClient stand-in counting folder lookups"""
+
+    def __init__(self):
+        self.api = DummyApi()
+        self.lookups = []
+        self._lock = threading.Lock()
+
+    def get_resource_by_uri(self, uri):
+        """Return a Folder for everything except mf:///missing"""
+        with self._lock:
+            self.lookups.append(uri)
+        if uri == 'mf:///missing':
+            raise ResourceNotFoundError(uri)
+        return Folder({'folderkey': uri[-1] * 13})
+
+
+def fake_upload(fd=None, name=None, hash_info=None, **_):
+    """Stand-in for MediaFireUploader.upload and upload_instant"""
+    return UploadResult(action='upload/simple', quickkey='q' * 15,
+                        hash_=hash_info.file, filename=name,
+                        size=hash_info.size, created=None, revision=None)
+
+
+class BatchUploaderTests(unittest.TestCase):
+    """BatchUploader tests"""
+
+    def setUp(self):
+        self.client = DummyClient()
+        self.batch = BatchUploader(self.client, hash_workers=2,
+                                   upload_workers=3)
+        self.batch._uploader.upload = MagicMock(side_effect=fake_upload)
+
+    def test_all_items_uploaded(self):
+        """Test that every item yields a result with the right target"""
+        items = [(io.BytesIO(b'data' + str(i).encode('ascii')),
+                  'mf:///a/file{}.txt'.format(i)) for i in range(20)]
+
+        results = list(self.batch.upload(items))
+
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(item.error is None for item in results))
+        self.assertEqual(
+            sorted(item.result.filename for item in results),
+            sorted('file{}.txt'.format(i) for i in range(20)))
+
+        kwargs = self.batch._uploader.upload.call_args[1]
+        self.assertEqual(kwargs['folder_key'], 'a' * 13)
+        self.assertEqual(kwargs['action_on_duplicate'], 'replace')
+
+    def test_folders_resolved_once(self):
+        """Test that each destination folder is looked up only once"""
+        items = [(io.BytesIO(b'x'), 'mf:///{}/f{}'.format(folder, i))
+                 for i in range(10) for folder in ('a', 'b')]
+
+        list(self.batch.upload(items))
+
+        self.assertEqual(sorted(self.client.lookups),
+                         ['mf:///a', 'mf:///b'])
+
+    def test_single_action_token(self):
+        """Test that one upload action token is shared by the batch"""
+        items = [(io.BytesIO(b'x'), 'mf:///a/f{}'.format(i))
+                 for i in range(5)]
+
+        list(self.batch.upload(items))
+
+        self.assertEqual(self.client.api.user_get_action_token.call_count, 1)
+
+    def test_action_token_restored(self):
+        """Test that the upload action token set before is restored"""
+        self.client.api.set_action_token(type_='upload',
+                                         action_token='previous')
+
+        list(self.batch.upload([(io.BytesIO(b'x'), 'mf:///a/f')]))
+
+        self.assertEqual(self.client.api._action_tokens,
+                         {'upload': 'previous'})
+        self.client.api.user_destroy_action_token.assert_called_once_with(
+            action_token='token')
+
+    def test_errors_reported(self):
+        """Test that failures are reported per item"""
+        items = [(io.BytesIO(b'x'), 'mf:///missing/f'),
+                 (io.BytesIO(b'y'), 'mf:///a/g')]
+
+        results = dict((item.dest_uri, item)
+                       for item in self.batch.upload(items))
+
+        self.assertIsInstance(results['mf:///missing/f'].error,
+                              ResourceNotFoundError)
+        self.assertIsNone(results['mf:///a/g'].error)
+
+    def test_missing_folder_cached(self):
+        """Test that a missing folder is looked up only once"""
+        items = [(io.BytesIO(b'x'), 'mf:///missing/f{}'.format(i))
+                 for i in range(5)]
+
+        results = list(self.batch.upload(items))
+
+        self.assertTrue(all(isinstance(item.error, ResourceNotFoundError)
+                            for item in results))
+        self.assertEqual(self.client.lookups, ['mf:///missing'])
+
+    def test_folders_resolved_concurrently(self):
+        """Test that a slow lookup does not hold up other folders"""
+        b_resolved = threading.Event()
+        get_resource_by_uri = self.client.get_resource_by_uri
+
+        def lookup(uri):
+            """Resolve mf:///a only after mf:///b"""
+            if uri == 'mf:///a':
+                self.assertTrue(b_resolved.wait(5))
+            folder = get_resource_by_uri(uri)
+            if uri == 'mf:///b':
+                b_resolved.set()
+            return folder
+
+        self.client.get_resource_by_uri = lookup
+
+        items = [(io.BytesIO(b'x'), 'mf:///a/f'),
+                 (io.BytesIO(b'y'), 'mf:///b/f')]
+
+        results = list(self.batch.upload(items))
+
+        self.assertTrue(all(item.error is None for item in results))
+
+    def test_folder_target_uses_source_name(self):
+        """Test that folder URIs take file name from the source path"""
+        self.assertEqual(
+            BatchUploader._split_dest_uri('/tmp/x.txt', 'mf:///a/'),
+            ('mf:///a', 'x.txt'))
+        self.assertEqual(
+            BatchUploader._split_dest_uri('/tmp/x.txt', 'mf:///y.txt'),
+            ('mf:///', 'y.txt'))
+
+
+class BatchUploaderPollingTests(unittest.TestCase):
+    """Deferred polling tests"""
+
+    def setUp(self):
+        self.client = DummyClient()
+        self.batch = BatchUploader(self.client)
+        self.attempts = []
+
+    def deferred_upload(self, fd, **kwargs):
+        """Return poll Future, fail the first poll of every file"""
+        self.assertIsNotNone(kwargs['poller'])
+        self.attempts.append(kwargs['name'])
+
+        future = Future()
+        if self.attempts.count(kwargs['name']) == 1:
+            future.set_exception(RetriableUploadError("try again"))
+        else:
+            future.set_result(fake_upload(fd, **kwargs))
+        return future
+
+    def test_poll_futures_resolved(self):
+        """Test that poll futures are followed and retried"""
+        self.batch._uploader.upload = MagicMock(
+            side_effect=self.deferred_upload)
+
+        items = [(io.BytesIO(b'data' + str(i).encode('ascii')),
+                  'mf:///a/f{}'.format(i)) for i in range(4)]
+
+        results = list(self.batch.upload(items))
+
+        self.assertTrue(all(item.error is None for item in results))
+        self.assertTrue(all(item.result.quickkey == 'q' * 15
+                            for item in results))
+        self.assertEqual(len(self.attempts), 8)
+
+
+class BatchUploaderDuplicateTests(unittest.TestCase):
+    """Duplicate content coalescing tests"""
+
+    def setUp(self):
+        self.client = DummyClient()
+        self.batch = BatchUploader(self.client)
+        self.uploader = self.batch._uploader
+        self.uploader.upload = MagicMock(side_effect=fake_upload)
+        self.uploader.upload_instant = MagicMock(side_effect=fake_upload)
+
+    def test_duplicates_uploaded_once(self):
+        """Test that identical content is transferred only once"""
+        items = [(io.BytesIO(b'same'), 'mf:///a/copy{}'.format(i))
+                 for i in range(6)]
+        items.append((io.BytesIO(b'other'), 'mf:///a/other'))
+
+        results = list(self.batch.upload(items))
+
+        self.assertTrue(all(item.error is None for item in results))
+        self.assertEqual(self.uploader.upload.call_count, 2)
+        self.assertEqual(self.uploader.upload_instant.call_count, 5)
+
+    def test_failed_first_copy_hands_over(self):
+        """Test that a copy is uploaded if the first transfer failed"""
+        calls = []
+
+        def upload(fd, **kwargs):
+            """Fail the first transfer only"""
+            calls.append(kwargs['name'])
+            if len(calls) == 1:
+                raise ValueError("boom")
+            return fake_upload(fd, **kwargs)
+
+        self.uploader.upload.side_effect = upload
+
+        items = [(io.BytesIO(b'same'), 'mf:///a/copy{}'.format(i))
+                 for i in range(3)]
+
+        results = list(self.batch.upload(items))
+        errors = [item for item in results if item.error is not None]
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.uploader.upload_instant.call_count, 1)
+
+    def test_coalescing_disabled(self):
+        """Test that coalescing can be turned off"""
+        self.batch.coalesce_duplicates = False
+
+        items = [(io.BytesIO(b'same'), 'mf:///a/copy{}'.format(i))
+                 for i in range(3)]
+
+        list(self.batch.upload(items))
+
+        self.assertEqual(self.uploader.upload.call_count, 3)
+        self.assertFalse(self.uploader.upload_instant.called)
+
+
+class BatchUploaderPipelineTests(unittest.TestCase):
+    """Hash-ahead pipelining tests"""
+
+    def setUp(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+        def hash_info(fd, unit_size=None):
+            """Record hashing"""
+            with self.lock:
+                self.events.append('hash')
+            return compute_hash_info(fd, unit_size)
+
+        def upload(fd, **kwargs):
+            """Record slow transfer"""
+            with self.lock:
+                self.events.append('upload')
+            time.sleep(0.01)
+            return fake_upload(fd, **kwargs)
+
+        self.orig_compute_hash_info = batch.compute_hash_info
+        batch.compute_hash_info = hash_info
+
+        self.batch = BatchUploader(DummyClient(), upload_workers=1,
+                                   hash_ahead=1)
+        self.batch._uploader.upload = MagicMock(side_effect=upload)
+
+    def tearDown(self):
+        batch.compute_hash_info = self.orig_compute_hash_info
+
+    def test_hash_ahead_is_bounded(self):
+        """Test that hashing overlaps transfers but stays close behind"""
+        items = [(io.BytesIO(b'x' * (i + 1)), 'mf:///a/f{}'.format(i))
+                 for i in range(8)]
+
+        list(self.batch.upload(items))
+
+        uploads = 0
+        hashes = 0
+        for event in self.events:
+            if event == 'hash':
+                hashes += 1
+            else:
+                # current file, the one hashed ahead and one in between
+                self.assertLessEqual(hashes, uploads + 2)
+                uploads += 1
+
+        # hashing continued while transfers were running
+        first_upload = self.events.index('upload')
+        self.assertIn('hash', self.events[first_upload:])
+        self.assertEqual(hashes, 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+"""Upload checkpoint tests"""
+
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import six
+
+if six.PY3:
+    from unittest.mock import MagicMock
+elif six.PY2:
+    from mock import MagicMock
+
+from mediafire import uploader
+from mediafire.checkpoint import UploadCheckpointJournal
+from mediafire.uploader import (MediaFireUploader, compute_hash_info)
+
+
+class UploadCheckpointJournalTests(unittest.TestCase):
+    """UploadCheckpointJournal tests"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.journal = UploadCheckpointJournal(
+            os.path.join(self.tmpdir, 'journal'))
+
+        self.source_path = os.path.join(self.tmpdir, 'source.bin')
+        with open(self.source_path, 'wb') as source:
+            source.write(b'0123456789' * 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def lookup(self):
+        """Look checkpoint of the source file up"""
+        with open(self.source_path, 'rb') as source:
+            return self.journal.lookup(source, name='source.bin',
+                                       folder_key='folder')
+
+    def test_roundtrip(self):
+        """Test that saved checkpoint is returned by lookup"""
+        checkpoint = self.lookup()
+        self.assertIsNone(checkpoint.hash_info)
+
+        with open(self.source_path, 'rb') as source:
+            checkpoint.hash_info = compute_hash_info(source, 16)
+        checkpoint.unit_size = 16
+        self.journal.save(checkpoint)
+
+        restored = self.lookup()
+        self.assertEqual(restored.key, checkpoint.key)
+        self.assertEqual(restored.hash_info, checkpoint.hash_info)
+        self.assertEqual(restored.unit_size, 16)
+
+    def test_destination_is_part_of_key(self):
+        """Test that each destination gets own checkpoint"""
+        with open(self.source_path, 'rb') as source:
+            first = self.journal.lookup(source, name='a', folder_key='f')
+            second = self.journal.lookup(source, name='b', folder_key='f')
+
+        self.assertNotEqual(first.key, second.key)
+
+    def test_changed_source(self):
+        """Test that checkpoint of modified file is discarded"""
+        checkpoint = self.lookup()
+        with open(self.source_path, 'rb') as source:
+            checkpoint.hash_info = compute_hash_info(source)
+        self.journal.save(checkpoint)
+
+        with open(self.source_path, 'ab') as source:
+            source.write(b'more')
+
+        restored = self.lookup()
+        self.assertEqual(restored.key, checkpoint.key)
+        self.assertIsNone(restored.hash_info)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.journal.path, checkpoint.key + '.json')))
+
+    def test_not_a_file(self):
+        """Test that in-memory sources are not checkpointed"""
+        self.assertIsNone(self.journal.lookup(io.BytesIO(b'data')))
+
+
+class UploaderCheckpointTests(unittest.TestCase):
+    """MediaFireUploader checkpoint integration tests"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.journal = UploadCheckpointJournal(self.tmpdir)
+
+        self.source_path = os.path.join(self.tmpdir, 'source.bin')
+        with open(self.source_path, 'wb') as source:
+            source.write(b'x' * 64)
+
+        self.orig_limit = uploader.UPLOAD_SIMPLE_LIMIT_BYTES
+        # make the source file resumable
+        uploader.UPLOAD_SIMPLE_LIMIT_BYTES = 32
+
+        self.uploader = MediaFireUploader(MagicMock(),
+                                          checkpoint_journal=self.journal)
+        self.uploader._upload = MagicMock(return_value='result')
+
+    def tearDown(self):
+        uploader.UPLOAD_SIMPLE_LIMIT_BYTES = self.orig_limit
+        shutil.rmtree(self.tmpdir)
+
+    def test_reuse_hash(self):
+        """Test that checkpointed hash is not computed again"""
+        with open(self.source_path, 'rb') as source:
+            checkpoint = self.journal.lookup(source, name='source.bin',
+                                             folder_key='folder')
+            checkpoint.hash_info = compute_hash_info(source, 16)
+            checkpoint.unit_size = 16
+            self.journal.save(checkpoint)
+
+        orig_compute_hash_info = uploader.compute_hash_info
+        uploader.compute_hash_info = MagicMock(
+            side_effect=AssertionError("hash computed"))
+        try:
+            with open(self.source_path, 'rb') as source:
+                result = self.uploader.upload(source, 'source.bin',
+                                              folder_key='folder')
+        finally:
+            uploader.compute_hash_info = orig_compute_hash_info
+
+        self.assertEqual(result, 'result')
+        upload_info = self.uploader._upload.call_args[0][0]
+        self.assertEqual(upload_info.hash_info, checkpoint.hash_info)
+
+        # successful upload removes the checkpoint
+        self.assertEqual(os.listdir(self.tmpdir), ['source.bin'])
+
+    def test_failed_upload_keeps_checkpoint(self):
+        """Test that checkpoint survives failed upload"""
+        def interrupted_upload(upload_info):
+            """Save checkpoint as the resumable upload would, then fail"""
+            upload_info.checkpoint.hash_info = upload_info.hash_info
+            upload_info.checkpoint.unit_size = 16
+            self.journal.save(upload_info.checkpoint)
+            raise IOError("connection lost")
+
+        self.uploader._upload.side_effect = interrupted_upload
+
+        with open(self.source_path, 'rb') as source:
+            with self.assertRaises(IOError):
+                self.uploader.upload(source, 'source.bin',
+                                     folder_key='folder')
+
+        with open(self.source_path, 'rb') as source:
+            checkpoint = self.journal.lookup(source, name='source.bin',
+                                             folder_key='folder')
+
+        self.assertEqual(checkpoint.unit_size, 16)
+        self.assertIsNotNone(checkpoint.hash_info)
+
+
+class ResumeTests(unittest.TestCase):
+    """Resuming an upload whose units were all sent"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source_path = os.path.join(self.tmpdir, 'source.bin')
+        with open(self.source_path, 'wb') as source:
+            source.write(b'x' * 64)
+
+        self.orig_limit = uploader.UPLOAD_SIMPLE_LIMIT_BYTES
+        # make the source file resumable
+        uploader.UPLOAD_SIMPLE_LIMIT_BYTES = 32
+
+        self.api = MagicMock()
+        self.api.upload_check.return_value = {
+            'hash_exists': 'no', 'in_folder': 'no', 'file_exists': 'no',
+            'resumable_upload': {
+                'all_units_ready': 'yes', 'number_of_units': '1',
+                'unit_size': '64', 'bitmap': {'count': '1', 'words': ['1']},
+                'upload_key': 'k' * 11
+            }
+        }
+        self.api.upload_poll.return_value = {
+            'doupload': {
+                'result': '0', 'status': '99', 'description': 'done',
+                'fileerror': '', 'quickkey': 'q' * 15, 'hash': 'h',
+                'filename': 'source.bin', 'size': '64', 'created': '',
+                'revision': '2'
+            }
+        }
+        self.uploader = MediaFireUploader(
+            self.api, checkpoint_journal=UploadCheckpointJournal(
+                os.path.join(self.tmpdir, 'journal')))
+
+    def tearDown(self):
+        uploader.UPLOAD_SIMPLE_LIMIT_BYTES = self.orig_limit
+        shutil.rmtree(self.tmpdir)
+
+    def upload(self):
+        """Upload the source file"""
+        with open(self.source_path, 'rb') as source:
+            return self.uploader.upload(source, 'source.bin',
+                                        folder_key='folder')
+
+    def test_poll_upload_key(self):
+        """Test that upload key reported by upload/check is polled"""
+        result = self.upload()
+
+        self.assertEqual(result.quickkey, 'q' * 15)
+        self.api.upload_poll.assert_called_once_with('k' * 11)
+        self.assertFalse(self.api.upload_resumable.called)
+
+    def test_no_upload_key(self):
+        """Test that upload/instant finishes without an upload key"""
+        del self.api.upload_check.return_value[
+            'resumable_upload']['upload_key']
+        self.api.upload_instant.return_value = {
+            'quickkey': 'i' * 15, 'filename': 'source.bin',
+            'new_device_revision': '3'}
+
+        result = self.upload()
+
+        self.assertEqual(result.quickkey, 'i' * 15)
+        self.assertFalse(self.api.upload_poll.called)
+        self.assertFalse(self.api.upload_resumable.called)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+"""Small file fast path tests"""
+
+from __future__ import unicode_literals
+
+import io
+import unittest
+
+import six
+
+if six.PY3:
+    from unittest.mock import MagicMock
+elif six.PY2:
+    from mock import MagicMock
+
+from mediafire.api import (MediaFireApiError, MediaFireConnectionError)
+from mediafire.uploader import (MediaFireUploader, UploadRejectedError,
+                                UPLOAD_RESULT_HASH_MISMATCH,
+                                UPLOAD_RESULT_SIZE_MISMATCH)
+
+UPLOAD_KEY = 'k' * 11
+
+
+def upload_simple_result(result=0):
+    """Build upload/simple response"""
+    return {'doupload': {'result': str(result), 'key': UPLOAD_KEY}}
+
+
+def poll_result():
+    """Build completed upload/poll_upload response"""
+    return {
+        'doupload': {
+            'result': '0', 'status': '99', 'description': 'done',
+            'fileerror': '', 'quickkey': 'q' * 15, 'hash': 'h',
+            'filename': 'a.txt', 'size': '4', 'created': '',
+            'revision': '2'
+        }
+    }
+
+
+class FastPathTests(unittest.TestCase):
+    """MediaFireUploader fast_path tests"""
+
+    def setUp(self):
+        self.api = MagicMock()
+        self.api.upload_simple.return_value = upload_simple_result()
+        self.api.upload_poll.return_value = poll_result()
+        self.api.upload_check.return_value = {
+            'hash_exists': 'no', 'in_folder': 'no', 'file_exists': 'no'}
+        self.fd = io.BytesIO(b'data')
+
+    def test_skips_check(self):
+        """Test that upload/check is not called"""
+        uploader = MediaFireUploader(self.api, fast_path=True)
+
+        result = uploader.upload(self.fd, 'a.txt', folder_key='f' * 13,
+                                 action_on_duplicate='replace')
+
+        self.assertEqual(result.quickkey, 'q' * 15)
+        self.assertFalse(self.api.upload_check.called)
+
+        _, kwargs = self.api.upload_simple.call_args
+        self.assertEqual(kwargs['file_size'], 4)
+        self.assertIsNotNone(kwargs['file_hash'])
+        self.assertEqual(kwargs['action_on_duplicate'], 'replace')
+
+    def test_requires_action_on_duplicate(self):
+        """Test that regular path is used without explicit policy"""
+        uploader = MediaFireUploader(self.api, fast_path=True)
+
+        uploader.upload(self.fd, 'a.txt', folder_key='f' * 13)
+
+        self.assertTrue(self.api.upload_check.called)
+
+    def test_opt_in(self):
+        """Test that fast path is disabled by default"""
+        uploader = MediaFireUploader(self.api)
+
+        uploader.upload(self.fd, 'a.txt', folder_key='f' * 13,
+                        action_on_duplicate='replace')
+
+        self.assertTrue(self.api.upload_check.called)
+
+    def test_fallback(self):
+        """Test fallback to upload/check when the data did not match"""
+        uploader = MediaFireUploader(self.api, fast_path=True)
+
+        for result in (UPLOAD_RESULT_HASH_MISMATCH,
+                       UPLOAD_RESULT_SIZE_MISMATCH):
+            self.api.reset_mock()
+            self.api.upload_simple.side_effect = [
+                upload_simple_result(result=result), upload_simple_result()]
+
+            self.fd.seek(0)
+            upload_result = uploader.upload(
+                self.fd, 'a.txt', folder_key='f' * 13,
+                action_on_duplicate='replace')
+
+            self.assertEqual(upload_result.quickkey, 'q' * 15)
+            self.assertEqual(self.api.upload_check.call_count, 1)
+            self.assertEqual(self.api.upload_simple.call_count, 2)
+
+    def test_fatal_errors_raised(self):
+        """Test that other failures do not send the file a second time"""
+        uploader = MediaFireUploader(self.api, fast_path=True)
+
+        for error in (MediaFireApiError("Session token is missing", 105),
+                      MediaFireApiError("Storage limit exceeded", 123),
+                      upload_simple_result(result=-700)):
+            self.api.reset_mock()
+            # exceptions are raised, responses returned
+            self.api.upload_simple.side_effect = [error,
+                                                  upload_simple_result()]
+
+            self.fd.seek(0)
+            with self.assertRaises((MediaFireApiError, UploadRejectedError)):
+                uploader.upload(self.fd, 'a.txt', folder_key='f' * 13,
+                                action_on_duplicate='replace')
+
+            self.assertFalse(self.api.upload_check.called)
+            self.assertEqual(self.api.upload_simple.call_count, 1)
+
+    def test_retried(self):
+        """Test that transient failures retry the fast path with backoff"""
+        uploader = MediaFireUploader(self.api, fast_path=True)
+        failed_poll = poll_result()
+        failed_poll['doupload']['status'] = '17'
+        self.api.upload_simple.side_effect = [
+            MediaFireConnectionError("reset"), upload_simple_result(),
+            upload_simple_result()]
+        self.api.upload_poll.side_effect = [failed_poll, poll_result()]
+
+        result = uploader.upload(self.fd, 'a.txt', folder_key='f' * 13,
+                                 action_on_duplicate='replace')
+
+        self.assertEqual(result.quickkey, 'q' * 15)
+        self.assertEqual(self.api.upload_simple.call_count, 3)
+        self.assertEqual(self.api.retry_policy.pause.call_count, 2)
+        self.assertFalse(self.api.upload_check.called)
+
+    def test_other_errors_propagate(self):
+        """Test that unexpected errors are not hidden by the fallback"""
+        uploader = MediaFireUploader(self.api, fast_path=True)
+        self.api.upload_simple.side_effect = ValueError("bad argument")
+
+        with self.assertRaises(ValueError):
+            uploader.upload(self.fd, 'a.txt', folder_key='f' * 13,
+                            action_on_duplicate='replace')
+
+        self.assertFalse(self.api.upload_check.called)
+
+
+if __name__ == "__main__":
+    unittest.main()
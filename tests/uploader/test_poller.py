@@ -0,0 +1,115 @@
+"""Upload polling tests"""
+
+from __future__ import unicode_literals
+
+import itertools
+import threading
+import unittest
+
+from mediafire import uploader
+from mediafire.poller import UploadPoller
+from mediafire.uploader import (RetriableUploadError, upload_poll_intervals)
+
+
+def doupload(status, quickkey=''):
+    """Build upload/poll_upload doupload node"""
+    return {
+        "doupload": {
+            "result": "0",
+            "status": str(status),
+            "description": "status {}".format(status),
+            "fileerror": "",
+            "quickkey": quickkey,
+            "hash": "h",
+            "filename": "f",
+            "size": "1",
+            "created": "",
+            "revision": "1"
+        }
+    }
+
+
+class DummyMediaFireApi(object):
+    """Serves a sequence of poll statuses for each upload key"""
+
+    def __init__(self, statuses):
+        self.statuses = dict((key, iter(value))
+                             for key, value in statuses.items())
+        self.calls = []
+        self.threads = set()
+
+    def upload_poll(self, key):
+        """upload/poll_upload"""
+        self.calls.append(key)
+        self.threads.add(threading.current_thread().name)
+        status = next(self.statuses[key])
+        return doupload(status, quickkey=key * 15 if status == 99 else '')
+
+
+class UploadPollScheduleTests(unittest.TestCase):
+    """Poll interval schedule tests"""
+
+    def test_backoff(self):
+        """Test quick first polls backing off to UPLOAD_POLL_INTERVAL"""
+        intervals = list(itertools.islice(upload_poll_intervals(), 6))
+
+        self.assertEqual(intervals[0], uploader.UPLOAD_POLL_INTERVAL_MIN)
+        self.assertEqual(intervals, sorted(intervals))
+        self.assertEqual(intervals[-1], uploader.UPLOAD_POLL_INTERVAL)
+
+
+class UploadPollerTests(unittest.TestCase):
+    """UploadPoller tests"""
+
+    def setUp(self):
+        self.orig_intervals = (uploader.UPLOAD_POLL_INTERVAL_MIN,
+                               uploader.UPLOAD_POLL_INTERVAL)
+        uploader.UPLOAD_POLL_INTERVAL_MIN = 0.001
+        uploader.UPLOAD_POLL_INTERVAL = 0.004
+
+    def tearDown(self):
+        (uploader.UPLOAD_POLL_INTERVAL_MIN,
+         uploader.UPLOAD_POLL_INTERVAL) = self.orig_intervals
+
+    def test_multiplexed_keys(self):
+        """Test that many keys are polled by one thread"""
+        api = DummyMediaFireApi({
+            'a': [10, 11, 99],
+            'b': [99],
+            'c': [10, 10, 10, 10, 99]
+        })
+
+        with UploadPoller(api) as poller:
+            futures = dict((key, poller.submit(key, 'upload/simple'))
+                           for key in 'abc')
+
+            results = dict((key, future.result(timeout=5))
+                           for key, future in futures.items())
+
+        self.assertEqual(results['a'].quickkey, 'a' * 15)
+        self.assertEqual(results['c'].quickkey, 'c' * 15)
+        self.assertEqual(results['b'].action, 'upload/simple')
+        self.assertEqual(len(api.calls), 9)
+        self.assertEqual(api.threads, set(['UploadPoller']))
+
+    def test_retriable_error(self):
+        """Test that invalid state transition fails the future"""
+        api = DummyMediaFireApi({'a': [17]})
+
+        with UploadPoller(api) as poller:
+            future = poller.submit('a', 'upload/simple')
+
+            with self.assertRaises(RetriableUploadError):
+                future.result(timeout=5)
+
+    def test_closed_poller(self):
+        """Test that closed poller refuses new keys"""
+        poller = UploadPoller(DummyMediaFireApi({}))
+        poller.close()
+
+        with self.assertRaises(RuntimeError):
+            poller.submit('a', 'upload/simple')
+
+
+if __name__ == "__main__":
+    unittest.main()
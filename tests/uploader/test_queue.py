@@ -0,0 +1,296 @@
+"""Persistent upload queue tests"""
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import six
+
+if six.PY3:
+    from unittest.mock import MagicMock
+elif six.PY2:
+    from mock import MagicMock
+
+from mediafire.queue import (UploadQueue, UploadWorkerPool, STATE_DONE,
+                             STATE_FAILED, STATE_PENDING, STATE_LEASED)
+from mediafire.uploader import (UploadResult, RetriableUploadError)
+
+from tests.uploader.test_batch import DummyClient
+
+
+def fake_upload(fd, name, folder_key=None, action_on_duplicate=None):
+    """Stand-in for MediaFireUploader.upload, sizes are strings in API
+    responses
+    """
+    return UploadResult(action='upload/simple', quickkey='q' * 15,
+                        hash_='h', filename=name, size=str(len(fd.read())),
+                        created=None, revision=None)
+
+
+class UploadQueueTests(unittest.TestCase):
+    """UploadQueue tests"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'queue.db')
+        self.queue = UploadQueue(self.path, retry_delay=0, max_attempts=2)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_priority_order(self):
+        """Test that higher priority is leased first, then FIFO"""
+        self.queue.put('/a', 'mf:///')
+        self.queue.put('/b', 'mf:///', priority=5)
+        self.queue.put('/c', 'mf:///')
+
+        sources = [self.queue.lease().source for _ in range(3)]
+
+        self.assertEqual(sources, ['/b', '/a', '/c'])
+        self.assertIsNone(self.queue.lease())
+
+    def test_survives_restart(self):
+        """Test that unacknowledged items are delivered after reopening"""
+        self.queue.put('/a', 'mf:///')
+        item_id = self.queue.put('/b', 'mf:///')
+        self.queue.ack(self.queue.lease(), {'quickkey': 'q'})
+        self.queue.close()
+
+        self.queue = UploadQueue(self.path)
+        self.assertEqual(self.queue.lease().id, item_id)
+
+    def test_expired_lease(self):
+        """Test that item leased by a dead worker is handed out again"""
+        self.queue.lease_timeout = 0
+        self.queue.put('/a', 'mf:///')
+
+        first = self.queue.lease()
+        second = self.queue.lease()
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(second.attempts, 2)
+
+    def test_lost_lease(self):
+        """Test that outcome of an expired lease handed out again is
+        ignored
+        """
+        self.queue.lease_timeout = 0
+        item_id = self.queue.put('/a', 'mf:///')
+        first = self.queue.lease()
+        second = self.queue.lease()
+
+        self.assertFalse(self.queue.ack(first, {'quickkey': 'q'}))
+        self.assertTrue(self.queue.nack(first, "timeout", retry=False))
+        self.assertEqual(self.queue.get(item_id)['state'], STATE_LEASED)
+
+        self.assertTrue(self.queue.ack(second))
+        self.assertEqual(self.queue.get(item_id)['state'], STATE_DONE)
+
+    def test_expired_last_attempt(self):
+        """Test that item whose lease keeps expiring fails eventually"""
+        self.queue.lease_timeout = 0
+        item_id = self.queue.put('/a', 'mf:///')
+
+        self.queue.lease()
+        self.queue.lease()
+
+        self.assertIsNone(self.queue.lease())
+        item = self.queue.get(item_id)
+        self.assertEqual(item['state'], STATE_FAILED)
+        self.assertEqual(item['attempts'], 2)
+        self.assertEqual(item['last_error'], 'Lease expired')
+
+    def test_migration(self):
+        """Test that database created without lease_id is upgraded"""
+        self.queue.close()
+        os.remove(self.path)
+        database = sqlite3.connect(self.path)
+        database.executescript(
+            'CREATE TABLE items (id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' source TEXT NOT NULL, dest_uri TEXT NOT NULL,'
+            ' priority INTEGER NOT NULL DEFAULT 0, state TEXT NOT NULL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0, not_before REAL NOT NULL,'
+            ' lease_expires REAL, last_error TEXT, result TEXT,'
+            ' created_at REAL NOT NULL, updated_at REAL NOT NULL);')
+        database.close()
+
+        self.queue = UploadQueue(self.path)
+        self.queue.put('/a', 'mf:///')
+        self.assertTrue(self.queue.ack(self.queue.lease()))
+
+    def test_retry_then_fail(self):
+        """Test that nack retries until max_attempts"""
+        item_id = self.queue.put('/a', 'mf:///')
+
+        self.assertTrue(self.queue.nack(self.queue.lease(), "timeout"))
+        self.assertFalse(self.queue.nack(self.queue.lease(), "timeout"))
+
+        item = self.queue.get(item_id)
+        self.assertEqual(item['state'], STATE_FAILED)
+        self.assertEqual(item['attempts'], 2)
+        self.assertEqual(item['last_error'], 'timeout')
+
+        self.assertEqual(self.queue.requeue_failed(), 1)
+        self.assertEqual(self.queue.lease().id, item_id)
+
+    def test_backoff(self):
+        """Test that retried item is not due before the delay"""
+        self.queue.retry_delay = 60
+        self.queue.put('/a', 'mf:///')
+        self.queue.nack(self.queue.lease(), "timeout")
+
+        self.assertIsNone(self.queue.lease())
+        self.assertGreater(self.queue.next_due(), 50)
+        self.assertEqual(self.queue.retry_delay_for(3), 240)
+
+    def test_stats(self):
+        """Test item counts by state"""
+        for source in ('/a', '/b', '/c'):
+            self.queue.put(source, 'mf:///')
+        self.queue.ack(self.queue.lease())
+        self.queue.lease()
+
+        self.assertEqual(self.queue.stats(), {
+            STATE_PENDING: 1, STATE_LEASED: 1,
+            STATE_DONE: 1, STATE_FAILED: 0
+        })
+        self.assertEqual(self.queue.outstanding(), 2)
+        self.assertEqual(self.queue.purge(), 1)
+
+
+class UploadWorkerPoolTests(unittest.TestCase):
+    """UploadWorkerPool tests"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.queue = UploadQueue(retry_delay=0.01)
+        self.client = DummyClient()
+        self.pool = UploadWorkerPool(self.client, self.queue, workers=3,
+                                     poll_interval=0.01)
+        self.pool._uploader.upload = MagicMock(side_effect=fake_upload)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.tmpdir)
+
+    def make_file(self, name, data=b'data'):
+        """Create source file, return path"""
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as source:
+            source.write(data)
+        return path
+
+    def test_run(self):
+        """Test that all items are uploaded and acknowledged"""
+        ids = [self.queue.put(self.make_file('f{}'.format(i)), 'mf:///a/')
+               for i in range(10)]
+
+        self.pool.run()
+
+        for item_id in ids:
+            item = self.queue.get(item_id)
+            self.assertEqual(item['state'], STATE_DONE)
+            self.assertEqual(item['result']['quickkey'], 'q' * 15)
+
+        metrics = self.pool.metrics.snapshot()
+        self.assertEqual(metrics['uploaded'], 10)
+        self.assertEqual(metrics['bytes_uploaded'], 40)
+        self.assertGreater(metrics['items_per_second'], 0)
+
+        _, kwargs = self.pool._uploader.upload.call_args
+        self.assertEqual(kwargs['folder_key'], 'a' * 13)
+        self.assertEqual(self.client.lookups, ['mf:///a'])
+
+    def test_action_token(self):
+        """Test that workers upload with an action token and restore the
+        previous one
+        """
+        api = self.client.api
+        api.set_action_token(type_='upload', action_token='previous')
+        tokens = []
+
+        def upload(fd, name, **kwargs):
+            """Record action token in use"""
+            tokens.append(api._action_tokens['upload'])
+            return fake_upload(fd, name, **kwargs)
+
+        self.pool._uploader.upload.side_effect = upload
+        for i in range(5):
+            self.queue.put(self.make_file('f{}'.format(i)), 'mf:///a/')
+
+        self.pool.run()
+
+        self.assertEqual(tokens, ['token'] * 5)
+        self.assertEqual(api._action_tokens, {'upload': 'previous'})
+
+    def test_folder_created_later(self):
+        """Test that a folder missing for one item is looked up again"""
+        first = self.queue.put(self.make_file('f'), 'mf:///missing/f')
+        self.pool.run()
+        self.assertEqual(self.queue.get(first)['state'], STATE_FAILED)
+
+        self.client.lookups = []
+        self.queue.put(self.make_file('g'), 'mf:///missing/g')
+        self.pool.run()
+
+        self.assertEqual(self.client.lookups, ['mf:///missing'])
+
+    def test_worker_survives_errors(self):
+        """Test that a failure after the upload does not stop the worker"""
+        self.pool.workers = 1
+        self.pool.metrics.record = MagicMock(side_effect=RuntimeError)
+        ids = [self.queue.put(self.make_file('f{}'.format(i)), 'mf:///a/')
+               for i in range(3)]
+
+        self.pool.run()
+
+        for item_id in ids:
+            self.assertEqual(self.queue.get(item_id)['state'], STATE_DONE)
+
+    def test_retry(self):
+        """Test that transient failure is retried"""
+        item_id = self.queue.put(self.make_file('f'), 'mf:///a/f')
+        self.pool._uploader.upload.side_effect = [
+            RetriableUploadError("busy"), fake_upload(six.BytesIO(b''), 'f')]
+
+        self.pool.run()
+
+        self.assertEqual(self.queue.get(item_id)['state'], STATE_DONE)
+        self.assertEqual(self.pool.metrics.snapshot()['retried'], 1)
+
+    def test_permanent_failure(self):
+        """Test that missing source and destination fail immediately"""
+        missing_source = self.queue.put(
+            os.path.join(self.tmpdir, 'nope'), 'mf:///a/')
+        missing_folder = self.queue.put(self.make_file('f'),
+                                        'mf:///missing/f')
+
+        self.pool.run()
+
+        for item_id in (missing_source, missing_folder):
+            item = self.queue.get(item_id)
+            self.assertEqual(item['state'], STATE_FAILED)
+            self.assertEqual(item['attempts'], 1)
+
+    def test_stop(self):
+        """Test that started pool picks up items until stopped"""
+        self.pool.start()
+        item_id = self.queue.put(self.make_file('f'), 'mf:///a/')
+
+        deadline = time.time() + 5
+        while self.queue.get(item_id)['state'] != STATE_DONE and \
+                time.time() < deadline:
+            time.sleep(0.01)
+
+        self.pool.stop()
+        self.assertEqual(self.queue.get(item_id)['state'], STATE_DONE)
+
+
+if __name__ == "__main__":
+    unittest.main()
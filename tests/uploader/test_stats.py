@@ -0,0 +1,135 @@
+"""Upload stats tests"""
+
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import unittest
+
+from mediafire import uploader
+from mediafire.batch import BatchUploader
+from mediafire.uploader import (MediaFireUploader, UploadStats,
+                                HASH_CHUNK_SIZE_BYTES)
+
+from tests.test_standin import StandInTestCase
+
+
+class UploadStatsTests(unittest.TestCase):
+    """UploadStats bookkeeping tests"""
+
+    def test_unit_retries(self):
+        """Test that units sent twice are counted as retries"""
+        stats = UploadStats()
+        stats.record_unit(0, 10, 0.5)
+        stats.record_unit(1, 10, 0.5)
+        stats.record_unit(1, 10, 0.25)
+
+        self.assertEqual(stats.unit_retries, 1)
+        self.assertEqual([unit['throughput']
+                          for unit in stats.to_dict()['units']],
+                         [20, 20, 40])
+
+    def test_throughput(self):
+        """Test that throughput is only known after a transfer"""
+        stats = UploadStats()
+        self.assertIsNone(stats.throughput)
+
+        stats.transfer_time = 2.0
+        stats.bytes_transferred = 100
+        self.assertEqual(stats.throughput, 50)
+
+        # stats can be stored along with the result
+        json.dumps(stats.to_dict())
+
+
+class UploaderStatsTests(StandInTestCase):
+    """Stats of uploads to StandInServer"""
+
+    server_options = {'unit_size': HASH_CHUNK_SIZE_BYTES,
+                      'processing_polls': 1}
+
+    def setUp(self):
+        super(UploaderStatsTests, self).setUp()
+        self.orig_limit = uploader.UPLOAD_SIMPLE_LIMIT_BYTES
+        self.orig_poll = uploader.UPLOAD_POLL_INTERVAL_MIN
+        uploader.UPLOAD_POLL_INTERVAL_MIN = 0.01
+
+        self.client.create_folder('mf:///up')
+        self.folder_key = self.client.get_resource_by_uri(
+            'mf:///up')['folderkey']
+        self.uploader = MediaFireUploader(self.api, collect_stats=True)
+
+    def tearDown(self):
+        uploader.UPLOAD_SIMPLE_LIMIT_BYTES = self.orig_limit
+        uploader.UPLOAD_POLL_INTERVAL_MIN = self.orig_poll
+        super(UploaderStatsTests, self).tearDown()
+
+    def test_disabled(self):
+        """Test that stats are not collected by default"""
+        result = MediaFireUploader(self.api).upload(
+            io.BytesIO(b'hello'), 'hello.txt', folder_key=self.folder_key)
+
+        self.assertIsNone(result.stats)
+
+    def test_simple(self):
+        """Test stats of upload/simple"""
+        result = self.uploader.upload(io.BytesIO(b'hello'), 'hello.txt',
+                                      folder_key=self.folder_key)
+        stats = result.stats
+
+        self.assertEqual(result.action, 'upload/simple')
+        self.assertEqual(stats.check_count, 1)
+        self.assertEqual(stats.bytes_transferred, 5)
+        self.assertEqual(stats.units, [])
+        self.assertEqual(stats.poll_count, 2)
+        self.assertGreater(stats.poll_time, 0)
+        self.assertGreaterEqual(stats.total_time,
+                                stats.hash_time + stats.check_time +
+                                stats.transfer_time + stats.poll_time)
+
+    def test_instant(self):
+        """Test that instant upload transfers nothing"""
+        self.uploader.upload(io.BytesIO(b'hello'), 'hello.txt',
+                             folder_key=self.folder_key)
+        stats = self.uploader.upload(io.BytesIO(b'hello'), 'copy.txt',
+                                     folder_key=self.folder_key).stats
+
+        self.assertEqual(stats.bytes_transferred, 0)
+        self.assertEqual(stats.poll_count, 0)
+        self.assertIsNotNone(stats.total_time)
+
+    def test_resumable(self):
+        """Test per-unit stats of a resumable upload"""
+        uploader.UPLOAD_SIMPLE_LIMIT_BYTES = HASH_CHUNK_SIZE_BYTES
+        size = HASH_CHUNK_SIZE_BYTES * 3 + 10
+
+        result = self.uploader.upload(io.BytesIO(os.urandom(size)), 'big',
+                                      folder_key=self.folder_key)
+        stats = result.stats
+
+        self.assertEqual(result.action, 'upload/resumable')
+        self.assertEqual(sorted(unit.unit_id for unit in stats.units),
+                         [0, 1, 2, 3])
+        self.assertEqual(stats.bytes_transferred, size)
+        self.assertEqual(stats.unit_retries, 0)
+        # initial check and the one confirming all units are there
+        self.assertEqual(stats.check_count, 2)
+        self.assertGreater(stats.throughput, 0)
+
+    def test_batch(self):
+        """Test that stats survive the UploadPoller"""
+        batch = BatchUploader(self.client, collect_stats=True)
+        results = list(batch.upload([
+            (io.BytesIO(b'one'), 'mf:///up/one.txt'),
+            (io.BytesIO(b'two'), 'mf:///up/two.txt')
+        ]))
+
+        for item in results:
+            self.assertIsNone(item.error)
+            self.assertEqual(item.result.stats.poll_count, 2)
+            self.assertEqual(item.result.stats.bytes_transferred, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
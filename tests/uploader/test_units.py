@@ -0,0 +1,107 @@
+"""Concurrent resumable unit upload tests"""
+
+from __future__ import unicode_literals
+
+import io
+import tempfile
+import threading
+import unittest
+
+import six
+
+if six.PY3:
+    from unittest.mock import MagicMock
+elif six.PY2:
+    from mock import MagicMock
+
+from mediafire.concurrency import AIMDController
+from mediafire.uploader import (MediaFireUploader, RetriableUploadError,
+                                _UploadInfo, compute_hash_info,
+                                HASH_CHUNK_SIZE_BYTES)
+
+# compute_hash_info needs units made of whole hash chunks
+UNIT_SIZE = HASH_CHUNK_SIZE_BYTES
+NUMBER_OF_UNITS = 6
+
+
+class ConcurrentUnitsTests(unittest.TestCase):
+    """MediaFireUploader._upload_resumable_all tests"""
+
+    def setUp(self):
+        self.fd = tempfile.TemporaryFile()
+        self.fd.write(b''.join(six.int2byte(65 + i) * UNIT_SIZE
+                               for i in range(NUMBER_OF_UNITS)))
+        self.fd.seek(0)
+
+        self.sent = {}
+        self.threads = set()
+        self.lock = threading.Lock()
+
+        self.uploader = MediaFireUploader(
+            MagicMock(), concurrency=AIMDController(initial=3, max_limit=3))
+        self.uploader._upload_resumable_unit = MagicMock(
+            side_effect=self.fake_unit_upload)
+
+    def tearDown(self):
+        self.fd.close()
+
+    def fake_unit_upload(self, unit_info):
+        """Record unit content"""
+        with self.lock:
+            self.sent[unit_info.uid] = unit_info.fd.read()
+            self.threads.add(threading.current_thread().name)
+        return {'doupload': {'key': 'k' * 11}}
+
+    def upload_info(self, fd):
+        """Build _UploadInfo for fd"""
+        hash_info = compute_hash_info(fd, UNIT_SIZE)
+        return _UploadInfo(fd=fd, name='f', folder_key='a' * 13,
+                           hash_info=hash_info, size=hash_info.size)
+
+    def test_all_units_sent(self):
+        """Test that missing units are sent with their own content"""
+        # units 0 and 3 are already uploaded
+        bitmap = {'count': 1, 'words': [str(0b1001)]}
+
+        upload_key = self.uploader._upload_resumable_all(
+            self.upload_info(self.fd), bitmap, NUMBER_OF_UNITS, UNIT_SIZE)
+
+        self.assertEqual(upload_key, 'k' * 11)
+        self.assertEqual(sorted(self.sent), [1, 2, 4, 5])
+        for unit_id, data in self.sent.items():
+            self.assertEqual(data, six.int2byte(65 + unit_id) * UNIT_SIZE)
+
+        self.assertGreater(len(self.threads), 1)
+
+    def test_error_propagates(self):
+        """Test that unit failure is raised for the retry loop"""
+        def fail_unit_four(unit_info):
+            """Fail a single unit"""
+            if unit_info.uid == 4:
+                raise RetriableUploadError("unit 4")
+            return self.fake_unit_upload(unit_info)
+
+        self.uploader._upload_resumable_unit.side_effect = fail_unit_four
+
+        with self.assertRaises(RetriableUploadError):
+            self.uploader._upload_resumable_all(
+                self.upload_info(self.fd), {'count': 0, 'words': []},
+                NUMBER_OF_UNITS, UNIT_SIZE)
+
+        self.assertEqual(sorted(self.sent), [0, 1, 2, 3, 5])
+
+    def test_sequential_without_fileno(self):
+        """Test that in-memory sources are uploaded from one thread"""
+        fd = io.BytesIO(self.fd.read())
+
+        self.uploader._upload_resumable_all(
+            self.upload_info(fd), {'count': 0, 'words': []},
+            NUMBER_OF_UNITS, UNIT_SIZE)
+
+        self.assertEqual(len(self.sent), NUMBER_OF_UNITS)
+        self.assertEqual(self.threads,
+                         set([threading.current_thread().name]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -18,7 +18,8 @@ elif six.PY2:
 
 from mediafire.api import (MediaFireApi, API_BASE, API_VER)
 from mediafire.uploader import (MediaFireUploader, UPLOAD_SIMPLE_LIMIT_BYTES,
-                                compute_hash_info)
+                                compute_hash_info,
+                                decode_resumable_upload_bitmap)
 
 
 class MediaFireUploaderTest(unittest.TestCase):
@@ -685,6 +686,21 @@ class MediaFireUploadHashingTests(unittest.TestCase):
         self.assertEqual(result.units[4], ZERO_BYTE_HASH)
 
 
+class MediaFireUploadBitmapTests(unittest.TestCase):
+    """Tests for decode_resumable_upload_bitmap"""
+
+    def test_multiple_words(self):
+        """Test that each word covers the next 16 units"""
+        # units 0, 15 in the first word, 16, 17 and 20 in the second
+        bitmap_node = {'count': '2', 'words': ['32769', '19']}
+
+        result = decode_resumable_upload_bitmap(bitmap_node, 24)
+
+        uploaded = [unit_id for unit_id, ready in result.items() if ready]
+        self.assertEqual(sorted(uploaded), [0, 15, 16, 17, 20])
+        self.assertEqual(len(result), 24)
+
+
 if __name__ == "__main__":
     import logging
     logging.basicConfig()